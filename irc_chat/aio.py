@@ -0,0 +1,131 @@
+import asyncio
+import threading
+import typing
+
+import framing
+import outbound
+
+
+class TransportSocket:
+    """
+    Socket-like facade over an asyncio transport, so the server handlers can treat
+    select-mode sockets and asyncio connections the same way.
+    """
+
+    def __init__(self, transport: asyncio.Transport, loop: asyncio.AbstractEventLoop):
+        self.transport = transport
+        self.loop = loop
+        self.__loop_thread = threading.get_ident()
+        self.__peername = transport.get_extra_info("peername")
+        self.paused = False  # set while the transport buffer is above its high watermark
+
+    def sendall(self, data: bytes):
+        if self.transport.is_closing():
+            return
+        if threading.get_ident() == self.__loop_thread:
+            self.transport.write(data)
+        else:
+            self.loop.call_soon_threadsafe(self.transport.write, data)
+
+    def getpeername(self):
+        return self.__peername
+
+    def close(self):
+        if threading.get_ident() == self.__loop_thread:
+            self.transport.close()
+        else:
+            self.loop.call_soon_threadsafe(self.transport.close)
+
+
+class TransportQueue:
+    """
+    Outbound queue of an asyncio connection, with the same interface as outbound.OutboundQueue. The transport
+    does the buffering and flushing itself, and reports crossing the watermarks through pause_writing and
+    resume_writing.
+    """
+
+    def __init__(self, connection: TransportSocket, high_watermark: int = outbound.HIGH_WATERMARK,
+                 low_watermark: int = outbound.LOW_WATERMARK, policy: str = outbound.DROP):
+        if policy not in outbound.POLICIES:
+            raise ValueError(f"Unknown slow consumer policy {policy}")
+        self.high_watermark = high_watermark
+        self.low_watermark = low_watermark
+        self.policy = policy
+        self.dropped = 0
+        self.__connection = connection
+        connection.transport.set_write_buffer_limits(high_watermark, low_watermark)
+
+    @property
+    def size(self) -> int:
+        return self.__connection.transport.get_write_buffer_size()
+
+    @property
+    def throttled(self) -> bool:
+        return self.__connection.paused
+
+    def __len__(self):
+        return self.size
+
+    def __bool__(self):
+        return self.size > 0
+
+    def push(self, data: bytes) -> bool:
+        if self.throttled:
+            if self.policy == outbound.DISCONNECT:
+                raise outbound.SlowConsumerError(f"Outbound queue exceeded {self.high_watermark} bytes")
+            self.dropped += 1
+            return False
+        self.__connection.sendall(data)
+        return True
+
+    def flush(self, sock: TransportSocket) -> bool:
+        return True
+
+
+class ChatProtocol(asyncio.BufferedProtocol):
+    """
+    Protocol instance for a single chat connection, forwarding transport events to the server callbacks.
+    Incoming data is received directly into the frame reader returned by on_connect.
+    """
+
+    def __init__(self, on_connect: typing.Callable[[TransportSocket], framing.FrameReader],
+                 on_data: typing.Callable[[TransportSocket], None],
+                 on_lost: typing.Callable[[TransportSocket], None]):
+        self.__on_connect = on_connect
+        self.__on_data = on_data
+        self.__on_lost = on_lost
+        self.connection = None
+        self.reader = None
+
+    def connection_made(self, transport: asyncio.Transport):
+        self.connection = TransportSocket(transport, asyncio.get_running_loop())
+        self.reader = self.__on_connect(self.connection)
+
+    def get_buffer(self, sizehint: int) -> memoryview:
+        return self.reader.get_buffer(sizehint)
+
+    def buffer_updated(self, nbytes: int):
+        self.reader.buffer_updated(nbytes)
+        self.__on_data(self.connection)
+
+    def pause_writing(self):
+        self.connection.paused = True
+
+    def resume_writing(self):
+        self.connection.paused = False
+
+    def connection_lost(self, exc: typing.Optional[Exception]):
+        self.__on_lost(self.connection)
+
+
+def install_uvloop() -> bool:
+    """
+    Installs the uvloop event loop policy if uvloop is available.
+    :return: True if uvloop is used, False if the default asyncio loop is used.
+    """
+    try:
+        import uvloop
+    except ImportError:
+        return False
+    asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+    return True
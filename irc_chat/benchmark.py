@@ -0,0 +1,1196 @@
+import argparse
+import asyncio
+import collections
+import concurrent.futures
+import contextlib
+import hashlib
+import heapq
+import os
+import random
+import resource
+import select
+import selectors
+import signal
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import timeit
+
+import command
+import congestion
+import file_receiver
+import file_sender
+import framing
+import outbound
+import ratelimit
+import reply
+import udpio
+import utils
+
+SERVER_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "server.py")
+
+
+def percentile(samples: list[float], percent: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * percent / 100))]
+
+
+def raise_open_files_limit():
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft != hard:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+
+
+@contextlib.contextmanager
+def server_process(port: int, *server_args: str):
+    """
+    Runs server.py in a child process for the duration of the block.
+    """
+    process = subprocess.Popen([sys.executable, SERVER_SCRIPT, "-p", str(port), *server_args],
+                               cwd=os.path.dirname(SERVER_SCRIPT), stdout=subprocess.DEVNULL)
+    try:
+        deadline = time.time() + 10
+        while True:
+            try:
+                socket.create_connection(("127.0.0.1", port)).close()
+                break
+            except ConnectionRefusedError:
+                if time.time() > deadline or process.poll() is not None:
+                    raise
+                time.sleep(0.05)
+        yield process
+    finally:
+        process.terminate()
+        process.wait()
+
+
+class BenchClient:
+    """
+    Minimal asyncio chat client used to drive the server.
+    """
+
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.reader = reader
+        self.writer = writer
+        self.frames = framing.FrameReader()
+        self.replies = asyncio.Queue()
+        self.received = 0
+        self.done = None
+        self.expected = 0
+
+    @classmethod
+    async def connect(cls, port: int, nickname: str):
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        client = cls(reader, writer)
+        client.send(command.commands["CONNECT"].format(nickname))
+        return client
+
+    def send(self, message: str):
+        self.writer.write(framing.encode(message.encode()))
+
+    async def read_forever(self, reply_prefix: str):
+        """
+        Reads messages until the connection closes, queueing those starting with reply_prefix.
+        """
+        while True:
+            data = await self.reader.read(65536)
+            if not data:
+                return
+            self.frames.feed(data)
+            for frame in self.frames:
+                message = str(frame, "utf-8")
+                if message.startswith(reply_prefix):
+                    self.replies.put_nowait(time.perf_counter())
+                    self.received += 1
+                    if self.done is not None and self.received >= self.expected:
+                        self.done.set_result(None)
+                        self.done = None
+
+
+async def measure_reply_latency(port: int, clients: int, rounds: int) -> list[float]:
+    nick_prefix = "bench"
+    connected = []
+    for i in range(clients):
+        connected.append(await BenchClient.connect(port, f"{nick_prefix}{i}"))
+    readers = [asyncio.create_task(c.read_forever(f"<RPL> {nick_prefix}")) for c in connected]
+    await asyncio.sleep(1 + clients / 1000)  # let the join broadcasts settle
+
+    samples = []
+
+    async def round_trip(client: BenchClient):
+        start = time.perf_counter()
+        client.send(command.commands["LIST"].format())
+        end = await client.replies.get()
+        samples.append(end - start)
+
+    for _ in range(rounds):
+        await asyncio.gather(*(round_trip(c) for c in connected))
+    for c in connected:
+        c.writer.close()
+    for r in readers:
+        r.cancel()
+    return samples
+
+
+def bench_latency(options):
+    """
+    Reply latency of LIST with many simulated clients sending it at the same time.
+    """
+    raise_open_files_limit()
+    server_args = ["--asyncio"] if options.use_asyncio else []
+    with server_process(options.port, *server_args):
+        start = time.perf_counter()
+        samples = asyncio.run(measure_reply_latency(options.port, options.clients, options.rounds))
+        elapsed = time.perf_counter() - start
+    print(f"{len(samples)} replies to {options.clients} clients in {elapsed:.2f}s")
+    print(f"p50={percentile(samples, 50) * 1000:.2f}ms p99={percentile(samples, 99) * 1000:.2f}ms "
+          f"max={max(samples) * 1000:.2f}ms mean={statistics.mean(samples) * 1000:.2f}ms")
+
+
+async def measure_broadcasts(port: int, clients: int, rounds: int) -> float:
+    """
+    Every client broadcasts rounds chat lines, waits until every client received every line.
+    :return: elapsed time in seconds
+    """
+    connected = []
+    for i in range(clients):
+        connected.append(await BenchClient.connect(port, f"load{i}"))
+    readers = [asyncio.create_task(c.read_forever("load")) for c in connected]
+    await asyncio.sleep(1 + clients / 1000)  # let the join broadcasts settle
+
+    loop = asyncio.get_running_loop()
+    for c in connected:
+        c.received = 0
+        c.expected = (clients - 1) * rounds
+        c.done = loop.create_future()
+    waiters = [c.done for c in connected]
+    start = time.perf_counter()
+    for r in range(rounds):
+        for c in connected:
+            c.send(f"message {r}")
+    await asyncio.gather(*waiters)
+    elapsed = time.perf_counter() - start
+    for c in connected:
+        c.writer.close()
+    for r in readers:
+        r.cancel()
+    return elapsed
+
+
+def bench_workers(options):
+    """
+    Broadcast throughput of the server with different numbers of worker processes.
+    """
+    raise_open_files_limit()
+    server_args = ["--asyncio"] if options.use_asyncio else []
+    for workers in options.workers:
+        with server_process(options.port, "-w", str(workers), *server_args):
+            elapsed = asyncio.run(measure_broadcasts(options.port, options.clients, options.rounds))
+        sent = options.clients * options.rounds
+        delivered = sent * (options.clients - 1)
+        print(f"{workers} workers: {sent / elapsed:8.0f} messages/s {delivered / elapsed:10.0f} deliveries/s "
+              f"({elapsed:.2f}s)")
+
+
+async def measure_private_latency(sender: BenchClient, receiver: BenchClient, receiver_nick: str,
+                                  rounds: int) -> list[float]:
+    """
+    Sends private messages one at a time and measures the time until the receiver gets each of them.
+    """
+    sender.send(command.commands["SET_MSG"].format(receiver_nick))
+    await asyncio.sleep(0.2)
+    samples = []
+    for i in range(rounds):
+        start = time.perf_counter()
+        sender.send(f"ping {i}")
+        samples.append(await receiver.replies.get() - start)
+    return samples
+
+
+async def measure_federation(ports: list[int], rounds: int) -> dict[str, list[float]]:
+    local_receiver = await BenchClient.connect(ports[0], "local")
+    sender = await BenchClient.connect(ports[0], "sender")
+    receivers = {"same node": ("local", local_receiver)}
+    for i, port in enumerate(ports[1:], 1):
+        receivers[f"node 0 -> {i}"] = (f"node{i}", await BenchClient.connect(port, f"node{i}"))
+    clients = [sender] + [client for _, client in receivers.values()]
+    readers = [asyncio.create_task(c.read_forever("sender@PM>")) for c in clients]
+    await asyncio.sleep(1)  # let the nicknames reach every node
+
+    results = {}
+    for name, (nick, client) in receivers.items():
+        results[name] = await measure_private_latency(sender, client, nick, rounds)
+    for c in clients:
+        c.writer.close()
+    for r in readers:
+        r.cancel()
+    return results
+
+
+def bench_federation(options):
+    """
+    Private message latency between users of the same node and of different nodes, with 3 linked nodes.
+    """
+    ports = [options.port + i for i in range(3)]
+    link_ports = [options.port + 10 + i for i in range(3)]
+    server_args = ["--asyncio"] if options.use_asyncio else []
+    with contextlib.ExitStack() as stack:
+        for i, (port, link_port) in enumerate(zip(ports, link_ports)):
+            peers = [arg for other in link_ports[:i] for arg in ("--peer", f"127.0.0.1:{other}")]
+            stack.enter_context(server_process(port, "--link-port", str(link_port), "--node-name", f"node{i}",
+                                               *peers, *server_args))
+        results = asyncio.run(measure_federation(ports, options.rounds))
+    for name, samples in results.items():
+        print(f"{name:<11} p50={percentile(samples, 50) * 1e6:7.0f}us p99={percentile(samples, 99) * 1e6:7.0f}us "
+              f"mean={statistics.mean(samples) * 1e6:7.0f}us")
+
+
+@contextlib.contextmanager
+def connected_sockets(count: int):
+    """
+    Connects count TCP sockets to this process from a child process that reads and discards everything.
+    :return: the non-blocking sockets of this process
+    """
+    listener = socket.create_server(("127.0.0.1", 0), backlog=socket.SOMAXCONN)
+    address = listener.getsockname()
+    pid = os.fork()
+    if pid == 0:
+        try:
+            listener.close()
+            selector = selectors.DefaultSelector()
+            for _ in range(count):
+                selector.register(socket.create_connection(address), selectors.EVENT_READ)
+            open_sockets = count
+            while open_sockets:
+                for key, _ in selector.select():
+                    if not key.fileobj.recv(1 << 16):
+                        selector.unregister(key.fileobj)
+                        open_sockets -= 1
+        finally:
+            os._exit(0)
+    socks = []
+    try:
+        for _ in range(count):
+            sock, _ = listener.accept()
+            sock.setblocking(False)
+            socks.append(sock)
+        yield socks
+    finally:
+        for sock in socks:
+            sock.close()
+        listener.close()
+        os.waitpid(pid, 0)
+
+
+def fanout_copy_per_recipient(queues: dict, prefix: bytes, message: bytes) -> int:
+    """
+    The fan-out before encode-once: the message is built and framed for every recipient, then sent right away.
+    """
+    copied = 0
+    for sock, queue in queues.items():
+        data = framing.encode(prefix + message)
+        copied += len(prefix) + len(message) + len(data)
+        queue.push(data)
+        queue.flush(sock)
+    return copied
+
+
+def fanout_shared_frame(queues: dict, prefix: bytes, message: bytes) -> int:
+    """
+    The frame is built once and shared by every queue, each recipient still gets one send per message.
+    """
+    data = framing.encode(prefix + message)
+    for sock, queue in queues.items():
+        queue.push(data)
+        queue.flush(sock)
+    return len(prefix) + len(message) + len(data)
+
+
+def fanout_shared_frame_gather(queues: dict, prefix: bytes, message: bytes) -> int:
+    """
+    The frame is built once and only queued, the queues are flushed with sendmsg after the burst.
+    """
+    data = framing.encode(prefix + message)
+    for queue in queues.values():
+        queue.push(data)
+    return len(prefix) + len(message) + len(data)
+
+
+def bench_fanout(options):
+    """
+    Broadcasts per second and bytes copied per broadcast, for several fan-out strategies and recipient counts.
+    """
+    raise_open_files_limit()
+    strategies = {
+        "copy per recipient": fanout_copy_per_recipient,
+        "shared frame": fanout_shared_frame,
+        "shared frame + sendmsg": fanout_shared_frame_gather,
+    }
+    prefix = b"alice> "
+    message = b"x" * options.size
+    for recipients in options.recipients:
+        with connected_sockets(recipients) as socks:
+            for name, fanout in strategies.items():
+                queues = {sock: outbound.OutboundQueue(1 << 30, 1 << 29) for sock in socks}
+                broadcasts = copied = 0
+                start = time.perf_counter()
+                while time.perf_counter() - start < options.duration:
+                    for _ in range(options.burst):  # messages handled in one iteration of the server loop
+                        copied += fanout(queues, prefix, message)
+                    for sock, queue in queues.items():
+                        queue.flush(sock)
+                    broadcasts += options.burst
+                while any(not queue.flush(sock) for sock, queue in queues.items()):
+                    time.sleep(0.001)
+                elapsed = time.perf_counter() - start
+                print(f"{recipients:>6} recipients {name:<22} {broadcasts / elapsed:10.0f} broadcasts/s "
+                      f"{copied / broadcasts:10.0f} bytes copied/broadcast")
+
+
+@contextlib.contextmanager
+def receiver_process(ports: list[int], out_paths: list[str],
+                     buffer_capacity: int = file_receiver.DEFAULT_BUFFER_CAPACITY, io_mode: str = None,
+                     processes: bool = False):
+    """
+    Receives one file on each port in a child process, for the duration of the block.
+    :param processes: whether the child receives each file in a process of its own
+    """
+    pid = os.fork()
+    if pid == 0:
+        try:
+            sys.stdout = open(os.devnull, "w")
+            count = len(ports)
+            if processes:
+                with concurrent.futures.ProcessPoolExecutor(count) as pool:
+                    list(pool.map(file_receiver.get_file, ports, out_paths, [buffer_capacity] * count,
+                                  [io_mode] * count))
+            else:
+                threads = [threading.Thread(target=file_receiver.get_file, args=(port, path, buffer_capacity, io_mode))
+                           for port, path in zip(ports, out_paths)]
+                for thread in threads:
+                    thread.start()
+                for thread in threads:
+                    thread.join()
+        finally:
+            os._exit(0)
+    try:
+        time.sleep(0.5)  # let the receivers bind their ports
+        yield
+    finally:
+        os.waitpid(pid, 0)
+
+
+@contextlib.contextmanager
+def multiplexed_receiver(server_address: tuple[str, int], connection_ids: list[int], out_paths: list[str],
+                         buffer_capacity: int = file_receiver.DEFAULT_BUFFER_CAPACITY, io_mode: str = None):
+    """
+    Receives one file for each transfer waiting on the endpoint at server_address in a child process, from a single
+    socket, for the duration of the block.
+    """
+    pid = os.fork()
+    if pid == 0:
+        try:
+            sys.stdout = open(os.devnull, "w")
+            server = file_receiver.ServerSocket(0, utils.MAX_MSS, buffer_capacity, io_mode)
+            for connection_id, path in zip(connection_ids, out_paths):
+                server.connect(server_address, connection_id, path)
+            server.listen()
+        finally:
+            os._exit(0)
+    try:
+        yield
+    finally:
+        os.waitpid(pid, 0)
+
+
+@contextlib.contextmanager
+def lossy_link(port: int, target: tuple[str, int], loss: float, delay: float, seed: int = 0, rate: float = None,
+               queue: int = None):
+    """
+    Relays UDP datagrams between the port and the target in a child process, like a link shaped by netem. Each
+    datagram is dropped with probability loss, and delayed by delay seconds otherwise. The datagrams to the target are
+    sent from a socket of their own, whatever comes back to it is relayed to the last address that sent to the port.
+    :param rate: bytes per second each direction of the link carries, unlimited if None
+    :param queue: bytes queued in each direction before the link, the datagrams that do not fit are dropped, like a
+    router with a drop-tail queue. Unlimited if None
+    """
+    pid = os.fork()
+    if pid == 0:
+        try:
+            rng = random.Random(seed)
+            near = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            near.bind(("127.0.0.1", port))
+            far = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            far.bind(("127.0.0.1", 0))
+            for sock in (near, far):
+                sock.setblocking(False)
+            source = None
+            in_flight = []  # (delivery time, order, datagram, socket, destination)
+            order = 0
+            link_free = {near: 0.0, far: 0.0}  # when each direction is done sending the datagrams queued for it
+            while True:
+                timeout = max(0.0, in_flight[0][0] - time.monotonic()) if in_flight else None
+                for sock in select.select([near, far], [], [], timeout)[0]:
+                    while True:
+                        try:
+                            datagram, address = sock.recvfrom(1 << 16)
+                        except BlockingIOError:
+                            break
+                        except OSError:  # the ICMP error of a datagram relayed to a closed port
+                            continue
+                        if sock is near:
+                            source = address
+                            out, destination = far, target
+                        else:
+                            out, destination = near, source
+                        if destination is None or rng.random() < loss:
+                            continue
+                        sent = time.monotonic()
+                        if rate:
+                            start = max(sent, link_free[out])
+                            if queue is not None and (start - sent) * rate > queue:
+                                continue
+                            sent = link_free[out] = start + len(datagram) / rate
+                        order += 1
+                        heapq.heappush(in_flight, (sent + delay, order, datagram, out, destination))
+                now = time.monotonic()
+                while in_flight and in_flight[0][0] <= now:
+                    _, _, datagram, out, destination = heapq.heappop(in_flight)
+                    try:
+                        out.sendto(datagram, destination)
+                    except OSError:
+                        pass
+        finally:
+            os._exit(0)
+    try:
+        yield
+    finally:
+        os.kill(pid, signal.SIGTERM)
+        os.waitpid(pid, 0)
+
+
+def random_file(path: str, size: int):
+    with open(path, "wb") as f:
+        for offset in range(0, size, 1 << 20):
+            f.write(os.urandom(min(1 << 20, size - offset)))
+
+
+def file_digest(path: str) -> bytes:
+    with open(path, "rb") as f:
+        return hashlib.file_digest(f, "blake2b").digest()
+
+
+def bench_transfers(options):
+    """
+    Concurrent file transfers over localhost, with the CPU time spent by the sending process. Each transfer has a
+    port of its own on each side, or every transfer shares one.
+    """
+    with tempfile.TemporaryDirectory() as directory:
+        source = os.path.join(directory, "source.bin")
+        random_file(source, options.size * 1024 * 1024)
+        ports = [options.port + i for i in range(options.transfers)]
+        out_paths = [os.path.join(directory, f"out{i}.bin") for i in range(options.transfers)]
+        stdout = sys.stdout
+        sys.stdout = open(os.devnull, "w")  # the transfers print their progress
+        try:
+            if options.multiplex:
+                # The transfers wait for their receivers, which connect from a single socket
+                endpoint = file_sender.SenderEndpoint(options.port, file_sender.SOCKET_BUFFER_CAPACITY,
+                                                      options.io_mode)
+                senders = [file_sender.FileSender(None, source, MSS=options.mss or None,
+                                                  buffer_capacity=options.buffer, endpoint=endpoint)
+                           for _ in out_paths]
+                for sender in senders:
+                    file_sender.shared_engine().add(sender)
+                receiving = multiplexed_receiver(("127.0.0.1", endpoint.port),
+                                                 [sender.connection_id for sender in senders], out_paths,
+                                                 options.buffer, options.io_mode)
+            else:
+                senders = [file_sender.FileSender(("127.0.0.1", port), source, MSS=options.mss or None,
+                                                  buffer_capacity=options.buffer, io_mode=options.io_mode)
+                           for port in ports]
+                receiving = receiver_process(ports, out_paths, options.buffer, options.io_mode)
+            with receiving:
+                usage = resource.getrusage(resource.RUSAGE_SELF)
+                start = time.perf_counter()
+                if not options.multiplex:
+                    for sender in senders:
+                        file_sender.shared_engine().add(sender)
+                for sender in senders:
+                    sender.finished.wait()
+                elapsed = time.perf_counter() - start
+                after = resource.getrusage(resource.RUSAGE_SELF)
+        finally:
+            sys.stdout.close()
+            sys.stdout = stdout
+        expected = file_digest(source)
+        intact = sum(file_digest(path) == expected for path in out_paths)
+    cpu = after.ru_utime - usage.ru_utime + after.ru_stime - usage.ru_stime
+    total = options.size * options.transfers
+    ios = {sender.io for sender in senders}
+    sent = sum(io.sent for io in ios)
+    send_calls = sum(io.send_calls for io in ios)
+    print(f"{options.transfers} transfers of {options.size} MiB in {elapsed:.2f}s: {total / elapsed:.1f} MiB/s "
+          f"({total * 8 * 1.048576 / elapsed:.0f} Mbit/s), "
+          f"sender CPU {cpu:.2f}s ({cpu / elapsed * 100:.0f}%), {sent / send_calls:.1f} segments/syscall "
+          f"({senders[0].io.mode}), {len(ios)} sender sockets, {intact}/{options.transfers} files intact")
+
+
+def bench_udpio(options):
+    """
+    Datagrams blasted over localhost by each batching mode of udpio, with the datagrams handled by each syscall.
+    """
+    payload = os.urandom(options.size * udpio.BATCH_SIZE)
+    batch = [(memoryview(payload)[i * options.size:(i + 1) * options.size],) for i in range(udpio.BATCH_SIZE)]
+    probe = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    modes = udpio.supported_modes(probe)
+    probe.close()
+    for mode in modes:
+        sink = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        sink.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4 << 20)
+        sink.bind(("127.0.0.1", options.port))
+        results, report = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            try:
+                sink_io = udpio.DatagramIO(sink, mode)
+                first = last = None
+                while True:
+                    datagrams = sink_io.receive(udpio.BATCH_SIZE, options.size, 0.5 if first else None)
+                    if not datagrams:
+                        break
+                    last = time.perf_counter()
+                    first = first or last
+                os.write(report, f"{sink_io.received} {sink_io.receive_calls} {last - first}".encode())
+            finally:
+                os._exit(0)
+        sink.close()
+        sender = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        sender.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, 4 << 20)
+        sender_io = udpio.DatagramIO(sender, mode)
+        start = time.perf_counter()
+        for _ in range(options.count // udpio.BATCH_SIZE):
+            sender_io.send(batch, ("127.0.0.1", options.port))
+        elapsed = time.perf_counter() - start
+        os.waitpid(pid, 0)
+        received, receive_calls, receive_elapsed = os.read(results, 1024).decode().split()
+        received, receive_calls, receive_elapsed = int(received), int(receive_calls), float(receive_elapsed)
+        os.close(results)
+        os.close(report)
+        sender.close()
+        mebibytes = 1024 * 1024
+        print(f"{mode:<8} send {sender_io.sent / sender_io.send_calls:5.1f} datagrams/syscall "
+              f"{sender_io.sent_bytes / elapsed / mebibytes:7.1f} MiB/s, "
+              f"receive {received / receive_calls:5.1f} datagrams/syscall "
+              f"{received * options.size / max(receive_elapsed, 1e-9) / mebibytes:7.1f} MiB/s "
+              f"({received / sender_io.sent * 100:.0f}% delivered)")
+
+
+def bench_stripes(options):
+    """
+    A file striped across several transfers over localhost, from one thread or from a process per stripe. With a
+    delay, each stream goes through a link of its own, and a single stream is bounded by its window.
+    """
+    with tempfile.TemporaryDirectory() as directory:
+        source = os.path.join(directory, "source.bin")
+        out_path = os.path.join(directory, "out.bin")
+        random_file(source, options.size * 1024 * 1024)
+        expected = file_digest(source)
+        print(f"{os.cpu_count()} CPUs")
+        for processes in (False, True):
+            for streams in options.streams:
+                ports = [options.port + i for i in range(streams)]
+                targets = ports
+                stdout = sys.stdout
+                sys.stdout = open(os.devnull, "w")
+                try:
+                    with receiver_process(ports, [out_path] * streams, options.buffer, processes=processes), \
+                            contextlib.ExitStack() as links:
+                        if options.delay:
+                            targets = [options.port + len(ports) + i for i in range(streams)]
+                            for target, port in zip(targets, ports):
+                                links.enter_context(lossy_link(target, ("127.0.0.1", port), 0, options.delay / 1000))
+                        start = time.perf_counter()
+                        file_sender.send_stripes([("127.0.0.1", port) for port in targets], source,
+                                                 buffer_capacity=options.buffer, processes=processes,
+                                                 connect_delay=0)
+                        elapsed = time.perf_counter() - start
+                finally:
+                    sys.stdout.close()
+                    sys.stdout = stdout
+                intact = file_digest(out_path) == expected
+                os.remove(out_path)
+                print(f"{streams:>2} streams {'processes' if processes else 'engine':<9} in {elapsed:.2f}s: "
+                      f"{options.size / elapsed:.1f} MiB/s ({options.size * 8 * 1.048576 / elapsed:.0f} Mbit/s), "
+                      f"{'intact' if intact else 'corrupted'}")
+
+
+def memory_usage() -> tuple[int, int]:
+    """
+    :return: resident and anonymous memory of this process in KiB, the latter leaves out the pages of mapped files
+    """
+    fields = {}
+    with open("/proc/self/status") as f:
+        for line in f:
+            name, _, value = line.partition(":")
+            fields[name] = value
+    return int(fields["VmRSS"].split()[0]), int(fields["RssAnon"].split()[0])
+
+
+def bench_memory(options):
+    """
+    Peak memory of a process sending one file, for different buffer sizes.
+    """
+    with tempfile.TemporaryDirectory() as directory:
+        source = os.path.join(directory, "source.bin")
+        random_file(source, options.size * 1024 * 1024)
+        port = options.port
+        for buffer in options.buffers:
+            out_path = os.path.join(directory, "out.bin")
+            with receiver_process([port], [out_path], buffer):
+                reader, writer = os.pipe()
+                pid = os.fork()
+                if pid == 0:
+                    try:
+                        sys.stdout = open(os.devnull, "w")
+                        before = memory_usage()
+                        peak = list(before)
+                        done = threading.Event()
+
+                        def sample():
+                            while not done.wait(0.005):
+                                peak[:] = map(max, peak, memory_usage())
+
+                        sampler = threading.Thread(target=sample)
+                        sampler.start()
+                        file_sender.FileSender(("127.0.0.1", port), source, MSS=options.mss,
+                                               buffer_capacity=buffer).start()
+                        done.set()
+                        sampler.join()
+                        os.write(writer, " ".join(str(p - b) for p, b in zip(peak, before)).encode())
+                    finally:
+                        os._exit(0)
+                os.close(writer)
+                rss, anonymous = map(int, os.read(reader, 64).split())
+                os.close(reader)
+                os.waitpid(pid, 0)
+            port += 1
+            print(f"buffer {buffer // 1024:>6} KiB: peak RSS {rss / 1024:+7.1f} MiB, "
+                  f"anonymous {anonymous / 1024:+7.1f} MiB during the transfer")
+
+
+def bench_loss(options):
+    """
+    A transfer over a lossy link, with and without SACK. Every run drops a different sequence of datagrams, the
+    median run is reported.
+    """
+    with tempfile.TemporaryDirectory() as directory:
+        source = os.path.join(directory, "source.bin")
+        random_file(source, options.size * 1024 * 1024)
+        expected = file_digest(source)
+        port = options.port
+        for loss in options.losses:
+            for sack in (False, True):
+                runs = []  # (elapsed, retransmissions)
+                intact = True
+                for seed in range(options.runs):
+                    out_path = os.path.join(directory, "out.bin")
+                    stdout = sys.stdout
+                    sys.stdout = open(os.devnull, "w")  # the transfers print their progress
+                    try:
+                        with receiver_process([port], [out_path]), \
+                                lossy_link(port + 1, ("127.0.0.1", port), loss / 100, options.delay / 1000, seed):
+                            sender = file_sender.FileSender(("127.0.0.1", port + 1), source, MSS=options.mss,
+                                                            sack=sack)
+                            start = time.perf_counter()
+                            sender.start()
+                            runs.append((time.perf_counter() - start, sender.retransmissions))
+                    finally:
+                        sys.stdout.close()
+                        sys.stdout = stdout
+                    port += 2
+                    intact = intact and file_digest(out_path) == expected
+                elapsed, retransmissions = sorted(runs)[len(runs) // 2]
+                print(f"loss {loss:>4}% {'SACK' if sack else 'no SACK':<7} {elapsed:7.2f}s "
+                      f"{options.size / elapsed:6.2f} MiB/s {retransmissions:6} retransmissions "
+                      f"{'intact' if intact else 'CORRUPT'}")
+
+
+def bench_congestion(options):
+    """
+    Goodput and retransmit ratio of each congestion control, over a link with delay and loss. Every run drops a
+    different sequence of datagrams, the median run is reported.
+    """
+    with tempfile.TemporaryDirectory() as directory:
+        size = options.size * 1024 * 1024
+        source = os.path.join(directory, "source.bin")
+        random_file(source, size)
+        expected = file_digest(source)
+        segments = -(-size // options.mss)
+        port = options.port
+        for loss in options.losses:
+            for algorithm in options.algorithms:
+                runs = []  # (elapsed, retransmissions)
+                intact = True
+                for seed in range(options.runs):
+                    out_path = os.path.join(directory, "out.bin")
+                    stdout = sys.stdout
+                    sys.stdout = open(os.devnull, "w")  # the transfers print their progress
+                    try:
+                        with receiver_process([port], [out_path], options.buffer), \
+                                lossy_link(port + 1, ("127.0.0.1", port), loss / 100, options.delay / 1000, seed):
+                            sender = file_sender.FileSender(("127.0.0.1", port + 1), source, MSS=options.mss,
+                                                            buffer_capacity=options.buffer, plpmtud=False,
+                                                            congestion_control=algorithm)
+                            start = time.perf_counter()
+                            sender.start()
+                            runs.append((time.perf_counter() - start, sender.retransmissions))
+                    finally:
+                        sys.stdout.close()
+                        sys.stdout = stdout
+                    port += 2
+                    intact = intact and file_digest(out_path) == expected
+                elapsed, retransmissions = sorted(runs)[len(runs) // 2]
+                print(f"loss {loss:>4}% {algorithm:<8} {elapsed:7.2f}s {options.size * 8 / elapsed:7.2f} Mbit/s "
+                      f"{retransmissions / segments:7.2%} retransmitted {'intact' if intact else 'CORRUPT'}")
+
+
+def bench_pacing(options):
+    """
+    Transfers over a link with delay, a bottleneck rate and a short drop-tail queue, with and without pacing, then
+    concurrent transfers capped by a token bucket they share, like the downloads of a server with
+    --total-transfer-rate.
+    """
+    with tempfile.TemporaryDirectory() as directory:
+        size = options.size * 1024 * 1024
+        source = os.path.join(directory, "source.bin")
+        random_file(source, size)
+        expected = file_digest(source)
+        port = options.port
+        for algorithm in options.algorithms:
+            for pacing in (False, True):
+                runs = []  # (elapsed, retransmissions)
+                intact = True
+                for _ in range(options.runs):
+                    out_path = os.path.join(directory, "out.bin")
+                    stdout = sys.stdout
+                    sys.stdout = open(os.devnull, "w")
+                    try:
+                        with receiver_process([port], [out_path], options.buffer), \
+                                lossy_link(port + 1, ("127.0.0.1", port), 0, options.delay / 1000,
+                                           rate=options.link_rate * 1e6 / 8, queue=options.queue):
+                            sender = file_sender.FileSender(("127.0.0.1", port + 1), source, MSS=options.mss,
+                                                            buffer_capacity=options.buffer, plpmtud=False,
+                                                            congestion_control=algorithm, pacing=pacing)
+                            start = time.perf_counter()
+                            sender.start()
+                            runs.append((time.perf_counter() - start, sender.retransmissions))
+                    finally:
+                        sys.stdout.close()
+                        sys.stdout = stdout
+                    port += 2
+                    intact = intact and file_digest(out_path) == expected
+                elapsed, retransmissions = sorted(runs)[len(runs) // 2]
+                print(f"{algorithm:<8} {'paced' if pacing else 'bursts':<6} {elapsed:7.2f}s "
+                      f"{options.size * 8 / elapsed:7.2f} Mbit/s {retransmissions:6} retransmissions "
+                      f"{'intact' if intact else 'CORRUPT'}")
+
+        ports = [port + i for i in range(options.transfers)]
+        out_paths = [os.path.join(directory, f"out{i}.bin") for i in ports]
+        bucket = ratelimit.TokenBucket(options.total_rate * 1e6 / 8)
+        stdout = sys.stdout
+        sys.stdout = open(os.devnull, "w")
+        try:
+            with receiver_process(ports, out_paths, options.buffer):
+                senders = [file_sender.FileSender(("127.0.0.1", port), source, buffer_capacity=options.buffer,
+                                                  shared_bucket=bucket) for port in ports]
+                engine = file_sender.SenderEngine()
+                for sender in senders:
+                    engine.add(sender)
+                start = time.perf_counter()
+                thread = threading.Thread(target=engine.run, kwargs={"until_idle": True})
+                thread.start()
+                finished = {}
+                while len(finished) < len(senders):
+                    for sender in senders:
+                        if sender not in finished and sender.finished.is_set():
+                            finished[sender] = time.perf_counter() - start
+                    time.sleep(0.01)
+                thread.join()
+        finally:
+            sys.stdout.close()
+            sys.stdout = stdout
+        intact = all(file_digest(path) == expected for path in out_paths)
+        rates = [size * 8 / 1e6 / elapsed for elapsed in finished.values()]  # in the unit of the bucket rate
+        total = size * 8 / 1e6 * len(senders) / max(finished.values())
+        print(f"{len(senders)} transfers sharing {options.total_rate:g} Mbit/s: {total:.2f} Mbit/s together, "
+              f"{min(rates):.2f} to {max(rates):.2f} Mbit/s each, {'intact' if intact else 'CORRUPT'}")
+
+
+def list_window_cycle(buffer: list, seq: int, ack: int, mss: int):
+    """
+    One ACK with the list window FileSender used before SendWindow: pop and unpack the acknowledged segment, scan
+    for the segment to retransmit and for the next one to send, then read a new segment.
+    """
+    while buffer and buffer[0][0] < ack:
+        utils.unpack_header(buffer.pop(0)[1])
+    for segment in buffer:
+        if segment[0] == ack:
+            break
+    for segment in buffer:
+        if not segment[2]:
+            segment[2] = True
+            break
+    buffer.append([seq, utils.pack_header(sequence_number=seq, data=bytes(mss)), False, 0.0])
+
+
+def ring_window_cycle(window: file_sender.SendWindow, seq: int, ack: int, mss: int):
+    while len(window) and window.seq(window.head) < ack:
+        window.pop()
+    window.find(ack)
+    if window.has_unsent():
+        window.next_send += 1
+    window.append(seq, utils.pack_header(sequence_number=seq), seq, mss)
+
+
+def bench_window(options):
+    """
+    Cost of handling an ACK with the old list send window and with the SendWindow ring buffer.
+    """
+    mss = 1024
+    for size in options.sizes:
+        seqs = [i * mss for i in range(size)]
+        buffer = [[seq, utils.pack_header(sequence_number=seq, data=bytes(mss)), True, 0.0] for seq in seqs]
+        window = file_sender.SendWindow(size, mss)
+        for seq in seqs:
+            window.append(seq, utils.pack_header(sequence_number=seq), seq, mss)
+        window.next_send = size
+        for name, cycle, state in (("list", list_window_cycle, buffer), ("ring", ring_window_cycle, window)):
+            start = time.perf_counter()
+            for i in range(options.acks):
+                cycle(state, (size + i) * mss, (i + 1) * mss, mss)
+            took = time.perf_counter() - start
+            print(f"window of {size:>6} segments {name}: {took / options.acks * 1e9:8.0f} ns/ACK")
+
+
+def list_reassembly_segment(state: list, segment: bytes, fd: int):
+    """
+    One segment with the sorted list FileReceiver used before its dict and runs: scan for the position of the
+    segment, insert it, write the segments that became contiguous, then describe the rest as SACK blocks.
+    :param state: [the buffered segments, the next expected sequence number, offset of that byte in the file]
+    """
+    seq_num, _, _, _, _, _, data = utils.unpack_header(segment)
+    buffer = state[0]
+    i = 0
+    while i < len(buffer) and buffer[i][0] < seq_num:
+        i += 1
+    if seq_num >= state[1] and (i == len(buffer) or buffer[i][0] != seq_num):
+        buffer.insert(i, (seq_num, data))
+        i = 0
+        while i < len(buffer) and state[1] == buffer[i][0]:
+            state[1] += len(buffer[i][1])
+            state[2] += os.pwrite(fd, buffer[i][1], state[2])
+            i += 1
+        state[0] = buffer = buffer[i:]
+    blocks = []
+    for seq, data in buffer:
+        if blocks and blocks[-1][1] == seq:
+            blocks[-1][1] += len(data)
+        else:
+            blocks.append([seq, seq + len(data)])
+    utils.pack_header(ack_number=state[1], ack=True, sack_blocks=blocks)
+
+
+def bench_reassembly(options):
+    """
+    Cost of a data segment at the receiver with the old sorted list and with the dict and runs of FileReceiver,
+    each window of segments arriving in reverse order, which the reassembly of both has to hold until its first
+    segment arrives.
+    """
+    mss = 1024
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "out.bin")
+        for size in options.sizes:
+            stdout = sys.stdout
+            sys.stdout = open(os.devnull, "w")  # the receiver prints the size of the file
+            try:
+                receiver = file_receiver.FileReceiver(("127.0.0.1", 0), path, mss, None, 0, 2 * size * mss)
+                receiver.receive_segment(utils.pack_header(syn=True, data=b"{}"))
+                receiver.receive_segment(utils.pack_header(sequence_number=2, data=b"0"))
+            finally:
+                sys.stdout.close()
+                sys.stdout = stdout
+            receiver.acks = collections.deque(maxlen=1)  # never sent
+            count = max(options.segments // size, 1) * size
+            segments = []
+            for window in range(0, count, size):
+                segments += [utils.pack_header(sequence_number=receiver.seq_num + (window + i) * mss, data=bytes(mss))
+                             for i in reversed(range(size))]
+            fd = os.open(path, os.O_WRONLY)
+            state = [[], receiver.seq_num, 0]
+            for name, handle in (("list", lambda segment: list_reassembly_segment(state, segment, fd)),
+                                 ("dict", receiver.receive_segment)):
+                start = time.perf_counter()
+                for segment in segments:
+                    handle(segment)
+                took = time.perf_counter() - start
+                print(f"windows of {size:>6} segments in reverse {name}: {took / count * 1e9:8.0f} ns/segment")
+            os.close(fd)
+
+
+def bench_writer(options):
+    """
+    Time the receiver spends writing a file of segments arriving in order, with a pwrite per segment and with a
+    FileWriter, which gathers the segments into chunks, written by the receiver or by a thread of their own.
+    """
+    size = options.size * 1024 * 1024
+    for mss in options.mss:
+        segments = [(offset, os.urandom(min(mss, size - offset))) for offset in range(0, size, mss)]
+        with tempfile.TemporaryDirectory(dir=options.directory) as directory:
+            path = os.path.join(directory, "out.bin")
+            for name in ("pwrite", "chunks", "thread"):
+                start = time.perf_counter()
+                if name == "pwrite":
+                    fd = os.open(path, os.O_WRONLY | os.O_CREAT)
+                    for offset, data in segments:
+                        os.pwrite(fd, data, offset)
+                    receiving = time.perf_counter() - start
+                    writes = len(segments)
+                    os.fsync(fd)
+                    os.close(fd)
+                else:
+                    writer = file_receiver.FileWriter(path, size, name == "thread")
+                    writer.allocate(0, size)
+                    for offset, data in segments:
+                        writer.write(offset, data)
+                    receiving = time.perf_counter() - start
+                    writer.flush()
+                    os.fsync(writer.fd)
+                    writer.close()
+                    writes = writer.writes
+                total = time.perf_counter() - start
+                os.remove(path)
+                print(f"segments of {mss:>5} bytes {name:<6}: {receiving / len(segments) * 1e9:7.0f} ns/segment "
+                      f"for the receiver, {options.size / total:7.1f} MiB/s to the disk, {writes:>6} writes")
+
+
+def linear_parse_command(message: str):
+    for cmd in command.commands.values():
+        if cmd.is_format(message):
+            return cmd, cmd.get_args(message)
+    return None, []
+
+
+def linear_parse_reply(message: str):
+    for rep in reply.all_replies.values():
+        if rep.is_format(message):
+            return rep
+    return None
+
+
+def bench_parse(options):
+    """
+    Command and reply dispatch compared to a linear scan over every registered command.
+    """
+    messages = {
+        "first command": command.commands["CONNECT"].format("alice"),
+        "last command": command.commands["SERVER_DOWNLOAD"].format("55001", "1,2", "out.txt"),
+        "chat line": "hello everyone, how is it going?",
+        "reply": str(reply.all_replies["ERR_FILENOTFOUND"]),
+    }
+    for name, message in messages.items():
+        for label, parse in (("linear", linear_parse_command), ("table", command.parse)):
+            took = timeit.timeit(lambda: parse(message), number=options.iterations)
+            print(f"command {name:<13} {label:<6} {took / options.iterations * 1e9:8.0f} ns/message")
+        for label, parse in (("linear", linear_parse_reply), ("table", reply.parse_reply)):
+            took = timeit.timeit(lambda: parse(message), number=options.iterations)
+            print(f"reply   {name:<13} {label:<6} {took / options.iterations * 1e9:8.0f} ns/message")
+
+
+def get_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "-p",
+        "--port",
+        dest="port",
+        default=55100,
+        type=int,
+        help="Port for the benchmarked server",
+    )
+    subparsers = parser.add_subparsers(dest="benchmark", required=True)
+
+    latency = subparsers.add_parser("latency", help=bench_latency.__doc__.strip())
+    latency.set_defaults(func=bench_latency)
+    latency.add_argument("-c", "--clients", dest="clients", default=1000, type=int,
+                         help="Number of simulated clients")
+    latency.add_argument("-r", "--rounds", dest="rounds", default=5, type=int,
+                         help="Number of LIST requests sent by each client")
+    latency.add_argument("--asyncio", dest="use_asyncio", action="store_true",
+                         help="Benchmark the asyncio server mode instead of select")
+
+    load = subparsers.add_parser("workers", help=bench_workers.__doc__.strip())
+    load.set_defaults(func=bench_workers)
+    load.add_argument("-c", "--clients", dest="clients", default=100, type=int,
+                      help="Number of simulated clients")
+    load.add_argument("-r", "--rounds", dest="rounds", default=20, type=int,
+                      help="Number of chat lines broadcast by each client")
+    load.add_argument("-w", "--workers", dest="workers", default=[1, 2, 4, 8], type=int, nargs="+",
+                      help="Numbers of worker processes to compare")
+    load.add_argument("--asyncio", dest="use_asyncio", action="store_true",
+                      help="Benchmark the asyncio server mode instead of select")
+
+    nodes = subparsers.add_parser("federation", help=bench_federation.__doc__.strip())
+    nodes.set_defaults(func=bench_federation)
+    nodes.add_argument("-r", "--rounds", dest="rounds", default=1000, type=int,
+                       help="Number of private messages sent to each receiver")
+    nodes.add_argument("--asyncio", dest="use_asyncio", action="store_true",
+                       help="Benchmark the asyncio server mode instead of select")
+
+    fanout = subparsers.add_parser("fanout", help=bench_fanout.__doc__.strip())
+    fanout.set_defaults(func=bench_fanout)
+    fanout.add_argument("-n", "--recipients", dest="recipients", default=[100, 1000, 10000], type=int, nargs="+",
+                        help="Numbers of recipients to compare")
+    fanout.add_argument("-b", "--burst", dest="burst", default=10, type=int,
+                        help="Number of broadcasts between two flushes of the queues")
+    fanout.add_argument("-s", "--size", dest="size", default=64, type=int,
+                        help="Size of a broadcast message in bytes")
+    fanout.add_argument("-d", "--duration", dest="duration", default=2.0, type=float,
+                        help="Seconds each strategy runs for")
+
+    transfers = subparsers.add_parser("transfers", help=bench_transfers.__doc__.strip())
+    transfers.set_defaults(func=bench_transfers)
+    transfers.add_argument("-t", "--transfers", dest="transfers", default=20, type=int,
+                           help="Number of concurrent transfers")
+    transfers.add_argument("-s", "--size", dest="size", default=4, type=int,
+                           help="Size of the transferred file in MiB")
+    transfers.add_argument("-m", "--mss", dest="mss", default=1024, type=int,
+                           help="Maximum segment size of the transfers, 0 for the largest one the path allows")
+    transfers.add_argument("-b", "--buffer", dest="buffer", default=file_sender.DEFAULT_BUFFER_CAPACITY, type=int,
+                           help="Bytes buffered by each side of a transfer")
+    transfers.add_argument("--io", dest="io_mode", default=None, choices=udpio.MODES,
+                           help="Batching of the segments into syscalls, the best supported one by default")
+    transfers.add_argument("--multiplex", dest="multiplex", action="store_true",
+                           help="Share a single UDP port on each side between every transfer")
+
+    stripes = subparsers.add_parser("stripes", help=bench_stripes.__doc__.strip())
+    stripes.set_defaults(func=bench_stripes)
+    stripes.add_argument("-n", "--streams", dest="streams", default=[1, 2, 4, 8], type=int, nargs="+",
+                         help="Numbers of streams to compare")
+    stripes.add_argument("-s", "--size", dest="size", default=256, type=int,
+                         help="Size of the transferred file in MiB")
+    stripes.add_argument("-b", "--buffer", dest="buffer", default=file_sender.DEFAULT_BUFFER_CAPACITY, type=int,
+                         help="Bytes buffered by each side of each stream")
+    stripes.add_argument("-d", "--delay", dest="delay", default=0, type=float,
+                         help="One way delay of the link of each stream in milliseconds, none by default")
+
+    batching = subparsers.add_parser("udpio", help=bench_udpio.__doc__.strip())
+    batching.set_defaults(func=bench_udpio)
+    batching.add_argument("-n", "--count", dest="count", default=200000, type=int,
+                          help="Number of datagrams sent by each mode")
+    batching.add_argument("-s", "--size", dest="size", default=1024, type=int,
+                          help="Size of a datagram in bytes")
+
+    memory = subparsers.add_parser("memory", help=bench_memory.__doc__.strip())
+    memory.set_defaults(func=bench_memory)
+    memory.add_argument("-b", "--buffers", dest="buffers", default=[1 << 16, 1 << 20, 1 << 24], type=int, nargs="+",
+                        help="Bytes buffered by each side of the transfer")
+    memory.add_argument("-s", "--size", dest="size", default=256, type=int,
+                        help="Size of the transferred file in MiB")
+    memory.add_argument("-m", "--mss", dest="mss", default=4096, type=int,
+                        help="Maximum segment size of the transfer")
+
+    loss = subparsers.add_parser("loss", help=bench_loss.__doc__.strip())
+    loss.set_defaults(func=bench_loss)
+    loss.add_argument("-l", "--losses", dest="losses", default=[1, 5, 10], type=float, nargs="+",
+                      help="Loss rates of the link in percent")
+    loss.add_argument("-d", "--delay", dest="delay", default=5, type=float,
+                      help="One way delay of the link in milliseconds")
+    loss.add_argument("-s", "--size", dest="size", default=2, type=int,
+                      help="Size of the transferred file in MiB")
+    loss.add_argument("-m", "--mss", dest="mss", default=1024, type=int,
+                      help="Maximum segment size of the transfer")
+    loss.add_argument("-r", "--runs", dest="runs", default=3, type=int,
+                      help="Runs of every loss rate, each with its own random losses")
+
+    control = subparsers.add_parser("congestion", help=bench_congestion.__doc__.strip())
+    control.set_defaults(func=bench_congestion)
+    control.add_argument("-a", "--algorithms", dest="algorithms", default=list(congestion.ALGORITHMS), nargs="+",
+                         choices=congestion.ALGORITHMS, help="Congestion controls to compare")
+    control.add_argument("-l", "--losses", dest="losses", default=[0, 0.5, 2], type=float, nargs="+",
+                         help="Loss rates of the link in percent")
+    control.add_argument("-d", "--delay", dest="delay", default=10, type=float,
+                         help="One way delay of the link in milliseconds")
+    control.add_argument("-s", "--size", dest="size", default=8, type=int,
+                         help="Size of the transferred file in MiB")
+    control.add_argument("-m", "--mss", dest="mss", default=1024, type=int,
+                         help="Maximum segment size of the transfer")
+    control.add_argument("-b", "--buffer", dest="buffer", default=1 << 20, type=int,
+                         help="Bytes buffered by each side of the transfer, which bounds the window")
+    control.add_argument("-r", "--runs", dest="runs", default=3, type=int,
+                         help="Runs of every loss rate, each with its own random losses")
+
+    pacing = subparsers.add_parser("pacing", help=bench_pacing.__doc__.strip())
+    pacing.set_defaults(func=bench_pacing)
+    pacing.add_argument("-a", "--algorithms", dest="algorithms", default=[congestion.NEW_RENO, congestion.CUBIC],
+                        nargs="+", choices=congestion.ALGORITHMS, help="Congestion controls to compare")
+    pacing.add_argument("-d", "--delay", dest="delay", default=10, type=float,
+                        help="One way delay of the link in milliseconds")
+    pacing.add_argument("-L", "--link-rate", dest="link_rate", default=20, type=float,
+                        help="Bottleneck rate of the link in Mbit/s")
+    pacing.add_argument("-q", "--queue", dest="queue", default=64 * 1024, type=int,
+                        help="Bytes queued before the bottleneck of the link")
+    pacing.add_argument("-s", "--size", dest="size", default=8, type=int,
+                        help="Size of each transferred file in MiB")
+    pacing.add_argument("-m", "--mss", dest="mss", default=1024, type=int,
+                        help="Maximum segment size of the transfers over the link")
+    pacing.add_argument("-b", "--buffer", dest="buffer", default=1 << 20, type=int,
+                        help="Bytes buffered by each side of each transfer, which bounds the window")
+    pacing.add_argument("-r", "--runs", dest="runs", default=3, type=int,
+                        help="Runs of every transfer over the link")
+    pacing.add_argument("-t", "--transfers", dest="transfers", default=4, type=int,
+                        help="Transfers sharing the token bucket")
+    pacing.add_argument("-R", "--total-rate", dest="total_rate", default=100, type=float,
+                        help="Rate of the shared token bucket in Mbit/s")
+
+    window = subparsers.add_parser("window", help=bench_window.__doc__.strip())
+    window.set_defaults(func=bench_window)
+    window.add_argument("-n", "--sizes", dest="sizes", default=[64, 1024, 16384], type=int, nargs="+",
+                        help="Window sizes in segments to compare")
+    window.add_argument("-a", "--acks", dest="acks", default=20000, type=int,
+                        help="Number of ACKs handled for each window size")
+
+    reassembly = subparsers.add_parser("reassembly", help=bench_reassembly.__doc__.strip())
+    reassembly.set_defaults(func=bench_reassembly)
+    reassembly.add_argument("-n", "--sizes", dest="sizes", default=[64, 1024, 8192], type=int, nargs="+",
+                            help="Sizes in segments of the windows arriving in reverse")
+    reassembly.add_argument("-c", "--segments", dest="segments", default=32768, type=int,
+                            help="Number of segments received for each window size")
+
+    writer = subparsers.add_parser("writer", help=bench_writer.__doc__.strip())
+    writer.set_defaults(func=bench_writer)
+    writer.add_argument("-m", "--mss", dest="mss", default=[1024, 1472, 8192], type=int, nargs="+",
+                        help="Segment sizes to compare")
+    writer.add_argument("-s", "--size", dest="size", default=256, type=int,
+                        help="Size of the written file in MiB")
+    writer.add_argument("-d", "--directory", dest="directory", default=None, type=str,
+                        help="Directory of the written file, on the disk to measure, the temporary one by default")
+
+    parse = subparsers.add_parser("parse", help=bench_parse.__doc__.strip())
+    parse.set_defaults(func=bench_parse)
+    parse.add_argument("-n", "--iterations", dest="iterations", default=100000, type=int,
+                       help="Number of times each message is parsed")
+
+    return parser.parse_args()
+
+
+def main():
+    options = get_args()
+    options.func(options)
+
+
+if __name__ == '__main__':
+    main()
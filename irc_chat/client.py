@@ -4,19 +4,35 @@ import threading
 
 import command
 import file_receiver
+import framing
+import manifest
 import reply
 
-BUFFER_SIZE = 1024
-
 
 class Client:
     __server_socket: socket.socket
     __input_prefix: str
 
-    def __init__(self, host: str, port: int, nickname: str = ""):
+    def __init__(self, host: str, port: int, nickname: str = "", framing_mode: str = framing.LINE,
+                 transfer_buffer: int = file_receiver.DEFAULT_BUFFER_CAPACITY, transfer_processes: bool = False,
+                 transfer_writer_thread: bool = False):
         self.__host = host
         self.__port = port
         self.__nickname = nickname
+        self.__transfer_buffer = transfer_buffer
+        self.__transfer_processes = transfer_processes
+        self.__transfer_writer_thread = transfer_writer_thread
+        self.__manifests: dict[str, manifest.Manifest] = {}  # output path: manifest of the next download
+        # Every download connects from this socket, see file_receiver.ServerSocket
+        self.__transfers = file_receiver.ServerSocket(0, buffer_capacity=transfer_buffer,
+                                                      writer_thread=transfer_writer_thread)
+        threading.Thread(target=self.__transfers.listen, kwargs={"forever": True}, daemon=True,
+                         name="file-receiver").start()
+        # The FRAMING request is sent as a line, and the server switches its reader right after it, so every message
+        # after it is framed in the negotiated mode, see __send_framing. The replies switch once RPL_FRAMING is
+        # received, see __handle_message
+        self.__framing_mode = framing_mode
+        self.__reader = framing.FrameReader()
 
         self.__server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         # self.__server_socket.setblocking(False)
@@ -25,6 +41,8 @@ class Client:
         self.__input_prefix = ""
         self.__last_pm = ""
 
+        if framing_mode != framing.LINE:
+            self.__send_framing()
         if self.__nickname:
             self.__send_nickname()
 
@@ -35,7 +53,7 @@ class Client:
         self.__send_thread.start()
 
     def __send_message(self, message: str):
-        self.__server_socket.sendall(message.encode())
+        self.__server_socket.sendall(framing.encode(message.encode(), self.__framing_mode))
 
     def __send_thread_func(self):
         while True:
@@ -48,41 +66,57 @@ class Client:
 
     def __recv_thread_func(self):
         while True:
-            data = self.__server_socket.recv(BUFFER_SIZE)
-            cur_data = data
-            while len(cur_data) >= BUFFER_SIZE:
-                cur_data = self.__server_socket.recv(BUFFER_SIZE)
-                data += cur_data
-            if data:
-                msg = data.decode()
-                rep = reply.parse_base(msg)
-                cmd = command.parse_command(msg)
-                if rep:
-                    if reply.all_replies["RPL_PRVTMSGON"].is_format(msg):
-                        self.__input_prefix = "PRIVMSG " + self.__last_pm + ": "
-                        continue
-                    elif reply.all_replies["RPL_PRVTMSGOFF"].is_format(msg):
-                        self.__input_prefix = ""
-                        continue
-                    print("Server> " + rep.reply_message)
-                    if rep is reply.all_replies["RPL_DISCONNECTED"]:
-                        break
-                elif cmd:
-                    if cmd is command.commands["SERVER_DOWNLOAD"]:
-                        args = cmd.get_args(msg)
-                        self.__receive_file(args[0], int(args[1]))
-                else:
-                    print(msg)
-                # cmd = command.parse_command(data.decode())
-            else:
+            if not self.__reader.recv_into(self.__server_socket):
                 break
+            for data in self.__reader:
+                if not self.__handle_message(str(data, "utf-8")):
+                    return
+
+    def __handle_message(self, msg: str) -> bool:
+        """
+        Handle a single message from the server.
+        :param msg: message received from the server
+        :return: False if the server closed the session, True otherwise
+        """
+        rep = reply.parse_base(msg)
+        cmd, args = command.parse(msg)
+        if rep:
+            if reply.all_replies["RPL_PRVTMSGON"].is_format(msg):
+                self.__input_prefix = "PRIVMSG " + self.__last_pm + ": "
+                return True
+            elif reply.all_replies["RPL_PRVTMSGOFF"].is_format(msg):
+                self.__input_prefix = ""
+                return True
+            elif reply.all_replies["RPL_FRAMING"].is_format(msg, approximate=True):
+                # Messages following this reply are framed using the new mode
+                self.__reader.mode = reply.all_replies["RPL_FRAMING"].extract_args(msg)
+                return True
+            print("Server> " + rep.reply_message)
+            if rep is reply.all_replies["RPL_DISCONNECTED"]:
+                return False
+        elif cmd:
+            if cmd is command.commands["SERVER_MANIFEST"]:
+                self.__manifests[args[3]] = manifest.Manifest.decode(*args[:3])
+            elif cmd is command.commands["SERVER_DOWNLOAD"]:
+                self.__receive_file(args[2], int(args[0]), [int(connection_id) for connection_id in args[1].split(",")])
+        else:
+            print(msg)
+        return True
+
+    def __send_framing(self):
+        message = command.commands["FRAMING"].format(self.__framing_mode)
+        self.__server_socket.sendall(framing.encode(message.encode(), framing.LINE))
 
     def __send_nickname(self):
         self.__send_message(command.commands["CONNECT"].format(self.__nickname))
 
-    def __receive_file(self, output_path: str, udp_port: int):
-        # file_receiver.getFile(udp_port, output_path)
-        threading.Thread(target=file_receiver.get_file, args=(udp_port, output_path)).start()
+    def __receive_file(self, output_path: str, udp_port: int, connection_ids: list[int]):
+        threading.Thread(target=file_receiver.get_stripes,
+                         args=((self.__host, udp_port), connection_ids, output_path, self.__transfer_buffer),
+                         kwargs={"processes": self.__transfer_processes,
+                                 "file_manifest": self.__manifests.pop(output_path, None),
+                                 "server": self.__transfers,
+                                 "writer_thread": self.__transfer_writer_thread}).start()
 
 
 
@@ -112,13 +146,43 @@ def get_args():
         help="Nickname to use",
         type=str
     )
+    parser.add_argument(
+        "-f",
+        "--framing",
+        dest="framing_mode",
+        default=framing.LINE,
+        choices=framing.MODES,
+        help="Message framing to negotiate with the server",
+    )
+    parser.add_argument(
+        "--transfer-buffer",
+        dest="transfer_buffer",
+        default=file_receiver.DEFAULT_BUFFER_CAPACITY,
+        type=int,
+        help="Bytes of out-of-order data buffered by each download, which bounds its window",
+    )
+    parser.add_argument(
+        "--transfer-processes",
+        dest="transfer_processes",
+        action="store_true",
+        help="Receive each stream of a striped download in a process of its own",
+    )
+    parser.add_argument(
+        "--transfer-writer-thread",
+        dest="transfer_writer_thread",
+        action="store_true",
+        help="Write each download from a thread of its own, so a slow disk does not delay its ACKs",
+    )
 
     return parser.parse_args()
 
 
 def main():
     options = get_args()
-    client = Client(options.listen_address, options.listen_port, nickname=options.nickname)
+    client = Client(options.listen_address, options.listen_port, nickname=options.nickname,
+                    framing_mode=options.framing_mode, transfer_buffer=options.transfer_buffer,
+                    transfer_processes=options.transfer_processes,
+                    transfer_writer_thread=options.transfer_writer_thread)
     # client.run()
 
 
@@ -3,6 +3,8 @@ import typing
 
 
 class Command:
+    __slots__ = ("command", "prefix", "suffix", "args", "action", "num_args", "token", "template_string",
+                 "template", "wire_prefix")
 
     def __init__(self, command_name: str, *argv: str, **kwargs: str):
         self.command = command_name
@@ -11,6 +13,17 @@ class Command:
         self.args = argv
         self.action = None
         # self.args = " ".join(f"${{v}}" for v in argv)
+        self.__compile()
+
+    def __compile(self):
+        """
+        Precomputes the template and the encoded prefix, must be called whenever the arguments change.
+        """
+        self.num_args = len(self.args)
+        self.token = f"{self.prefix}{self.command}{self.suffix}"
+        self.template_string = self.token + self.__spaced_args
+        self.template = string.Template(self.template_string)
+        self.wire_prefix = (self.token + (" " if self.num_args > 0 else "")).encode()
 
     def set_action(self, action: typing.Callable):
         self.action = action
@@ -20,29 +33,24 @@ class Command:
     def __spaced_args(self):
         return " " + self.args_string if self.num_args > 0 else ""
 
-    @property
-    def num_args(self):
-        return len(self.args)
-
     @property
     def args_string(self):
         if self.num_args == 0:
             return ""
         return " ".join(f"${{{v}}}" for v in self.args)
 
-    @property
-    def template_string(self):
-        return f"{self.prefix}{self.command}{self.suffix}" + self.__spaced_args
-
-    @property
-    def template(self):
-        return string.Template(self.template_string)
-
     def format(self, *args: str) -> str:
         if len(args) < self.num_args:
             raise ValueError(f"Not enough arguments for command {self.command}")
-        a = dict(zip(self.args, args))
-        return self.template.substitute(**a)
+        if self.num_args == 0:
+            return self.token
+        # Same result as self.template.substitute, without building the mapping
+        return self.token + " " + " ".join(map(str, args[:self.num_args]))
+
+    def encode(self, *args: str) -> bytes:
+        if len(args) < self.num_args:
+            raise ValueError(f"Not enough arguments for command {self.command}")
+        return self.wire_prefix + " ".join(map(str, args[:self.num_args])).encode()
 
     def __str__(self):
         return self.template_string
@@ -51,6 +59,7 @@ class Command:
         if len(argv) == 0:
             return self
         self.args += argv
+        self.__compile()
         return self
 
     def is_format(self, message: str) -> bool:
@@ -89,11 +98,24 @@ class Command:
         message = message[len(self.prefix) + len(self.command) + len(self.suffix) + (self.num_args > 0):]
         return message.split(" ", self.num_args - 1)
 
+    def parse_args(self, message: str) -> typing.Optional[typing.List[str]]:
+        """
+        Same as is_format followed by get_args, for a message already known to start with the command token.
+        :return: the arguments, or None if the message is missing arguments
+        """
+        message = message[len(self.token) + (self.num_args > 0):]
+        if self.num_args > 0:
+            args = message.split(" ", self.num_args)
+            if len(args) - (args[0] == "") < self.num_args:
+                return None
+        return message.split(" ", self.num_args - 1)
+
 
 commands: typing.Dict[str, Command]
 
 commands = {
     "CONNECT": Command("connect", "name"),
+    "FRAMING": Command("framing", "mode"),
     "NICK": Command("nick", "name"),
     "QUIT": Command("quit"),
     "DISCONNECT": Command("disconnect"),
@@ -101,23 +123,63 @@ commands = {
     "GET_USERS": Command("get_users"),
     "SET_MSG": Command("set_msg", "name"),
     "SET_MSG_ALL": Command("set_msg_all"),
+    "JOIN": Command("join", "channel"),
+    "PART": Command("part", "channel"),
     "GET_LIST_FILE": Command("get_list_file"),
     "DOWNLOAD": Command("download", "file_name", "out_file_name"),
+    # The file is striped across that many transfers, the output path is still the last argument and may have spaces
+    "DOWNLOAD_STRIPED": Command("download_striped", "file_name", "streams", "out_file_name"),
     "PROCEED": Command("proceed"),
 }
 
 server_commands = {
-    "SERVER_DOWNLOAD": Command("server_download", "out_file_path", "port"),
+    # UDP port of the transfers of the server, and the connection IDs of the download, comma separated, one per stream,
+    # the output path goes last like in DOWNLOAD, so it may have spaces
+    "SERVER_DOWNLOAD": Command("server_download", "port", "connection_ids", "out_file_path"),
+    # Sent before SERVER_DOWNLOAD, the digests are comma separated, see manifest.Manifest
+    "SERVER_MANIFEST": Command("server_manifest", "file_size", "chunk_size", "digests", "out_file_path"),
 }
 
 commands.update(server_commands)
 
 
-def parse_command(message: str) -> typing.Union[Command, None]:
+_dispatch: typing.Dict[str, Command] = {}  # command token: command
+_suffixes: typing.Tuple[str, ...] = ()
+
+
+def build_dispatch():
+    """
+    Rebuilds the token lookup table, must be called after changing the registered commands.
+    """
+    global _suffixes
+    _dispatch.clear()
     for command in commands.values():
-        if command.is_format(message):
-            return command
-    return None
+        _dispatch.setdefault(command.token, command)
+    _suffixes = tuple(dict.fromkeys(command.suffix for command in commands.values()))
+
+
+def parse(message: str) -> typing.Tuple[typing.Union[Command, None], typing.List[str]]:
+    """
+    Looks up the command of a message by its token and parses its arguments in a single pass.
+    :return: the command and its arguments, or None and an empty list if the message is not a command
+    """
+    for suffix in _suffixes:
+        end = message.find(suffix)
+        if end < 0:
+            continue
+        command = _dispatch.get(message[:end + len(suffix)])
+        if command is not None:
+            args = command.parse_args(message)
+            if args is not None:
+                return command, args
+    return None, []
+
+
+def parse_command(message: str) -> typing.Union[Command, None]:
+    return parse(message)[0]
+
+
+build_dispatch()
 
 
 def get_args(message: str) -> typing.List[str]:
@@ -0,0 +1,332 @@
+import abc
+import collections
+import typing
+
+import utils
+
+NEW_RENO = "newreno"
+CUBIC = "cubic"
+BBR = "bbr"
+ALGORITHMS = (NEW_RENO, CUBIC, BBR)
+
+
+class CongestionControl(abc.ABC):
+    """
+    Congestion control of a transfer. The sender tells it about the ACKs, the losses and the recoveries, it tells the
+    sender how many bytes may be in flight, and how fast to send them if the segments are paced.
+    The sender detects the losses and retransmits, see file_sender.FileSender: three duplicate ACKs start a fast
+    recovery, which lasts until the highest segment sent before it is acknowledged.
+    The window is sent over a round trip, faster than that while the window grows so the pacing does not hold the
+    growth back, like Linux does.
+    """
+    SLOW_START_PACING_GAIN = 2
+    PACING_GAIN = 1.2
+
+    def __init__(self, MSS: int, ss_threshold: int):
+        self.MSS = MSS
+        self.window = MSS  # bytes that may be in flight
+        self.ss_threshold = ss_threshold
+        self.status = utils.CCStatus.SLOW_START
+        self.smoothed_RTT = None  # once the first RTT is measured
+
+    def set_MSS(self, MSS: int):
+        """
+        Keeps the window the same number of segments once the path MTU search found larger ones.
+        """
+        self.window = self.window * MSS // self.MSS
+        self.MSS = MSS
+
+    def update_RTT(self, sample_RTT: float):
+        """
+        Smooths the RTT the window is paced over, RFC 6298 with the first sample taken as is.
+        """
+        if self.smoothed_RTT is None:
+            self.smoothed_RTT = sample_RTT
+        else:
+            self.smoothed_RTT += (sample_RTT - self.smoothed_RTT) / 8
+
+    @abc.abstractmethod
+    def on_ack(self, acked: int, sample_RTT: typing.Optional[float], in_flight: int, now: float):
+        """
+        An ACK of new data, during a recovery too, before on_partial_ack or on_recovery_end.
+        :param acked: bytes acknowledged
+        :param sample_RTT: round trip time of the oldest acknowledged segment, None if it was retransmitted or SACKed
+        :param in_flight: bytes sent and not acknowledged yet
+        """
+
+    @abc.abstractmethod
+    def on_fast_retransmit(self, in_flight: int):
+        """
+        Three duplicate ACKs, the oldest segment is retransmitted and the recovery starts.
+        """
+
+    def on_duplicate_ack(self):
+        """
+        Another duplicate ACK during the recovery, a segment left the network.
+        """
+
+    def on_partial_ack(self, acked: int):
+        """
+        An ACK of part of the data sent before the recovery, the next hole is retransmitted.
+        """
+
+    def on_recovery_end(self, in_flight: int):
+        """
+        The data sent before the recovery is acknowledged.
+        """
+        self.status = utils.CCStatus.CONGESTION_AVOIDANCE
+
+    @abc.abstractmethod
+    def on_timeout(self, in_flight: int):
+        """
+        The retransmission timer fired, measured before the oldest segment is retransmitted.
+        """
+
+    def pacing_rate(self) -> typing.Optional[float]:
+        """
+        :return: bytes per second to send at, None to send what the window allows at once, until the RTT is known
+        """
+        if not self.smoothed_RTT:
+            return None
+        gain = self.SLOW_START_PACING_GAIN if self.status == utils.CCStatus.SLOW_START else self.PACING_GAIN
+        return gain * self.window / self.smoothed_RTT
+
+
+class NewReno(CongestionControl):
+    """
+    RFC 5681 and RFC 6582. The window is inflated by a segment for every duplicate ACK of the recovery, and deflated by
+    the data acknowledged by every partial ACK.
+    """
+
+    def on_ack(self, acked: int, sample_RTT: typing.Optional[float], in_flight: int, now: float):
+        if self.status == utils.CCStatus.FAST_RECOVERY:
+            return
+        if self.status == utils.CCStatus.SLOW_START:
+            self.window += min(acked, self.MSS)
+            if self.window >= self.ss_threshold:
+                self.status = utils.CCStatus.CONGESTION_AVOIDANCE
+        else:
+            self.window += max(self.MSS * acked // self.window, 1)
+
+    def on_fast_retransmit(self, in_flight: int):
+        self.ss_threshold = max(in_flight // 2, 2 * self.MSS)
+        self.window = self.ss_threshold + 3 * self.MSS
+        self.status = utils.CCStatus.FAST_RECOVERY
+
+    def on_duplicate_ack(self):
+        self.window += self.MSS
+
+    def on_partial_ack(self, acked: int):
+        self.window = max(self.window - acked + (self.MSS if acked >= self.MSS else 0), self.MSS)
+
+    def on_recovery_end(self, in_flight: int):
+        self.window = self.ss_threshold
+        self.status = utils.CCStatus.CONGESTION_AVOIDANCE
+
+    def on_timeout(self, in_flight: int):
+        self.ss_threshold = max(in_flight // 2, 2 * self.MSS)
+        self.window = self.MSS
+        self.status = utils.CCStatus.SLOW_START
+
+
+class Cubic(NewReno):
+    """
+    RFC 9438. Outside of slow start the window follows a cubic function of the time since the last loss, which
+    climbs back quickly to the window of the loss, stays near it, and probes beyond it, whatever the RTT. It grows at
+    least like Reno would with the same decrease factor. The recoveries are NewReno's.
+    """
+    C = 0.4
+    BETA = 0.7
+    ALPHA = 3 * (1 - BETA) / (1 + BETA)  # Reno-friendly increase, in segments per RTT
+
+    def __init__(self, MSS: int, ss_threshold: int):
+        super().__init__(MSS, ss_threshold)
+        self.max_window = 0  # bytes, the window of the last loss
+        self.epoch_start = None  # time at which the current growth started
+        self.origin = 0  # bytes, the window the cubic function climbs back to
+        self.K = 0.0  # seconds the cubic function takes to reach the origin
+        self.reno_window = 0  # bytes, the window Reno would have
+        self.last_RTT = 0.0
+
+    def on_ack(self, acked: int, sample_RTT: typing.Optional[float], in_flight: int, now: float):
+        if sample_RTT is not None:
+            self.last_RTT = sample_RTT
+        if self.status == utils.CCStatus.FAST_RECOVERY:
+            return
+        if self.status == utils.CCStatus.SLOW_START:
+            super().on_ack(acked, sample_RTT, in_flight, now)
+            return
+        if self.epoch_start is None:
+            self.epoch_start = now
+            self.origin = max(self.max_window, self.window)
+            self.K = ((self.origin - self.window) / self.MSS / self.C) ** (1 / 3)
+            self.reno_window = self.window
+        t = now - self.epoch_start + self.last_RTT
+        target = self.origin + self.C * (t - self.K) ** 3 * self.MSS
+        target = min(max(target, self.window), 1.5 * self.window)
+        self.reno_window += self.ALPHA * self.MSS * acked / self.reno_window
+        if target < self.reno_window:
+            self.window = int(self.reno_window)
+        else:
+            self.window += max(int((target - self.window) * acked / self.window), 1)
+
+    def on_fast_retransmit(self, in_flight: int):
+        self.__reduce(in_flight)
+        self.window = self.ss_threshold + 3 * self.MSS
+        self.status = utils.CCStatus.FAST_RECOVERY
+
+    def on_timeout(self, in_flight: int):
+        self.__reduce(in_flight)
+        self.window = self.MSS
+        self.status = utils.CCStatus.SLOW_START
+
+    def __reduce(self, in_flight: int):
+        # The window grows past the data in flight while the receive window limits the sender
+        window = min(self.window, max(in_flight, self.MSS))
+        # Fast convergence, a window smaller than at the last loss leaves room to the flows that joined
+        if window < self.max_window:
+            self.max_window = int(window * (1 + self.BETA) / 2)
+        else:
+            self.max_window = window
+        self.ss_threshold = max(int(window * self.BETA), 2 * self.MSS)
+        self.epoch_start = None
+
+
+class BBRLite(CongestionControl):
+    """
+    A simplified BBR: the segments are paced at the largest delivery rate measured over the last rounds, and the
+    window is a multiple of the product of that rate and the smallest RTT of the last seconds. Losses do not change
+    the rate or the RTT the segments are paced by.
+    Startup doubles the rate every round until it stops growing, drain empties the queue it built, and probe
+    bandwidth then cycles the pacing gain to look for more bandwidth and give back the queue it built.
+    A fast recovery conserves the segments in flight, it sends a segment for each one that left the network.
+    """
+    STARTUP_GAIN = 2.89  # 2 / ln 2
+    DRAIN_GAIN = 1 / STARTUP_GAIN
+    PROBE_GAINS = (1.25, 0.75, 1, 1, 1, 1, 1, 1)
+    WINDOW_GAIN = 2
+    FULL_BANDWIDTH_GROWTH = 1.25
+    FULL_BANDWIDTH_ROUNDS = 3  # rounds without growth before the startup ends
+    BANDWIDTH_ROUNDS = 10  # rounds the largest delivery rate is kept
+    MIN_RTT_WINDOW = 10  # seconds the smallest RTT is kept
+    MIN_WINDOW_SEGMENTS = 4
+
+    def __init__(self, MSS: int, ss_threshold: int):
+        super().__init__(MSS, ss_threshold)
+        self.window = self.MIN_WINDOW_SEGMENTS * MSS
+        self.pacing_gain = self.STARTUP_GAIN
+        self.full_bandwidth = 0.0
+        self.full_bandwidth_count = 0
+        self.filled_pipe = False
+        self.draining = False
+        self.min_RTT = None
+        self.min_RTT_time = 0.0
+        self.delivered = 0  # bytes acknowledged since the start
+        self.deliveries = collections.deque()  # (time, delivered), about a round of them
+        self.rates = collections.deque()  # (round, delivery rate), the last rounds of them
+        self.round = 0
+        self.round_end = 0  # delivered bytes that end the current round
+        self.cycle_index = 0
+        self.cycle_start = 0.0
+        self.prior_window = 0  # window before the recovery, restored once it ends
+
+    def bandwidth(self) -> float:
+        return max((rate for _, rate in self.rates), default=0.0)
+
+    def bdp(self) -> float:
+        return self.bandwidth() * self.min_RTT if self.min_RTT is not None else 0.0
+
+    def on_ack(self, acked: int, sample_RTT: typing.Optional[float], in_flight: int, now: float):
+        self.delivered += acked
+        if sample_RTT is not None and (self.min_RTT is None or sample_RTT <= self.min_RTT or
+                                       now - self.min_RTT_time > self.MIN_RTT_WINDOW):
+            self.min_RTT = sample_RTT
+            self.min_RTT_time = now
+        self.__sample_rate(now)
+        round_ended = self.delivered >= self.round_end
+        if round_ended:
+            self.round += 1
+            self.round_end = self.delivered + in_flight
+            while self.rates and self.rates[0][0] <= self.round - self.BANDWIDTH_ROUNDS:
+                self.rates.popleft()
+        self.__update_state(round_ended, in_flight, now)
+        if self.status == utils.CCStatus.FAST_RECOVERY:
+            return
+        gain = self.WINDOW_GAIN if self.filled_pipe else self.STARTUP_GAIN
+        target = max(int(gain * self.bdp()), self.MIN_WINDOW_SEGMENTS * self.MSS)
+        if self.filled_pipe:
+            self.window = min(self.window + acked, target)
+        elif self.window < target or not self.bandwidth():
+            self.window += acked
+
+    def on_fast_retransmit(self, in_flight: int):
+        self.prior_window = self.window
+        self.window = max(in_flight, self.MIN_WINDOW_SEGMENTS * self.MSS)
+        self.status = utils.CCStatus.FAST_RECOVERY
+
+    def on_duplicate_ack(self):
+        self.window += self.MSS
+
+    def on_recovery_end(self, in_flight: int):
+        self.window = max(self.window, self.prior_window)
+        self.status = utils.CCStatus.CONGESTION_AVOIDANCE if self.filled_pipe else utils.CCStatus.SLOW_START
+
+    def on_timeout(self, in_flight: int):
+        self.window = self.MSS
+        self.status = utils.CCStatus.SLOW_START if not self.filled_pipe else utils.CCStatus.CONGESTION_AVOIDANCE
+
+    def pacing_rate(self) -> typing.Optional[float]:
+        bandwidth = self.bandwidth()
+        return self.pacing_gain * bandwidth if bandwidth else super().pacing_rate()
+
+    def __sample_rate(self, now: float):
+        """
+        Measures the delivery rate over the last round trip.
+        """
+        deliveries = self.deliveries
+        deliveries.append((now, self.delivered))
+        horizon = now - (self.min_RTT or 0)
+        while len(deliveries) > 2 and deliveries[1][0] <= horizon:
+            deliveries.popleft()
+        start, delivered = deliveries[0]
+        if self.min_RTT is not None and now - start >= self.min_RTT > 0:
+            self.rates.append((self.round, (self.delivered - delivered) / (now - start)))
+
+    def __update_state(self, round_ended: bool, in_flight: int, now: float):
+        if not self.filled_pipe:
+            if round_ended:
+                bandwidth = self.bandwidth()
+                if bandwidth >= self.full_bandwidth * self.FULL_BANDWIDTH_GROWTH:
+                    self.full_bandwidth = bandwidth
+                    self.full_bandwidth_count = 0
+                else:
+                    self.full_bandwidth_count += 1
+                if self.full_bandwidth_count >= self.FULL_BANDWIDTH_ROUNDS:
+                    self.filled_pipe = self.draining = True
+                    self.pacing_gain = self.DRAIN_GAIN
+                    self.status = utils.CCStatus.CONGESTION_AVOIDANCE
+            return
+        if self.draining:
+            if in_flight <= self.bdp():
+                self.draining = False
+                self.cycle_index = 0
+                self.cycle_start = now
+                self.pacing_gain = self.PROBE_GAINS[0]
+            return
+        if self.min_RTT is not None and now - self.cycle_start >= self.min_RTT:
+            self.cycle_index = (self.cycle_index + 1) % len(self.PROBE_GAINS)
+            self.cycle_start = now
+            self.pacing_gain = self.PROBE_GAINS[self.cycle_index]
+
+
+def create(algorithm: str, MSS: int, ss_threshold: int) -> CongestionControl:
+    """
+    :param algorithm: one of ALGORITHMS
+    """
+    if algorithm == NEW_RENO:
+        return NewReno(MSS, ss_threshold)
+    if algorithm == CUBIC:
+        return Cubic(MSS, ss_threshold)
+    if algorithm == BBR:
+        return BBRLite(MSS, ss_threshold)
+    raise ValueError(f"Unknown congestion control {algorithm}, expected one of {', '.join(ALGORITHMS)}")
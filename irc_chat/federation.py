@@ -0,0 +1,251 @@
+import selectors
+import socket
+import time
+import typing
+
+import outbound
+import relay
+
+# A stalled peer is disconnected rather than growing this node without bounds, the link is made again and the
+# registry resent, which a dropped CLAIM or RELEASE would leave out of sync for good
+PEER_HIGH_WATERMARK = 64 * 1024 * 1024
+PEER_LOW_WATERMARK = 16 * 1024 * 1024
+CONNECT_TIMEOUT = 10
+RECONNECT_INTERVAL = 1.0  # seconds between the attempts to link again to a peer that was lost
+
+
+def parse_address(address: str) -> typing.Tuple[str, int]:
+    host, _, port = address.rpartition(":")
+    return host or "127.0.0.1", int(port)
+
+
+class Federation:
+    """
+    Links this server node to the other nodes of the network, in the spirit of RFC 2813.
+    Every node links directly to every other node and keeps a replica of the nickname registry, so nickname
+    lookups never wait for the network. Broadcasts and channel messages are sent to every peer, private messages
+    only to the node of the receiver. Messages are batched per peer and written once per iteration of the server
+    loop. A node links again to the peers it lost, and introduces its users again through the new links.
+
+    Two nodes may claim the same nickname at the same time, the node whose name sorts first keeps it, and the
+    other one reports the collision to its server through a KILL message.
+
+    Has the same interface as workers.WorkerBus. All the links are registered in a selector whose own file
+    descriptor is ready whenever one of them is, so the server only has to wait on fileno.
+    """
+
+    def __init__(self, name: str, address: typing.Tuple[str, int], peers: typing.List[typing.Tuple[str, int]]):
+        """
+        :param name: unique name of this node
+        :param address: address on which to accept links from other nodes
+        :param peers: addresses of the nodes to link to
+        """
+        self.name = name.encode()
+        self.__selector = selectors.DefaultSelector()
+        self.__links: dict[socket.socket, relay.RelayConnection] = {}
+        self.__queues: dict[socket.socket, outbound.OutboundQueue] = {}
+        self.__link2node: dict[socket.socket, bytes] = {}  # link: name of the node, once it said hello
+        self.__node2link: dict[bytes, socket.socket] = {}
+        self.__nick2node: dict[bytes, bytes] = {}  # nickname: name of the node of the user
+        self.__kills: typing.List[relay.Message] = []
+        self.__peer_links: dict[socket.socket, typing.Tuple[str, int]] = {}  # link this node made: peer address
+        self.__lost_peers: dict[typing.Tuple[str, int], float] = {}  # address: time of the next attempt to link
+
+        self.__listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.__listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.__listener.bind(address)
+        self.__listener.listen(socket.SOMAXCONN)
+        self.__listener.setblocking(False)
+        self.__selector.register(self.__listener, selectors.EVENT_READ)
+        for peer in peers:
+            sock = self.__connect(peer)
+            self.__peer_links[sock] = peer
+            self.__add_link(sock)
+
+    def fileno(self) -> int:
+        return self.__selector.fileno()
+
+    @staticmethod
+    def __connect(address: typing.Tuple[str, int]) -> socket.socket:
+        """
+        Connects to another node, waiting for it to start listening.
+        """
+        deadline = time.monotonic() + CONNECT_TIMEOUT
+        while True:
+            try:
+                return socket.create_connection(address)
+            except ConnectionRefusedError:
+                if time.monotonic() > deadline:
+                    raise
+                time.sleep(0.1)
+
+    def __add_link(self, sock: socket.socket):
+        sock.setblocking(False)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        link = relay.RelayConnection(sock)
+        self.__links[sock] = link
+        self.__queues[sock] = outbound.OutboundQueue(PEER_HIGH_WATERMARK, PEER_LOW_WATERMARK, outbound.DISCONNECT)
+        self.__selector.register(sock, selectors.EVENT_READ)
+        link.send(relay.HELLO, self.name)
+        for nick, node in self.__nick2node.items():  # introduce the users of this node
+            if node == self.name:
+                link.send(relay.CLAIM, nick, b"")
+
+    def __remove_link(self, sock: socket.socket):
+        link = self.__links.pop(sock, None)
+        if link is None:
+            return
+        self.__selector.unregister(sock)
+        link.close()
+        self.__queues.pop(sock, None)
+        peer = self.__peer_links.pop(sock, None)
+        if peer is not None:
+            self.__lost_peers[peer] = time.monotonic()
+        node = self.__link2node.pop(sock, None)
+        if node is not None and self.__node2link.get(node) is sock:
+            del self.__node2link[node]
+            for nick in [nick for nick, owner in self.__nick2node.items() if owner == node]:
+                del self.__nick2node[nick]
+
+    def claim_nick(self, nick: bytes, old_nick: bytes = b"") -> bool:
+        if nick in self.__nick2node:
+            return False
+        self.__nick2node[nick] = self.name
+        if old_nick and self.__nick2node.get(old_nick) == self.name:
+            del self.__nick2node[old_nick]
+        self.__send_all(relay.pack(relay.CLAIM, nick, old_nick))
+        return True
+
+    def release_nick(self, nick: bytes):
+        if self.__nick2node.get(nick) == self.name:
+            del self.__nick2node[nick]
+            self.__send_all(relay.pack(relay.RELEASE, nick))
+
+    def has_nick(self, nick: bytes) -> bool:
+        return nick in self.__nick2node
+
+    def list_nicks(self) -> typing.List[bytes]:
+        return list(self.__nick2node)
+
+    def broadcast(self, message: bytes):
+        self.__send_all(relay.pack(relay.BROADCAST, message))
+
+    def channel(self, channel: bytes, message: bytes):
+        self.__send_all(relay.pack(relay.CHANNEL, channel, message))
+
+    def private(self, nick: bytes, message: bytes):
+        sock = self.__node2link.get(self.__nick2node.get(nick))
+        if sock is not None:
+            self.__links[sock].send(relay.PRIVATE, nick, message)
+
+    def __send_all(self, frame: bytes):
+        # Also to the links whose HELLO did not come yet, the HELLO of this node goes first on every link
+        for link in self.__links.values():
+            link.send_frame(frame)
+
+    def has_pending(self) -> bool:
+        return bool(self.__kills)
+
+    def process_pending(self) -> typing.List[relay.Message]:
+        messages = self.__kills
+        self.__kills = []
+        return messages
+
+    def process(self) -> typing.List[relay.Message]:
+        """
+        Handles the ready links without blocking.
+        :return: the messages to deliver to the users of this node, and KILL messages for the users that lost their
+        nickname to a user of another node
+        """
+        messages = []
+        for key, events in self.__selector.select(0):
+            sock = key.fileobj
+            if sock is self.__listener:
+                self.__add_link(self.__listener.accept()[0])
+                continue
+            if events & selectors.EVENT_WRITE:
+                self.__flush_link(sock)
+            if events & selectors.EVENT_READ and sock in self.__links:
+                try:
+                    received = self.__links[sock].receive()
+                except (ConnectionError, OSError):
+                    self.__remove_link(sock)
+                    continue
+                for op, fields in received:
+                    if not self.__handle(sock, op, fields):
+                        messages.append((op, fields))
+        return self.process_pending() + messages
+
+    def __handle(self, sock: socket.socket, op: int, fields: typing.List[bytes]) -> bool:
+        """
+        Applies a message received from a peer to the registry.
+        :return: whether the message was handled, otherwise it is for the server
+        """
+        if op == relay.HELLO:
+            self.__link2node[sock] = fields[0]
+            self.__node2link[fields[0]] = sock
+        elif op == relay.CLAIM:
+            node = self.__link2node.get(sock)
+            nick, old_nick = fields
+            owner = self.__nick2node.setdefault(nick, node)
+            if owner != node and node < owner:  # collision, the first node by name keeps the nickname
+                self.__nick2node[nick] = node
+                if owner == self.name:
+                    self.__kills.append((relay.KILL, [nick]))
+            if old_nick and self.__nick2node.get(old_nick) == node:
+                del self.__nick2node[old_nick]
+        elif op == relay.RELEASE:
+            if self.__nick2node.get(fields[0]) == self.__link2node.get(sock):
+                del self.__nick2node[fields[0]]
+        else:
+            return False
+        return True
+
+    def flush(self):
+        for sock, link in list(self.__links.items()):
+            data = link.take_batch()
+            if data:
+                try:
+                    self.__queues[sock].push(data)
+                except outbound.SlowConsumerError:
+                    self.__remove_link(sock)
+                    continue
+                self.__flush_link(sock)
+        if self.__lost_peers:
+            self.__reconnect()
+
+    def __reconnect(self):
+        """
+        Links again to the peers that were lost, the registry of this node is sent through the new links.
+        """
+        now = time.monotonic()
+        for peer, attempt_time in list(self.__lost_peers.items()):
+            if attempt_time > now:
+                continue
+            try:
+                sock = socket.create_connection(peer, RECONNECT_INTERVAL)
+            except OSError:
+                self.__lost_peers[peer] = now + RECONNECT_INTERVAL
+                continue
+            del self.__lost_peers[peer]
+            self.__peer_links[sock] = peer
+            self.__add_link(sock)
+
+    def __flush_link(self, sock: socket.socket):
+        queue = self.__queues.get(sock)
+        if queue is None:
+            return
+        try:
+            done = queue.flush(sock)
+        except OSError:
+            self.__remove_link(sock)
+            return
+        self.__selector.modify(sock, selectors.EVENT_READ if done else selectors.EVENT_READ | selectors.EVENT_WRITE)
+
+    def close(self):
+        for sock in list(self.__links):
+            self.__remove_link(sock)
+        self.__lost_peers.clear()
+        self.__selector.unregister(self.__listener)
+        self.__listener.close()
+        self.__selector.close()
@@ -1,30 +1,185 @@
+import concurrent.futures
+import itertools
 import json
 import os
+import queue
 import socket
+import struct
+import threading
 import time
 
+import manifest
+import outbound
+import udpio
 import utils
 
+DEFAULT_BUFFER_CAPACITY = 65536
+FIN_LINGER = 2  # seconds
+MIN_WINDOW_SEGMENTS = 4  # the MSS is small enough for this many segments to fit in the buffer
+SOCKET_BUFFER_CAPACITY = 4 << 20  # bytes the kernel buffers for the downloads of a socket, it may allow less
+CONNECT_INTERVAL = 0.5  # seconds between the connect requests of a download, until the SYN arrives
+MAX_CONNECT_REQUESTS = 20
+WRITE_CHUNK = 1 << 20  # bytes, contiguous segments are written together up to the next multiple of it in the file
+WRITE_QUEUE_CHUNKS = 64  # chunks handed to the writer thread before the receiver waits for the disk
+
+
+class FileWriter:
+    """
+    Writes the data of the segments to the output file. Segments contiguous in the file are gathered and written by
+    a single pwritev once they reach the end of their WRITE_CHUNK of the file, so the writes are aligned to it,
+    instead of a syscall per segment. The writes may be handed to a thread of their own, so a slow disk does not
+    delay the ACKs.
+    """
+
+    def __init__(self, path: str, file_size: int, thread: bool = False):
+        """
+        :param file_size: size of the whole file, the output file is truncated or extended to it
+        :param thread: whether to write from a thread of its own
+        """
+        self.fd = os.open(path, os.O_WRONLY | os.O_CREAT, 0o666)
+        # Every stripe sets the size of the whole file, the stripes may start in any order
+        os.ftruncate(self.fd, file_size)
+        self.run = []  # data gathered, contiguous in the file
+        self.run_offset = 0
+        self.run_size = 0
+        self.writes = 0  # syscalls
+        self.error = None  # of the writer thread
+        self.queue = None
+        if thread:
+            self.queue = queue.Queue(WRITE_QUEUE_CHUNKS)
+            self.thread = threading.Thread(target=self.__write_queued, daemon=True, name="file-writer")
+            self.thread.start()
+
+    def allocate(self, offset: int, length: int):
+        """
+        Reserves the blocks of a part of the file before it is written, so the part is not fragmented, and the
+        download does not run out of disk space halfway.
+        """
+        if length <= 0 or not hasattr(os, 'posix_fallocate'):
+            return
+        try:
+            os.posix_fallocate(self.fd, offset, length)
+        except OSError:  # not supported by the file system, the writes allocate the blocks
+            pass
+
+    def write(self, offset: int, data: bytes):
+        if offset != self.run_offset + self.run_size:
+            self.flush()
+            self.run_offset = offset
+        chunk_end = (offset // WRITE_CHUNK + 1) * WRITE_CHUNK
+        if offset + len(data) >= chunk_end:
+            data = memoryview(data)
+            self.run.append(data[:chunk_end - offset])
+            self.run_size += chunk_end - offset
+            self.flush()
+            data = data[chunk_end - offset:]
+            if not data:
+                return
+        self.run.append(data)
+        self.run_size += len(data)
+        if len(self.run) == outbound.IOV_MAX:
+            self.flush()
+
+    def flush(self):
+        """
+        Writes the data gathered, or hands it to the writer thread.
+        """
+        if not self.run:
+            return
+        if self.queue is None:
+            self.__write(self.run, self.run_offset)
+        else:
+            self.queue.put((self.run, self.run_offset))
+        self.run_offset += self.run_size
+        self.run = []
+        self.run_size = 0
+
+    def close(self):
+        """
+        Writes what is left, once the writer thread wrote everything handed to it.
+        :raises OSError: if a write of the writer thread failed
+        """
+        self.flush()
+        if self.queue is not None:
+            self.queue.put(None)
+            self.thread.join()
+        os.close(self.fd)
+        if self.error is not None:
+            raise self.error
+
+    def __write(self, buffers: list, offset: int):
+        i = 0
+        while i < len(buffers):
+            written = os.pwritev(self.fd, buffers[i:i + outbound.IOV_MAX], offset)
+            self.writes += 1
+            offset += written
+            while i < len(buffers) and written >= len(buffers[i]):
+                written -= len(buffers[i])
+                i += 1
+            if written:  # a short write, the rest of the buffer is written next
+                buffers[i] = memoryview(buffers[i])[written:]
+
+    def __write_queued(self):
+        while (item := self.queue.get()) is not None:
+            if self.error is None:
+                try:
+                    self.__write(*item)
+                except OSError as error:  # raised by close, the rest is dropped
+                    self.error = error
+
 
 class FileReceiver:
-    def __init__(self, client_address: tuple[str, int], output_path: str, MSS: int):
+    def __init__(self, client_address: tuple[str, int], output_path: str, MSS: int, io: udpio.DatagramIO,
+                 connection_id: int, buffer_capacity: int = DEFAULT_BUFFER_CAPACITY,
+                 file_manifest: manifest.Manifest = None, writer_thread: bool = False):
+        """
+        :param client_address: the address of the sender, the one its SYN comes from once it arrived
+        :param MSS: largest segment the receiver accepts, the sender may offer less in its SYN
+        :param io: the socket of the ServerSocket the download shares with others, the ACKs are sent with it
+        :param connection_id: the transfer of the sender, carried by every segment
+        :param buffer_capacity: bytes of out-of-order data buffered, which bounds the window of the sender
+        :param file_manifest: manifest of the file, the transfer resumes after the part of the output file that
+        matches it
+        :param writer_thread: whether to write the file from a thread of its own, see FileWriter
+        """
         self.finished = False
-        self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.done = threading.Event()  # set once the file is received, or the sender never answered
+        self.io = io
+        self.connection_id = connection_id
+        self.connect_requests = 0  # sent until the SYN arrives
+        self.last_request_time = 0
+        self.lingering_until = None  # once finished, see ServerSocket.listen
+        self.acks = []  # ACKs sent together by send_acks
         self.client_address = client_address
         self.output_path = output_path
         self.file_name = os.path.basename(output_path)
         self.MSS = MSS
-        self.buffer_capacity = 65536
-        self.buffer_segment_amount = int(self.buffer_capacity / self.MSS)
+        self.buffer_capacity = buffer_capacity
+        self.window_scale = 0  # scale of the advertised window, once the sender offered window scaling
+        self.buffered_bytes = 0  # data of the out-of-order segments in the buffer
         self.receive_window_size = 0
-        self.buffer = []
+        # Reassembly of the out-of-order segments, their data is written to the file as they arrive, so only their
+        # lengths are kept, by sequence number. The runs of contiguous segments are kept by both ends, which merges
+        # a segment into its neighbours, and moves past the run that starts at the next expected byte, in O(1)
+        self.buffer: dict[int, int] = {}  # {sequence number: length}
+        # {first sequence number: sequence number following the run}, the run updated last is last
+        self.runs: dict[int, int] = {}
+        self.run_starts: dict[int, int] = {}  # {sequence number following the run: first sequence number}
+        self.fin_seq = None  # sequence number of the FIN, once received
         self.first_packet = True
         self.file_size = 0
         self.progress = 0
         self.segment_counter = 0
         self.last_time_received = 0
-        self.file = None
+        self.writer = None  # of the output file, once the SYN arrived
+        self.writer_thread = writer_thread
+        self.offset = 0  # offset in the file of the next byte, the sender may send a stripe of the file
+        self.manifest = file_manifest
+        self.resume = 0  # bytes of the stripe already in the output file
         self.seq_num = 0
+        # https://datatracker.ietf.org/doc/html/rfc7323#section-4.3 - timestamp echoed by the ACKs, the one of the
+        # last segment at the next expected byte, so that out-of-order segments do not shorten the RTT measured
+        self.recent_timestamp = 0
 
     def receive_segment(self, segment: bytes) -> bool:
         """
@@ -32,21 +187,58 @@ class FileReceiver:
         :param segment: The segment to be written to the file.
         :return: True if the segment was the last segment, False otherwise.
         """
-        seq_num, _, _, syn, fin, _, data = utils.unpack_header(segment)
+        try:
+            seq_num, _, _, syn, fin, _, data = utils.unpack_header(segment)
+        except (ValueError, struct.error):  # another version of the protocol, or not a segment at all
+            return False
+        timestamp, _ = utils.unpack_timestamps(segment)
+        if utils.is_probe(segment):  # acknowledged with the size that got through, its data is padding
+            self.acks.append((utils.pack_header(sequence_number=len(segment), ack_number=self.seq_num, ack=True,
+                                                probe=True, receive_window=self.buffer_capacity - self.buffered_bytes,
+                                                window_scale=self.window_scale, connection_id=self.connection_id,
+                                                timestamp=utils.current_timestamp(), timestamp_echo=timestamp),))
+            return False
         finished_receiving = False
         if syn and not fin:
-            # file_info = json.loads(data.decode())
-            self.file = open(self.output_path, 'wb')
-            print(f'Receiving file {self.file_name} from {self.client_address}')
-            self.seq_num = seq_num + len(data)
-        elif len(self.buffer) < self.buffer_segment_amount and seq_num >= self.seq_num:
-            if self.first_packet:
-                self.first_packet = False
-                self.file_size = json.loads(data.decode())
-                part, unit = utils.convert_size(self.file_size)
-                print(f'The size of the file is {part:.3f} {unit}')
+            if self.writer is None:  # otherwise the SYN-ACK was lost
+                file_info = json.loads(data.decode())
+                if 'window_scale' in file_info:
+                    self.window_scale = min(utils.window_scale(self.buffer_capacity), file_info['window_scale'])
+                self.MSS = min(self.MSS, file_info.get('mss', self.MSS), self.buffer_capacity // MIN_WINDOW_SEGMENTS)
+                self.offset = file_info.get('offset', 0)
+                if self.manifest is not None and 'length' in file_info:
+                    self.resume = self.manifest.verified_end(self.output_path, self.offset,
+                                                             self.offset + file_info['length']) - self.offset
+                    if self.resume:
+                        print(f'Resuming {self.file_name} after {self.resume} bytes')
+                    self.offset += self.resume
+                self.writer = FileWriter(self.output_path, file_info.get('total_size', 0), self.writer_thread)
+                print(f'Receiving file {self.file_name} from {self.client_address}')
                 self.seq_num = seq_num + len(data)
-                self.last_time_received = time.time()
+            # SYN-ACK, its window is not scaled
+            self.recent_timestamp = timestamp
+            header = utils.pack_header(ack_number=self.seq_num, ack=True, syn=True,
+                                       receive_window=self.buffer_capacity, connection_id=self.connection_id,
+                                       timestamp=utils.current_timestamp(), timestamp_echo=timestamp,
+                                       data=json.dumps({'window_scale': self.window_scale, 'mss': self.MSS,
+                                                        'resume': self.resume}).encode())
+            self.acks.append((header,))
+            return False
+        seq_num = utils.unwrap_seq(seq_num, self.seq_num)
+        if seq_num <= self.seq_num:
+            self.recent_timestamp = timestamp
+        if (self.buffered_bytes + len(data) <= self.buffer_capacity or seq_num == self.seq_num) \
+                and seq_num >= self.seq_num:
+            # The next expected segment is always accepted, it is written right away
+            if self.first_packet:
+                if seq_num == self.seq_num:  # data that overtook the size of the file is dropped, it is sent again
+                    self.first_packet = False
+                    self.file_size = json.loads(data.decode())
+                    self.writer.allocate(self.offset, self.file_size - self.resume)
+                    part, unit = utils.convert_size(self.file_size)
+                    print(f'The size of the file is {part:.3f} {unit}')
+                    self.seq_num = seq_num + len(data)
+                    self.last_time_received = time.time()
             else:
                 # # Print the progress every 5 percent of progress
                 # prog_interval = 5
@@ -58,60 +250,250 @@ class FileReceiver:
                 #     speed = self.segment_counter * self.MSS / (time.time() - self.last_time_received)
                 #     part, unit = utils.convert_size(speed)
                 #     print(f'Speed: {part:.3f} {unit}/s')
-                i = 0
-                while i < len(self.buffer) and self.buffer[i][0] < seq_num:
-                    i += 1
-                # Determine whether duplicate
-                if len(self.buffer) == 0 or i == len(self.buffer) or self.buffer[i][0] != seq_num:
-                    self.buffer.insert(i, (seq_num, data, utils.to_ASF(ack=False, syn=syn, fin=fin)))
-                    # Cast out from self.RcvBuffer
-                    i = 0
-                    while i < len(self.buffer) and self.seq_num == self.buffer[i][0]:
-                        self.seq_num += len(self.buffer[i][1])
-                        # FIN
-                        if utils.from_ASF(self.buffer[i][2])[2]:
-                            self.file.close()
-                            print(f'File received from {self.client_address}')
-                            finished_receiving = True
-                        else:
-                            self.file.write(self.buffer[i][1])
-                            self.segment_counter += 1
-                        i += 1
-                    self.buffer = self.buffer[i:]
-                    if len(self.buffer) == self.buffer:
-                        self.buffer.pop(0)
+                if seq_num not in self.buffer:  # otherwise a duplicate
+                    if fin:
+                        self.fin_seq = seq_num
+                    else:  # at its offset, self.offset is the one of the next expected byte
+                        self.writer.write(self.offset + seq_num - self.seq_num, data)
+                        self.segment_counter += 1
+                    self.buffer[seq_num] = len(data)
+                    self.buffered_bytes += len(data)
+                    self.__add_run(seq_num, seq_num + len(data))
+                    if seq_num == self.seq_num and self.__advance():
+                        self.writer.close()
+                        print(f'File received from {self.client_address}')
+                        finished_receiving = self.finished = True
+                        self.done.set()
         # ACK
         header = utils.pack_header(ack_number=self.seq_num, ack=True,
-                                   receive_window=(self.buffer_segment_amount - len(self.buffer)) * self.MSS)
-        self.socket.sendto(header, self.client_address)
+                                   receive_window=self.buffer_capacity - self.buffered_bytes,
+                                   sack_blocks=self.__sack_blocks(), window_scale=self.window_scale,
+                                   connection_id=self.connection_id, timestamp=utils.current_timestamp(),
+                                   timestamp_echo=self.recent_timestamp)
+        self.acks.append((header,))
         return finished_receiving
 
+    def send_acks(self):
+        """
+        Sends the ACKs of the segments received since the last call.
+        """
+        self.io.send(self.acks, self.client_address)
+        self.acks.clear()
+
+    def __add_run(self, start: int, end: int):
+        """
+        Merges the data of a segment with the runs it is contiguous with.
+        """
+        if end in self.runs:
+            end = self.runs.pop(end)
+            del self.run_starts[end]
+        if start in self.run_starts:
+            start = self.run_starts.pop(start)
+            del self.runs[start]
+        self.runs[start] = end
+        self.run_starts[end] = start
+
+    def __advance(self) -> bool:
+        """
+        Moves the next expected byte past the run that starts at it, the data of the run is in the file already.
+        :return: whether the run ends with the FIN
+        """
+        end = self.runs.pop(self.seq_num)
+        del self.run_starts[end]
+        self.buffered_bytes -= end - self.seq_num
+        self.offset += end - self.seq_num
+        while self.seq_num < end:
+            self.seq_num += self.buffer.pop(self.seq_num)
+        return self.fin_seq is not None and self.fin_seq < end
+
+    def __sack_blocks(self) -> list[tuple[int, int]]:
+        """
+        Describes the runs of out-of-order segments as SACK blocks, as in RFC 2018 the first block holds the segment
+        received last, and the next ones the runs updated most recently.
+        """
+        return list(itertools.islice(reversed(self.runs.items()), utils.MAX_SACK_BLOCKS))
+
 
 class ServerSocket(object):
-    def __init__(self, server_port, MSS):
-        self.server_port = server_port
+    """
+    UDP socket shared by any number of downloads. The segments of a download carry the connection ID of its
+    transfer, which routes them to its FileReceiver, so the downloads of a client need a single port. A download
+    added by connect asks its sender, waiting on a file_sender.SenderEndpoint, to start the transfer. When listening
+    with a file name, the SYN of an unknown connection starts a download of its own, for senders that connect first.
+    """
+
+    def __init__(self, server_port: int = 0, MSS: int = utils.MAX_MSS, buffer_capacity: int = DEFAULT_BUFFER_CAPACITY,
+                 io_mode: str = None, file_manifest: manifest.Manifest = None, writer_thread: bool = False):
+        """
+        :param server_port: any free port if 0
+        :param buffer_capacity: bytes of out-of-order data buffered by each download
+        :param io_mode: how the segments are batched into syscalls, one of udpio.MODES, the best one if None
+        :param file_manifest: manifest of the file of the downloads started by the SYN of an unknown connection
+        :param writer_thread: whether each download writes its file from a thread of its own
+        """
         self.MSS = MSS
+        self.buffer_capacity = buffer_capacity
+        self.manifest = file_manifest
+        self.writer_thread = writer_thread
         self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-        self.connections = {}  # {clientAddress: LFTPServer}
+        # Windows of segments may arrive before the receiver runs
+        self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, max(buffer_capacity, SOCKET_BUFFER_CAPACITY))
+        self.socket.bind(('', server_port))
+        self.server_port = self.socket.getsockname()[1]
+        self.io = udpio.DatagramIO(self.socket, io_mode)
+        self.connections: dict[int, FileReceiver] = {}  # {connection ID: FileReceiver}
 
     def start(self, filename):
-        self.socket.bind(('', self.server_port))
         print(f'The server is listening at {self.server_port}')
         self.listen(filename)
 
-    def listen(self, filename):
-        while True:
-            segment, client_address = self.socket.recvfrom(self.MSS + utils.HEADER_SIZE)
-            for c in list(self.connections.items()):
-                if c[1].finished:
-                    del (self.connections[c[0]])
-            if client_address not in self.connections:
-                print(f'Accept connection from {client_address}')
-                self.connections[client_address] = FileReceiver(client_address, filename, self.MSS)
-            if self.connections[client_address].receive_segment(segment):
-                return
+    def connect(self, server_address: tuple[str, int], connection_id: int, output_path: str,
+                file_manifest: manifest.Manifest = None) -> FileReceiver:
+        """
+        Adds a download and sends its connect request, from any thread.
+        :param server_address: the address of the endpoint of the sender
+        :param connection_id: the transfer of the sender to download
+        :param file_manifest: manifest of the file, to resume a partial download
+        """
+        receiver = FileReceiver(server_address, output_path, self.MSS, self.io, connection_id, self.buffer_capacity,
+                                file_manifest, self.writer_thread)
+        self.connections[connection_id] = receiver
+        self.__request(receiver)
+        return receiver
 
+    def download(self, server_address: tuple[str, int], connection_ids: list[int], output_path: str,
+                 file_manifest: manifest.Manifest = None) -> bool:
+        """
+        Downloads a stripe of a file for each connection ID, while another thread listens.
+        :return: whether every stripe was received
+        """
+        receivers = [self.connect(server_address, connection_id, output_path, file_manifest)
+                     for connection_id in connection_ids]
+        for receiver in receivers:
+            receiver.done.wait()
+        return all(receiver.finished for receiver in receivers)
+
+    def listen(self, filename: str = None, forever: bool = False):
+        """
+        Receives the segments of the downloads and acknowledges them.
+        :param filename: output file of the downloads started by the SYN of an unknown connection, such segments
+        are dropped if None
+        :param forever: whether to keep listening once the downloads are over, for the ones connected later
+        """
+        served = False
+        while forever or not served or self.connections:
+            # Every segment that arrived is handled before the ACKs are sent, a batch of each at a time
+            segments = self.io.receive(udpio.BATCH_SIZE, self.MSS + utils.HEADER_SIZE, CONNECT_INTERVAL)
+            receivers = {}  # in the order they received, without duplicates
+            for segment, client_address in segments:
+                connection_id = utils.connection_id(segment)
+                receiver = self.connections.get(connection_id)
+                if receiver is None:
+                    if filename is None or connection_id is None:
+                        continue
+                    print(f'Accept connection from {client_address}')
+                    receiver = self.connections[connection_id] = FileReceiver(
+                        client_address, filename, self.MSS, self.io, connection_id, self.buffer_capacity,
+                        self.manifest, self.writer_thread)
+                elif receiver.writer is None:  # the SYN may come from another address than the one requested
+                    receiver.client_address = client_address
+                elif client_address != receiver.client_address:
+                    continue
+                receivers[receiver] = None
+                if receiver.receive_segment(segment):
+                    # Like TIME_WAIT, keeps acknowledging the segments sent again by a sender whose last ACKs were
+                    # lost
+                    receiver.lingering_until = time.monotonic() + FIN_LINGER
+            for receiver in receivers:
+                receiver.send_acks()
+            served = served or bool(self.connections)
+            self.__expire()
+
+    def __expire(self):
+        """
+        Removes the downloads that lingered long enough once received, and the ones whose sender never answered,
+        and requests the transfers that did not start yet again.
+        """
+        now = time.monotonic()
+        for connection_id, receiver in list(self.connections.items()):
+            if receiver.finished:
+                if now >= receiver.lingering_until:
+                    del self.connections[connection_id]
+            elif receiver.writer is None and receiver.connect_requests \
+                    and now - receiver.last_request_time >= CONNECT_INTERVAL:
+                if receiver.connect_requests < MAX_CONNECT_REQUESTS:
+                    self.__request(receiver)
+                    continue
+                print(f'No answer from {receiver.client_address}')
+                del self.connections[connection_id]
+                receiver.done.set()
+
+    def __request(self, receiver: FileReceiver):
+        receiver.connect_requests += 1
+        receiver.last_request_time = time.monotonic()
+        try:
+            self.socket.sendto(utils.pack_header(syn=True, connection_id=receiver.connection_id),
+                               receiver.client_address)
+        except OSError:  # like a lost request
+            pass
 
-def get_file(PORT, filename):
-    server = ServerSocket(PORT, 5360)
+
+def get_file(PORT, filename, buffer_capacity: int = DEFAULT_BUFFER_CAPACITY, io_mode: str = None,
+             file_manifest: manifest.Manifest = None, writer_thread: bool = False):
+    server = ServerSocket(PORT, utils.MAX_MSS, buffer_capacity, io_mode, file_manifest, writer_thread)
     server.start(filename)
+
+
+def get_stripe(server_address: tuple[str, int], connection_id: int, filename: str,
+               buffer_capacity: int = DEFAULT_BUFFER_CAPACITY, io_mode: str = None,
+               file_manifest: manifest.Manifest = None, writer_thread: bool = False) -> bool:
+    """
+    Downloads a stripe on a socket of its own, for a stripe received by another process.
+    :return: whether the stripe was received
+    """
+    server = ServerSocket(0, utils.MAX_MSS, buffer_capacity, io_mode, writer_thread=writer_thread)
+    receiver = server.connect(server_address, connection_id, filename, file_manifest)
+    server.listen()
+    return receiver.finished
+
+
+def get_stripes(server_address: tuple[str, int], connection_ids: list[int], filename: str,
+                buffer_capacity: int = DEFAULT_BUFFER_CAPACITY, io_mode: str = None, processes: bool = False,
+                file_manifest: manifest.Manifest = None, server: ServerSocket = None,
+                writer_thread: bool = False) -> bool:
+    """
+    Receives a file sent as a stripe by each transfer, see file_sender.offer_stripes.
+    :param server_address: the address of the endpoint the transfers wait on
+    :param connection_ids: the transfers, one per stripe
+    :param processes: whether to receive each stripe in a process of its own, so the stripes use every CPU
+    :param file_manifest: manifest of the file, to resume a partial download and to verify the file once received
+    :param server: the socket another thread listens on forever, shared with other downloads. One of the download
+    only if None, or with processes
+    :param writer_thread: whether each stripe writes the file from a thread of its own, the server decides if given
+    :return: False if a stripe was not received, or if the file does not match the manifest
+    """
+    count = len(connection_ids)
+    if processes:
+        with concurrent.futures.ProcessPoolExecutor(count) as pool:
+            received = all(pool.map(get_stripe, [server_address] * count, connection_ids, [filename] * count,
+                                    [buffer_capacity] * count, [io_mode] * count, [file_manifest] * count,
+                                    [writer_thread] * count))
+    elif server is not None:
+        received = server.download(server_address, connection_ids, filename, file_manifest)
+    else:
+        server = ServerSocket(0, utils.MAX_MSS, buffer_capacity, io_mode, writer_thread=writer_thread)
+        receivers = [server.connect(server_address, connection_id, filename, file_manifest)
+                     for connection_id in connection_ids]
+        server.listen()
+        received = all(receiver.finished for receiver in receivers)
+    if not received:
+        print(f'{os.path.basename(filename)} was not received')
+        return False
+    if file_manifest is None:
+        return True
+    mismatch = file_manifest.first_mismatch(filename)
+    if mismatch is not None:
+        print(f'{os.path.basename(filename)} is corrupted from byte {mismatch}')
+        return False
+    print(f'{os.path.basename(filename)} verified')
+    return True
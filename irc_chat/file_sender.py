@@ -1,252 +1,1160 @@
+import array
+import collections
+import concurrent.futures
+import functools
 import json
+import mmap
 import os
 import random
+import selectors
 import socket
+import struct
 import threading
 import time
+import traceback
+import typing
 
+import congestion
+import ratelimit
+import timers
+import udpio
 import utils
 
+PAUSE_POLL_INTERVAL = 0.1  # seconds between checks of whether a paused transfer may proceed
+CONNECT_DELAY = 2  # seconds given to the receiver to bind its ports, when the sender connects to it
+ACCEPT_TIMEOUT = 30  # seconds a transfer waits for the connect request of its receiver
+MAX_FIN_RETRIES = 5
+# https://datatracker.ietf.org/doc/html/rfc6298 - bounds of the retransmission timeout, in seconds. The RFC asks for
+# at least 1 second, the minimum of Linux is used instead, so a loss on a fast link does not stall it for long
+INITIAL_RTO = 1.0
+MIN_RTO = 0.2
+MAX_RTO = 60.0
+# https://datatracker.ietf.org/doc/html/rfc8985 - fraction of the RTT a segment may be overtaken by the ones sent after
+# it, before it is taken as lost
+REORDERING_WINDOW = 0.25
+DEFAULT_BUFFER_CAPACITY = 65536
+SOCKET_BUFFER_CAPACITY = 4 << 20  # bytes the kernel buffers for an endpoint shared by many transfers
+RELEASE_CHUNK = 1 << 20  # bytes of acknowledged data given back to the page cache at once
+MAX_ACK_SIZE = 1024  # an ACK carries at most the SACK blocks, or the JSON of the SYN-ACK
+# https://datatracker.ietf.org/doc/html/rfc8899#section-5.1.2
+BASE_PLPMTU = 1200  # datagram size assumed to get through any IPv4 path, segments start at this size
+MAX_PROBES = 3  # probes of a size lost before the size is taken as too large for the path
+SEARCH_GRANULARITY = 16  # bytes, the search ends once the size that got through is this close to the size that did not
+PROBE_PADDING = memoryview(bytes(utils.MAX_DATAGRAM_SIZE))
+
+
+class SenderEngine:
+    """
+    Drives any number of FileSenders from a single thread. The thread sleeps in the selector until an ACK arrives
+    or the earliest retransmission timer is due, so waiting transfers cost no CPU.
+    Transfers may be added from any thread, everything else runs on the thread of run. The selector polls the
+    endpoints of the transfers, which route the ACKs to their transfers.
+    The handlers of a transfer are called through call, so an error in one transfer fails that transfer alone, and
+    the thread goes on with the others.
+    """
+
+    def __init__(self):
+        self.selector = selectors.DefaultSelector()
+        self.timers = timers.TimerWheel()
+        self.transfers: set[FileSender] = set()
+        self.endpoints: set[SenderEndpoint] = set()
+        self.__added = collections.deque()  # transfers added since the last iteration
+        self.__wakeup_receiver, self.__wakeup_sender = socket.socketpair()
+        self.__wakeup_receiver.setblocking(False)
+        self.selector.register(self.__wakeup_receiver, selectors.EVENT_READ)
+
+    def add(self, sender: 'FileSender'):
+        self.__added.append(sender)
+        self.__wakeup_sender.send(b"\0")
+
+    def remove(self, sender: 'FileSender'):
+        self.transfers.discard(sender)
+        endpoint = sender.endpoint
+        endpoint.remove(sender)
+        if endpoint.private:
+            self.endpoints.discard(endpoint)
+            self.selector.unregister(endpoint.socket)
+            endpoint.close()
+
+    def call(self, sender: 'FileSender', handler: typing.Callable, *args):
+        """
+        Calls a handler of a transfer, the transfer fails if the handler raises.
+        """
+        try:
+            handler(*args)
+        except Exception as error:
+            traceback.print_exc()
+            sender.fail(error)
+
+    def schedule(self, sender: 'FileSender', delay: float, handler: typing.Callable[[], None]) -> timers.Timer:
+        """
+        Schedules a timer of a transfer, its handler is called through call.
+        """
+        return self.timers.schedule(delay, functools.partial(self.call, sender, handler))
+
+    def run(self, until_idle: bool = False):
+        """
+        Runs the transfers.
+        :param until_idle: return once every transfer finished, otherwise run forever
+        """
+        while not until_idle or self.transfers or self.__added:
+            while self.__added:
+                sender = self.__added.popleft()
+                self.transfers.add(sender)
+                if sender.endpoint not in self.endpoints:
+                    self.endpoints.add(sender.endpoint)
+                    self.selector.register(sender.endpoint.socket, selectors.EVENT_READ, sender.endpoint)
+                sender.endpoint.add(sender)
+                self.call(sender, sender.attach, self)
+            for key, _ in self.selector.select(self.timers.next_timeout()):
+                if key.fileobj is self.__wakeup_receiver:
+                    self.__wakeup_receiver.recv(4096)
+                elif key.data in self.endpoints:
+                    key.data.on_readable()
+            self.timers.advance()
+
+
+class SenderEndpoint:
+    """
+    UDP socket shared by any number of transfers of an engine. The segments of a transfer carry its connection ID,
+    which routes the ACKs to its FileSender, so hundreds of transfers need a single port and a single socket polled.
+    A transfer created without the address of its receiver starts once the receiver sends a connect request with
+    its connection ID, from the address the segments are then sent to.
+    """
+
+    def __init__(self, port: int = 0, buffer_capacity: int = DEFAULT_BUFFER_CAPACITY, io_mode: str = None,
+                 private: bool = False):
+        """
+        :param port: the port the receivers send their ACKs and connect requests to, any free port if 0
+        :param buffer_capacity: bytes buffered by the socket in each direction, the kernel may allow less than asked
+        :param io_mode: how the segments are batched into syscalls, one of udpio.MODES, the best one if None
+        :param private: whether the endpoint belongs to a single transfer, and is closed along with it
+        """
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.socket.setblocking(False)
+        try:  # datagrams too large for the path are dropped, not fragmented, and the probes find its MTU
+            self.socket.setsockopt(socket.IPPROTO_IP, utils.IP_MTU_DISCOVER, utils.IP_PMTUDISC_PROBE)
+        except OSError:
+            pass
+        # A whole window may be sent, and acknowledged, at once
+        self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, buffer_capacity)
+        self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, buffer_capacity)
+        self.socket.bind(('', port))
+        self.port = self.socket.getsockname()[1]
+        self.io = udpio.DatagramIO(self.socket, io_mode)
+        self.private = private
+        self.closed = False
+        self.transfers: dict[int, FileSender] = {}  # connection ID: transfer
+        self.__ids: set[int] = set()  # connection IDs given out and not released yet
+        self.__ids_lock = threading.Lock()
+
+    def connection_id(self) -> int:
+        """
+        :return: a connection ID no other transfer of the endpoint uses, released once its transfer is removed
+        """
+        with self.__ids_lock:
+            connection_id = utils.new_connection_id()
+            while connection_id in self.__ids:
+                connection_id = utils.new_connection_id()
+            self.__ids.add(connection_id)
+        return connection_id
+
+    def add(self, sender: 'FileSender'):
+        self.transfers[sender.connection_id] = sender
+
+    def remove(self, sender: 'FileSender'):
+        self.transfers.pop(sender.connection_id, None)
+        with self.__ids_lock:
+            self.__ids.discard(sender.connection_id)
+
+    def close(self):
+        self.closed = True
+        self.socket.close()
+
+    def on_readable(self):
+        """
+        Routes every segment received since the last call to its transfer, then lets each transfer that received
+        one send what its window allows.
+        """
+        received = {}  # transfers in the order they received, without duplicates
+        while not self.closed:
+            segments = self.io.receive(udpio.BATCH_SIZE, MAX_ACK_SIZE)
+            if not segments:
+                break
+            for segment, address in segments:
+                sender = self.transfers.get(utils.connection_id(segment))
+                if sender is None:  # a transfer that finished, or not a segment at all
+                    continue
+                if sender.server_address is None:
+                    if utils.is_connect_request(segment):
+                        sender.engine.call(sender, sender.accept, address)
+                elif address == sender.server_address and not utils.is_connect_request(segment):
+                    sender.engine.call(sender, sender.receive, segment)
+                    received[sender] = None
+        for sender in received:
+            sender.engine.call(sender, sender.flush)
+
+
+_engine = None
+_engine_lock = threading.Lock()
+
+
+def shared_engine() -> SenderEngine:
+    """
+    :return: the engine shared by every download of this process, running on its own daemon thread
+    """
+    global _engine
+    with _engine_lock:
+        if _engine is None:
+            _engine = SenderEngine()
+            threading.Thread(target=_engine.run, daemon=True, name="file-sender").start()
+        return _engine
+
+
+class SendWindow:
+    """
+    Ring buffer of the segments between the oldest unacknowledged one and the last one read from the file.
+    Slots are preallocated and addressed by a running segment index, the slot of index i is i % capacity.
+    The oldest segment is at head, the next one to be sent at next_send and the next free slot at tail, so
+    acknowledging, finding the segment to retransmit and finding the next segment to send are all O(1).
+    Every data segment but the last is MSS bytes long, which makes the index of a sequence number
+    (seq - data_seq) / MSS away from the first data segment of that size, see set_MSS.
+    Data segments only keep their header and the position of their data in the file, the data is sent from a
+    memory map of the file, so the window costs the same memory whatever its size.
+
+    The window is also the SACK scoreboard, it records which segments the receiver reported in SACK blocks, and
+    up to which index the holes below them were already retransmitted during the current recovery, and the
+    latest transmission known to be delivered, which tells when a retransmission was lost too.
+    """
+    __slots__ = ("capacity", "MSS", "headers", "offsets", "seqs", "ends", "send_times", "retransmitted", "sacked",
+                 "head", "next_send", "tail", "highest_sacked", "hole_cursor", "delivered_time", "data_seq",
+                 "data_index")
+
+    def __init__(self, capacity: int, MSS: int):
+        self.capacity = capacity
+        self.MSS = MSS
+        self.headers: list[bytes] = [b""] * capacity  # header, followed by the data of the other segments
+        self.offsets = array.array("q", bytes(8 * capacity))  # offset of the data in the file, -1 for other segments
+        self.seqs = array.array("Q", bytes(8 * capacity))  # sequence number of the first byte
+        self.ends = array.array("Q", bytes(8 * capacity))  # sequence number following the last byte
+        self.send_times = array.array("d", bytes(8 * capacity))  # time of the last transmission
+        self.retransmitted = bytearray(capacity)
+        self.sacked = bytearray(capacity)
+        self.head = 0
+        self.next_send = 0
+        self.tail = 0
+        self.highest_sacked = -1  # index of the highest segment reported in a SACK block
+        self.hole_cursor = 0  # holes below this index were retransmitted during the current recovery
+        # Send time of the latest segment SACKed or acknowledged which was sent once, the time of its delivery is
+        # ambiguous otherwise
+        self.delivered_time = 0.0
+        self.data_seq = None  # sequence number of the first data segment
+        self.data_index = 0
+
+    def __len__(self):
+        return self.tail - self.head
+
+    def is_full(self) -> bool:
+        return self.tail - self.head == self.capacity
+
+    def has_unsent(self) -> bool:
+        return self.next_send < self.tail
+
+    def append(self, seq: int, header: bytes, offset: int = -1, length: int = 0):
+        """
+        Adds a segment after the last one, the window must not be full.
+        :param header: header of the segment, followed by its data unless the data is in the file
+        :param offset: offset in the file of the data of a data segment, the first one sets the origin of the index
+        lookup
+        :param length: bytes of data in the file
+        """
+        if offset >= 0 and self.data_seq is None:
+            self.data_seq = seq
+            self.data_index = self.tail
+        slot = self.tail % self.capacity
+        self.headers[slot] = header
+        self.offsets[slot] = offset
+        self.seqs[slot] = seq
+        self.ends[slot] = seq + len(header) - utils.HEADER_SIZE + length
+        self.send_times[slot] = 0
+        self.retransmitted[slot] = 0
+        self.sacked[slot] = 0
+        self.tail += 1
+
+    def seq(self, index: int) -> int:
+        return self.seqs[index % self.capacity]
+
+    def end(self, index: int) -> int:
+        return self.ends[index % self.capacity]
+
+    def header(self, index: int) -> bytes:
+        return self.headers[index % self.capacity]
+
+    def data_range(self, index: int) -> typing.Tuple[int, int]:
+        """
+        :return: the offset and length of the data of the segment in the file, offset -1 if it has none there
+        """
+        slot = index % self.capacity
+        return self.offsets[slot], self.ends[slot] - self.seqs[slot]
+
+    def send_time(self, index: int) -> float:
+        return self.send_times[index % self.capacity]
+
+    def mark_sent(self, index: int, when: float):
+        slot = index % self.capacity
+        if self.send_times[slot]:
+            self.retransmitted[slot] = 1
+        self.send_times[slot] = when
+
+    def is_retransmitted(self, index: int) -> bool:
+        return bool(self.retransmitted[index % self.capacity])
+
+    def is_sacked(self, index: int) -> bool:
+        return bool(self.sacked[index % self.capacity])
+
+    def pop(self):
+        """
+        Drops the oldest segment, once acknowledged.
+        """
+        slot = self.head % self.capacity
+        self.headers[slot] = b""
+        self.__delivered(slot)
+        self.head += 1
+        self.next_send = max(self.next_send, self.head)
+
+    def mark_sacked(self, start: int, end: int):
+        """
+        Records a SACK block, the segments in it do not have to be retransmitted.
+        """
+        index = self.find(start)
+        if index is None:
+            return
+        while index < self.next_send and self.end(index) <= end:
+            slot = index % self.capacity
+            if not self.sacked[slot]:
+                self.sacked[slot] = 1
+                self.__delivered(slot)
+            self.highest_sacked = max(self.highest_sacked, index)
+            index += 1
+
+    def __delivered(self, slot: int):
+        if not self.retransmitted[slot]:
+            self.delivered_time = max(self.delivered_time, self.send_times[slot])
+
+    def is_lost(self, index: int, reordering: float) -> bool:
+        """
+        RACK, a segment sent is lost once a segment sent more than reordering seconds after its last transmission was
+        delivered, which also tells when a retransmission was lost.
+        """
+        slot = index % self.capacity
+        return index < self.next_send and not self.sacked[slot] and \
+            0 < self.send_times[slot] < self.delivered_time - reordering
+
+    def take_holes(self) -> list[int]:
+        """
+        Every segment is examined once per recovery, so this is O(1) per segment.
+        :return: the indexes of the segments below the highest SACKed one that were not SACKed, and were not
+        returned before during the current recovery
+        """
+        stop = min(self.highest_sacked, self.next_send)
+        holes = [index for index in range(max(self.head, self.hole_cursor), stop)
+                 if not self.sacked[index % self.capacity]]
+        self.hole_cursor = max(self.hole_cursor, stop)
+        return holes
+
+    def rewind(self):
+        """
+        Makes every segment after the oldest one unsent again, once a timeout retransmitted the oldest one.
+        """
+        self.next_send = min(self.head + 1, self.tail)
+        self.hole_cursor = self.head
+
+    def new_recovery(self):
+        """
+        Allows every hole to be retransmitted again.
+        """
+        self.hole_cursor = self.head
+
+    def set_MSS(self, MSS: int):
+        """
+        Data segments appended from now on are MSS bytes long. The segments appended before are found by a scan
+        from the oldest one, until they are acknowledged.
+        """
+        self.MSS = MSS
+        self.data_seq = None
+
+    def find(self, seq: int) -> typing.Optional[int]:
+        """
+        :return: the index of the segment starting at seq, None if it is not in the window
+        """
+        if self.data_seq is not None and seq >= self.data_seq:
+            index = self.data_index + (seq - self.data_seq) // self.MSS
+            if index < self.tail and self.seq(index) != seq:  # the FIN follows a short last data segment
+                index += 1
+        else:  # the SYN and the file size come before the data, and the segments before the last change of MSS
+            index = self.head
+            while index < self.tail and self.seq(index) < seq:
+                index += 1
+        if self.head <= index < self.tail and self.seq(index) == seq:
+            return index
+        return None
+
+
+class PathMTUSearch:
+    """
+    Datagram Packetization Layer Path MTU Discovery, RFC 8899. Probes datagram sizes between the base size, which
+    any path is assumed to allow, and the largest size both ends allow, and keeps the largest size acknowledged.
+    The largest size is probed first, so a path that allows the MTU of the interface, like loopback or a LAN, is
+    confirmed within a round trip, the size is found by a binary search otherwise.
+    """
+
+    def __init__(self, base_size: int, max_size: int):
+        self.size = min(base_size, max_size)  # largest datagram size acknowledged
+        self.max_size = max_size  # below the smallest datagram size lost MAX_PROBES times
+        self.probe_size = max_size if max_size > self.size else None  # None once the search ended
+        self.probes = 0  # probes of probe_size lost
+
+    def acknowledged(self, size: int) -> bool:
+        """
+        :param size: datagram size echoed by the ACK of a probe
+        :return: whether size is the new datagram size
+        """
+        if self.probe_size is None or not self.size < size <= self.max_size:
+            return False
+        self.size = size
+        self.__next_probe()
+        return True
+
+    def lost(self):
+        self.probes += 1
+        if self.probes >= MAX_PROBES:
+            self.max_size = self.probe_size - 1
+            self.__next_probe()
+
+    def __next_probe(self):
+        self.probes = 0
+        if self.max_size - self.size < SEARCH_GRANULARITY:
+            self.probe_size = None
+        else:
+            self.probe_size = (self.size + self.max_size + 1) // 2
+
 
 # https://datatracker.ietf.org/doc/html/rfc5681
 class FileSender:
-    def __init__(self, server_address: tuple[str, int], file_path: str, MSS: int,
-                 events: list[threading.Event, threading.Event] = None):
+    def __init__(self, server_address: typing.Optional[tuple[str, int]], file_path: str, MSS: int = None,
+                 events: list[threading.Event, threading.Event] = None,
+                 buffer_capacity: int = DEFAULT_BUFFER_CAPACITY,
+                 sack: bool = True, io_mode: str = None, plpmtud: bool = True,
+                 byte_range: typing.Tuple[int, int] = None, endpoint: 'SenderEndpoint' = None,
+                 congestion_control: str = congestion.NEW_RENO, pacing: bool = True, rate_limit: float = None,
+                 shared_bucket: 'ratelimit.TokenBucket' = None):
+        """
+        :param server_address: the address of the receiver, None to wait for the receiver to send a connect request
+        with the connection ID of the transfer to the endpoint, see SenderEndpoint
+        :param MSS: largest segment size, the one the interface of the route allows if None. The receiver may allow
+        less, see the SYN-ACK
+        :param buffer_capacity: bytes of the file buffered ahead of the acknowledged data, which bounds the window
+        :param sack: whether to use the SACK blocks of the receiver to retransmit every hole at once
+        :param io_mode: how the segments are batched into syscalls, one of udpio.MODES, the best one if None
+        :param plpmtud: whether to start with segments of the base size, and probe the path for larger ones. The
+        largest segment size is used right away otherwise
+        :param byte_range: start and end of the part of the file to send, the receiver writes it at its offset. The
+        whole file if None
+        :param endpoint: the endpoint the transfer shares with others, one of its own if None, and io_mode is then
+        the mode of its own endpoint
+        :param congestion_control: the congestion control of the transfer, one of congestion.ALGORITHMS
+        :param pacing: whether to spread the window over the RTT at the pacing rate of the congestion control, instead
+        of sending it at once
+        :param rate_limit: bytes per second the transfer may send at, unlimited if None
+        :param shared_bucket: token bucket the transfer shares with others, which limits their rate together
+        """
         self.running = False
-        self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-        self.server_address = server_address
+        self.endpoint = endpoint or SenderEndpoint(buffer_capacity=buffer_capacity, io_mode=io_mode, private=True)
+        self.io = self.endpoint.io
+        self.connection_id = self.endpoint.connection_id()
+        self.outgoing = []  # segments sent together once the window slid
+        self.server_address = None  # once known, see __open
 
         self.file_path = file_path
         self.file_name = os.path.basename(file_path)
-        self.file_size = os.path.getsize(file_path)
-        self.file = open(file_path, 'rb')
+        self.total_size = os.path.getsize(file_path)
+        self.range_start, range_end = byte_range or (0, self.total_size)
+        self.file_size = range_end - self.range_start  # bytes sent, the offsets below are relative to the range
+        # The data is sent straight from the page cache, see SendWindow, and given back once acknowledged. The map
+        # starts at the allocation granularity below the range
+        map_start = self.range_start - self.range_start % mmap.ALLOCATIONGRANULARITY
+        self.range_offset = self.range_start - map_start  # offset of the range in the map
+        with open(file_path, 'rb') as file:
+            self.map = mmap.mmap(file.fileno(), range_end - map_start, access=mmap.ACCESS_READ,
+                                 offset=map_start) if self.file_size else None
+        if self.map is not None and hasattr(mmap, 'MADV_SEQUENTIAL'):
+            self.map.madvise(mmap.MADV_SEQUENTIAL)
+        self.view = memoryview(self.map)[self.range_offset:] if self.map is not None else memoryview(b'')
+        self.read_offset = 0  # offset in the range of the next data segment
+        self.resume = 0  # bytes of the range the receiver already has, announced in the SYN-ACK
+        self.released_offset = 0  # the acknowledged data before this offset of the map was given back
+        self.data_seq = None  # sequence number of the first byte of the file
 
-        self.MSS = MSS
-        self.buffer_capacity = 65536
-        self.buffer_segment_amount = int(self.buffer_capacity / self.MSS)
+        self.max_MSS = MSS or utils.MAX_MSS  # bounded by the route to the receiver, see __open
+        self.MSS = None
+        self.plpmtud = plpmtud
+        self.mtu_search = None  # once the receiver announced its MSS
+        self.probe_timer = None
+        self.connected = False  # the data is read once the SYN-ACK settled the MSS
+        self.buffer_capacity = buffer_capacity
+        self.buffer_segment_amount = 0
         # Random initial sequence number according to RFC in order to avoid attacks
-        self.initial_seq_num = random.randint(0, 2 ** 16 - 1)
+        self.initial_seq_num = random.randint(0, utils.SEQ_SPACE - 1)
         self.seq_num = self.initial_seq_num
         self.next_byte_seq_num = self.initial_seq_num
 
         self.progress = 1
         self.duplicate_ack_count = 0
         self.receive_window_size = 0
-        self.timeout_interval = 1.0
-        self.estimated_RTT = 1.0
-        self.deviation_RTT = 0
-        self.congestion_status = utils.CCStatus.SLOW_START
-        self.congestion_window_size = MSS
-        self.ss_threshold = 65536  # RFC 5681 - The initial value of ssthresh SHOULD be set arbitrarily high
+        self.window_scale = 0  # announced by the receiver in the SYN-ACK
+        self.timeout_interval = INITIAL_RTO
+        self.estimated_RTT = None  # until the first RTT is measured
+        self.deviation_RTT = None
+        # RFC 5681 - The initial value of ssthresh SHOULD be set arbitrarily high, the window never exceeds the buffer
+        self.congestion = congestion.create(congestion_control, self.max_MSS, max(buffer_capacity, 65536))
 
         self.alpha = 0.125
         self.beta = 0.25
         self.gamma = 4
 
         self.start_time = time.time()
-        # SYN
-        header = utils.pack_header(sequence_number=self.seq_num, syn=1,
-                                   data=json.dumps({'filename': self.file_name}).encode())
-        # [[SeqNum, Segment, Sent, Start Time]]
-        self.buffer = [[self.next_byte_seq_num, header, False, 5]]
-        self.next_byte_seq_num += len(self.buffer[0][1]) - utils.HEADER_SIZE
+        self.buffer = None  # once the SYN is queued, see __open
+        self.fin_index = None
+        self.sack = sack
+        self.recovery_point = None  # sequence number to be acknowledged for the current fast recovery to end
+        self.pacing = pacing
+        self.buckets = [bucket for bucket in (ratelimit.TokenBucket(rate_limit) if rate_limit else None,
+                                              shared_bucket) if bucket is not None]
+        self.pacing_timer = None
+        self.next_send_time = 0.0  # when the next segment may be sent, if it is paced
+        self.retransmissions = 0
+        self.fin_retries = 0
 
         self.events = events
-
-        self.lock = threading.Lock()
-        funcs = [self.__read_to_buffer, self.__receive_response, self.__detect_timeout, self.__slide_window]
-        self.wait_for_response = [threading.Event() for _ in range(len(funcs))]
-        self.results = [[] for _ in range(len(funcs))]
-        self.pool = [threading.Thread(target=f, args=(self.results[i], self.wait_for_response[i])) for i, f in
-                     enumerate(funcs)]
+        self.paused = False  # waiting for the user to proceed the download
+        self.engine = None
+        self.accept_timer = None  # while waiting for the connect request
+        self.finished = threading.Event()
+        self.done_callbacks: list[typing.Callable[[], None]] = []  # see add_done_callback
+        self.error = None  # that failed the transfer, see fail
+        self.results = [[]]  # [[last byte of the file]]
         self.first_packet = True
+        self.read_finished = False
+        if server_address is not None:
+            self.__open(server_address)
 
     def start(self):
         """
-        Starts the thread pool and waits for the threads to finish.
-        :return: The results of the threads.
+        Runs the transfer on its own engine in the calling thread.
+        :return: The results of the transfer.
+        """
+        engine = SenderEngine()
+        engine.add(self)
+        engine.run(until_idle=True)
+        return self.results
+
+    def attach(self, engine: SenderEngine):
+        """
+        Called by the engine once the transfer is registered, sends the first segments, or waits for the connect
+        request of the receiver.
+        """
+        self.engine = engine
+        if self.server_address is None:
+            self.accept_timer = self.engine.schedule(self, ACCEPT_TIMEOUT, self.__accept_timeout)
+            return
+        self.__start()
+
+    def accept(self, receiver_address: tuple[str, int]):
+        """
+        Called by the endpoint on the connect request of the receiver, starts the transfer to the address of the
+        request.
+        """
+        self.accept_timer.cancel()
+        self.__open(receiver_address)
+        self.__start()
+
+    def receive(self, segment: bytes):
+        """
+        Handles a response routed by the endpoint, a paused transfer handles them too, so the segments in flight when
+        it paused are acknowledged, or retransmitted.
         """
+        if self.running:
+            self.__receive_response(segment)
+
+    def flush(self):
+        """
+        Sends what the window allows, once the endpoint routed every response received.
+        """
+        if self.running:
+            self.__read_to_buffer()
+            self.__slide_window()
+
+    def __open(self, server_address: tuple[str, int]):
+        """
+        Sizes the segments for the route to the receiver, and queues the SYN.
+        """
+        # The responses are told apart by the address they come from, see SenderEndpoint
+        self.server_address = (socket.gethostbyname(server_address[0]), server_address[1])
+        self.max_MSS = min(self.max_MSS, utils.path_mss(self.server_address))
+        self.MSS = min(BASE_PLPMTU - utils.HEADER_SIZE, self.max_MSS) if self.plpmtud else self.max_MSS
+        self.buffer_segment_amount = max(int(self.buffer_capacity / self.MSS), 3)
+        self.congestion.set_MSS(self.MSS)
+        # SYN
+        header = utils.pack_header(sequence_number=self.seq_num, syn=1, connection_id=self.connection_id,
+                                   data=json.dumps({'filename': self.file_name,
+                                                    'window_scale': utils.MAX_WINDOW_SCALE,
+                                                    'mss': self.max_MSS,
+                                                    'offset': self.range_start,
+                                                    'length': self.file_size,
+                                                    'total_size': self.total_size}).encode())
+        self.buffer = SendWindow(self.buffer_segment_amount, self.MSS)
+        self.buffer.append(self.next_byte_seq_num, header)
+        self.next_byte_seq_num = self.buffer.end(0)
+
+    def __start(self):
         self.running = True
-        for t in self.pool:
-            t.start()
         print('Start')
-        for t in self.pool:
-            t.join()
-        return self.results
+        self.start_time = time.time()
+        self.__read_to_buffer()
+        self.__slide_window()
+        self.engine.schedule(self, self.timeout_interval, self.__detect_timeout)
+
+    def __accept_timeout(self):
+        if self.finished.is_set():  # failed before a receiver connected
+            return
+        print(f'No receiver connected to transfer {self.connection_id}')
+        self.__finish()
+
+    def __send(self, index: int):
+        """
+        Queues a segment, the queued segments are sent at once by __send_queued.
+        """
+        window = self.buffer
+        offset, length = window.data_range(index)
+        header = utils.stamp(window.header(index), utils.current_timestamp())
+        if offset < 0:
+            self.outgoing.append((header,))
+        else:
+            self.outgoing.append((header, self.view[offset:offset + length]))
+
+    def __send_probe(self):
+        """
+        Queues a probe of the next datagram size to try, if the search is not over.
+        """
+        size = self.mtu_search.probe_size
+        if size is None:
+            return
+        header = utils.pack_header(sequence_number=size, probe=True, connection_id=self.connection_id,
+                                   timestamp=utils.current_timestamp())
+        self.outgoing.append((header, PROBE_PADDING[:size - utils.HEADER_SIZE]))
+        self.probe_timer = self.engine.schedule(self, self.timeout_interval, self.__probe_timeout)
+
+    def __probe_timeout(self):
+        if not self.running:
+            return
+        self.mtu_search.lost()
+        self.__send_probe()
+        if self.outgoing:
+            self.__send_queued()
+
+    def __receive_probe_ack(self, segment: bytes):
+        try:
+            size = utils.unpack_header(segment)[0]
+        except (ValueError, struct.error):
+            return
+        if self.mtu_search is not None and self.mtu_search.acknowledged(size):
+            self.probe_timer.cancel()
+            self.MSS = size - utils.HEADER_SIZE
+            self.buffer.set_MSS(self.MSS)
+            self.congestion.set_MSS(self.MSS)
+            print(f'Segments of {self.MSS} bytes')
+            self.__send_probe()
+
+    def __send_queued(self):
+        # The segments the socket had no room for are the same as segments lost on the way, they are retransmitted
+        self.endpoint.io.send(self.outgoing, self.server_address)
+        self.outgoing.clear()
+
+    def __read_to_buffer(self):
+        """
+        Adds the next segments of the file to the buffer, until the buffer is full.
+        """
+        if self.first_packet:
+            self.first_packet = False
+            header = utils.pack_header(sequence_number=self.next_byte_seq_num, connection_id=self.connection_id,
+                                       data=json.dumps(self.file_size).encode())
+            self.buffer.append(self.next_byte_seq_num, header)
+            self.next_byte_seq_num = self.buffer.end(self.buffer.tail - 1)
+            self.data_seq = self.next_byte_seq_num
+        while self.connected and not self.read_finished and not self.buffer.is_full() \
+                and self.next_byte_seq_num - self.seq_num < self.buffer_capacity:
+            length = min(self.MSS, self.file_size - self.read_offset)
+            if length == 0:
+                header = utils.pack_header(sequence_number=self.next_byte_seq_num, fin=1, data=b'0',
+                                           connection_id=self.connection_id)
+                self.fin_index = self.buffer.tail
+                self.buffer.append(self.next_byte_seq_num, header)
+                self.read_finished = True
+                if self.file_size:  # Save last byte of the last segment
+                    self.results[0].append(self.view[-1])
+                break
+            header = utils.pack_header(sequence_number=self.next_byte_seq_num, connection_id=self.connection_id)
+            self.buffer.append(self.next_byte_seq_num, header, self.read_offset, length)
+            self.read_offset += length
+            self.next_byte_seq_num += length
 
-    def __read_to_buffer(self, results: list, wait_for_response: threading.Event):
-        """
-        Reads the file to the buffer.
-        :param results: Output of the thread.
-        """
-        while self.running:
-            self.lock.acquire()
-            if self.first_packet:
-                self.first_packet = False
-                header = utils.pack_header(sequence_number=self.next_byte_seq_num,
-                                           data=json.dumps(self.file_size).encode())
-                self.buffer.append([self.next_byte_seq_num, header, False, time.time()])
-                self.next_byte_seq_num += len(self.buffer[-1][1]) - utils.HEADER_SIZE
-            if len(self.buffer) < self.buffer_segment_amount:
-                segment = self.file.read(self.MSS)
-                if len(segment) == 0:
-                    self.file.close()
-                    header = utils.pack_header(sequence_number=self.next_byte_seq_num, fin=1, data=b'0')
-                    self.buffer.append([self.next_byte_seq_num, header, False])  # debugging , time.time()
-                    self.lock.release()
-                    break
-                # Save last byte of the last segment
-                if not len(results):
-                    results.append(segment[-1])
-                else:
-                    results[0] = segment[-1]
-                header = utils.pack_header(sequence_number=self.next_byte_seq_num, data=segment)
-                self.buffer.append([self.next_byte_seq_num, header, False, time.time()])
-                self.next_byte_seq_num += len(self.buffer[-1][1]) - utils.HEADER_SIZE
-            self.lock.release()
-
-    def __switch_CC_state(self, event: utils.CCEvent):
-        """
-        Switches the congestion control state.
+    def __switch_CC_state(self, event: utils.CCEvent, acked: int = 0, sample_RTT: typing.Optional[float] = None):
+        """
+        Tells the congestion control about an event, and retransmits what the event tells is lost.
         :param event: The event that caused the state change.
+        :param acked: bytes acknowledged by an ACK
+        :param sample_RTT: round trip time measured by an ACK, None if it measured none
         """
-        old_status = self.congestion_status
+        congestion = self.congestion
+        old_status = congestion.status
+        in_flight = self.__in_flight()
 
         if event == utils.CCEvent.ACK:
             self.duplicate_ack_count = 0
-            if self.congestion_status == utils.CCStatus.SLOW_START:
-                self.congestion_window_size += self.MSS
-            elif self.congestion_status == utils.CCStatus.CONGESTION_AVOIDANCE:
-                self.congestion_window_size += self.MSS * (self.MSS / self.congestion_window_size)
-            elif self.congestion_status == utils.CCStatus.FAST_RECOVERY:
-                self.congestion_window_size = self.ss_threshold
-                self.congestion_status = utils.CCStatus.CONGESTION_AVOIDANCE
-            else:
-                raise Exception('Unknown congestion status')
+            if sample_RTT is not None:
+                congestion.update_RTT(sample_RTT)
+            congestion.on_ack(acked, sample_RTT, in_flight, time.time())
+            if self.recovery_point is not None and self.seq_num >= self.recovery_point:
+                self.recovery_point = None
+                congestion.on_recovery_end(in_flight)
+            elif self.recovery_point is not None:  # a partial ACK, the data after it was lost too
+                congestion.on_partial_ack(acked)
+                self.__retransmit_partial()
         elif event == utils.CCEvent.TIMEOUT:
             self.duplicate_ack_count = 0
-            self.__retransmit()
-            if self.congestion_status in [utils.CCStatus.SLOW_START, utils.CCStatus.CONGESTION_AVOIDANCE,
-                                          utils.CCStatus.FAST_RECOVERY]:
-                self.ss_threshold = self.congestion_window_size / 2
-                self.congestion_window_size = self.MSS
-                self.congestion_status = utils.CCStatus.SLOW_START
-            else:
-                raise Exception('Unknown congestion status')
+            congestion.on_timeout(in_flight)
+            self.__retransmit_after_timeout()
         elif event == utils.CCEvent.DUP_ACK:
             self.duplicate_ack_count += 1
-            if self.duplicate_ack_count == 3:
+            if self.recovery_point is not None:
+                congestion.on_duplicate_ack()
+                if self.sack:  # holes revealed by the SACK blocks received since the recovery started
+                    self.__retransmit_holes()
+            elif self.duplicate_ack_count == 3 or self.sack and self.__head_lost():
+                # With SACK, as soon as a segment sent after the oldest one was delivered, like RACK
+                congestion.on_fast_retransmit(in_flight)
                 self.__retransmit()
-                if self.congestion_status in [utils.CCStatus.SLOW_START, utils.CCStatus.CONGESTION_AVOIDANCE]:
-                    self.ss_threshold = self.congestion_window_size / 2
-                    self.congestion_window_size = self.ss_threshold + 3
-                    self.congestion_status = utils.CCStatus.CONGESTION_AVOIDANCE
-                elif self.congestion_status == utils.CCStatus.FAST_RECOVERY:
-                    pass
-                else:
-                    raise Exception('Unknown congestion status')
         else:
             raise Exception('Unknown congestion event')
-        if self.congestion_window_size >= self.ss_threshold:
-            self.congestion_status = utils.CCStatus.CONGESTION_AVOIDANCE
-        if old_status is not self.congestion_status:
-            print(f'Congestion status switched from {old_status.name} to {self.congestion_status.name}')
+        if old_status is not congestion.status:
+            print(f'Congestion status switched from {old_status.name} to {congestion.status.name}')
+
+    def __in_flight(self) -> int:
+        """
+        :return: bytes sent and not acknowledged yet
+        """
+        window = self.buffer
+        sent_end = window.seq(window.next_send) if window.has_unsent() else self.next_byte_seq_num
+        return max(sent_end - self.seq_num, 0)
 
     def __retransmit(self):
         """
-        Retransmits the oldest segment in the buffer.
+        Retransmits the oldest segment in the buffer, and starts a fast recovery which lasts until the segments sent
+        so far are ACKed. With SACK, retransmits every hole known to the scoreboard instead, and keeps retransmitting
+        the holes revealed by the next ACKs.
+        """
+        window = self.buffer
+        self.recovery_point = window.end(window.next_send - 1)
+        if self.sack and window.highest_sacked > window.head:
+            window.new_recovery()
+            self.__retransmit_holes()
+            print(f"Retransmitting {self.seq_num} and the holes up to {window.seq(window.highest_sacked)}")
+            return
+        index = window.find(self.seq_num)
+        if index is not None:
+            self.__retransmit_segment(index)
+            if index == window.next_send:  # sent beyond the window, like a window probe
+                window.next_send += 1
+                self.recovery_point = window.end(index)
+            print(f"Retransmitting {self.seq_num}")
+
+    def __retransmit_partial(self):
+        """
+        Retransmits the segment a partial ACK asks for, or with SACK the holes revealed since the recovery started.
+        """
+        window = self.buffer
+        if self.sack and window.highest_sacked > window.head:
+            self.__retransmit_holes()
+            return
+        index = window.find(self.seq_num)
+        if index is not None and index < window.next_send:
+            self.__retransmit_segment(index)
+
+    def __retransmit_after_timeout(self):
+        """
+        Retransmits the oldest segment, the segments sent after it are sent again as the congestion window allows,
+        like go-back-N, since the ACKs of every one of them may have been lost. The SACKed ones are skipped.
         """
-        for segment in self.buffer:
-            if segment[0] == self.seq_num:
-                segment[3] = time.time()
-                self.socket.sendto(segment[1], self.server_address)
-                # self.duplicate_ack_count = 1
-                print(f"Retransmitting {self.seq_num}")
-                self.start_time = time.time()
+        window = self.buffer
+        if len(window):
+            self.__retransmit_segment(window.head)
+            window.rewind()
+            self.recovery_point = None
+            print(f"Retransmitting {self.seq_num}")
+
+    def __retransmit_holes(self):
+        """
+        Retransmits the holes not retransmitted yet, and the oldest segment again once its retransmission was lost
+        too, which would stall the recovery until the timeout otherwise. Only the oldest segment is checked, so it
+        is O(1) per ACK, the holes after it become the oldest one in turn.
+        """
+        window = self.buffer
+        for index in window.take_holes():
+            self.__retransmit_segment(index)
+        if window.is_retransmitted(window.head) and self.__head_lost():
+            self.__retransmit_segment(window.head)
+
+    def __head_lost(self) -> bool:
+        return self.buffer.is_lost(self.buffer.head, REORDERING_WINDOW * (self.estimated_RTT or 0))
+
+    def __retransmit_segment(self, index: int):
+        now = time.time()
+        self.buffer.mark_sent(index, now)
+        self.__send(index)
+        for bucket in self.buckets:
+            bucket.consume(self.__datagram_size(index), now, self)
+        self.retransmissions += 1
+        self.start_time = now
+
+    def __receive_response(self, segment: bytes):
+        """
+        Handles a response from the server and the congestion control state changes.
+        :param segment: The received segment.
+        """
+        if utils.is_probe(segment):
+            self.__receive_probe_ack(segment)
+            return
+        try:
+            _, ack_num, _, syn, _, recv_window, data = utils.unpack_header(segment)
+        except (ValueError, struct.error):  # another version of the protocol, or not a segment at all
+            return
+        ack_num = utils.unwrap_seq(ack_num, self.seq_num)
+        if not self.connected and (syn or ack_num > self.seq_num):
+            # SYN-ACK, the windows of the next ACKs are scaled. Without it, the SYN-ACK was lost
+            self.__connect(json.loads(data.decode()) if syn else {})
+        if self.sack:
+            for start, end in utils.unpack_sack(segment):
+                start = utils.unwrap_seq(start, self.seq_num)
+                self.buffer.mark_sacked(start, utils.unwrap_seq(end, start))
+        if ack_num == self.seq_num:  # If the received segment is the next expected segment
+            self.__switch_CC_state(utils.CCEvent.DUP_ACK)
+        elif ack_num > self.seq_num:
+            acked = ack_num - self.seq_num
+            self.seq_num = ack_num
+            # Print the progress every 5 percent
+            prog_interval = 5
+            prog = self.progress
+            while self.file_size and (self.seq_num - self.initial_seq_num + self.resume) / self.file_size >= \
+                    self.progress * prog_interval / 100:
+                self.progress += 1
+            if self.events and (self.progress - 1) * prog_interval == 50 and not self.events[0].is_set() \
+                    and not self.paused:
+                self.events[1].set()
+                self.__pause()
+            if prog < self.progress:
+                print(f"Sent {(self.progress - 1) * prog_interval}%")
+                if self.estimated_RTT is not None:
+                    print(f"EstimatedRTT={self.estimated_RTT:.4f} DeviationRTT={self.deviation_RTT:.4f} "
+                          f"TimeoutInterval={self.timeout_interval:.4f}")
+            window = self.buffer
+            # The echoed timestamp is the one of the transmission that was acknowledged, even if it was retransmitted
+            _, timestamp_echo = utils.unpack_timestamps(segment)
+            sample_RTT = utils.timestamp_age(timestamp_echo) if timestamp_echo else None
+            now = time.time()
+            while len(window) and window.seq(window.head) < self.seq_num:
+                # Without a timestamp, a SACKed segment reached the receiver long before this ACK, it would inflate
+                # the RTT. Karn's algorithm, the ACK of a retransmitted segment may be the ACK of any of its
+                # transmissions
+                if not timestamp_echo and window.head < window.next_send and not window.is_sacked(window.head) and \
+                        not window.is_retransmitted(window.head):
+                    sample_RTT = now - window.send_time(window.head)
+                if window.head == self.fin_index:
+                    self.__finish()
+                    return
+                window.pop()
+            if sample_RTT is not None:
+                self.__update_timeout_interval(sample_RTT)
+            self.__switch_CC_state(utils.CCEvent.ACK, acked, sample_RTT)
+            self.__release_acknowledged()
+            self.start_time = now  # RFC 6298 5.3 - the timer restarts when new data is acknowledged
+        self.receive_window_size = recv_window if syn else recv_window << self.window_scale
+
+    def __connect(self, receiver_info: dict):
+        """
+        Settles the window scale and the MSS announced by the receiver, and starts the path MTU search.
+        """
+        self.connected = True
+        self.window_scale = receiver_info.get('window_scale', 0)
+        self.max_MSS = min(self.max_MSS, receiver_info.get('mss', self.max_MSS))
+        # The data starts after the part of the range the receiver already has
+        self.resume = self.read_offset = min(receiver_info.get('resume', 0), self.file_size)
+        if self.plpmtud:
+            self.mtu_search = PathMTUSearch(BASE_PLPMTU, self.max_MSS + utils.HEADER_SIZE)
+            self.MSS = self.mtu_search.size - utils.HEADER_SIZE
+            self.__send_probe()
+        else:
+            self.MSS = self.max_MSS
+        self.buffer.set_MSS(self.MSS)
+        self.congestion.set_MSS(self.MSS)
+
+    def __pause(self):
+        """
+        Holds back the segments not sent yet until the user proceeds the transfer, the ones in flight are still
+        acknowledged and retransmitted meanwhile, so the stripes whose FIN is in flight finish.
+        """
+        self.paused = True
+        self.engine.schedule(self, PAUSE_POLL_INTERVAL, self.__check_proceed)
+
+    def __check_proceed(self):
+        if not self.running:
+            return
+        if not self.events[0].is_set():
+            self.engine.schedule(self, PAUSE_POLL_INTERVAL, self.__check_proceed)
+            return
+        self.paused = False
+        self.flush()
+
+    def __release_acknowledged(self):
+        """
+        Gives the pages of the acknowledged data back to the page cache, a chunk at a time, so the memory of the
+        process does not grow with the size of the file.
+        """
+        if self.data_seq is None or not hasattr(mmap, 'MADV_DONTNEED'):
+            return
+        acknowledged = self.range_offset + self.resume + min(self.seq_num - self.data_seq, self.file_size - self.resume)
+        if acknowledged - self.released_offset >= RELEASE_CHUNK:
+            length = (acknowledged - self.released_offset) // mmap.PAGESIZE * mmap.PAGESIZE
+            self.map.madvise(mmap.MADV_DONTNEED, self.released_offset, length)
+            self.released_offset += length
+
+    def add_done_callback(self, callback: typing.Callable[[], None]):
+        """
+        Calls callback once the transfer finished, on the thread of its engine, or right away if it finished already.
+        It may be called twice if the transfer finishes meanwhile.
+        """
+        self.done_callbacks.append(callback)
+        if self.finished.is_set():
+            callback()
+
+    def fail(self, error: Exception):
+        """
+        Ends the transfer after an error in one of its handlers, see SenderEngine.call.
+        """
+        print(f'Transfer {self.connection_id} failed: {error!r}')
+        self.error = error
+        if self.finished.is_set():
+            return
+        try:
+            self.__finish()
+        except Exception:  # the error may have left the transfer half set up
+            traceback.print_exc()
+            self.running = False
+            self.engine.transfers.discard(self)
+            self.endpoint.remove(self)
+            for bucket in self.buckets:
+                bucket.remove(self)
+            self.__set_finished()
+
+    def __finish(self):
+        self.running = False
+        self.outgoing.clear()
+        self.engine.remove(self)
+        for bucket in self.buckets:
+            bucket.remove(self)
+        self.view.release()
+        if self.map is not None:
+            self.map.close()
+        print('Finished')
+        self.__set_finished()
+
+    def __set_finished(self):
+        self.finished.set()
+        for callback in list(self.done_callbacks):
+            callback()
+
+    def __update_timeout_interval(self, sample_RTT: float):
+        """
+        Updates the timeout interval based on the RTT, as in RFC 6298, which also ends the backoff of the timeouts.
+        Every ACK measures the RTT, so the gains are divided by the ACKs expected in an RTT, as RFC 7323 suggests in
+        its appendix G, for the estimate to keep about the same history as with one measurement per RTT.
+        :param sample_RTT: the RTT measured by an ACK
+        """
+        if self.estimated_RTT is None:
+            self.estimated_RTT = sample_RTT
+            self.deviation_RTT = sample_RTT / 2
+        else:
+            expected_samples = max(self.__in_flight() // self.MSS, 1)
+            alpha = self.alpha / expected_samples
+            beta = self.beta / expected_samples
+            self.deviation_RTT = (1 - beta) * self.deviation_RTT + beta * abs(self.estimated_RTT - sample_RTT)
+            self.estimated_RTT = (1 - alpha) * self.estimated_RTT + alpha * sample_RTT
+        # The timer is not more precise than a tick of the timer wheel
+        timeout_interval = self.estimated_RTT + max(timers.TICK, self.gamma * self.deviation_RTT)
+        self.timeout_interval = min(max(timeout_interval, MIN_RTO), MAX_RTO)
+
+    def __detect_timeout(self):
+        """
+        Retransmission timer, fires once the timeout interval passed since the oldest segment in flight was sent, the
+        last retransmission, or the last ACK of new data. Reschedules itself instead of being moved on every ACK.
+        It does not fire while nothing is in flight, the next segment then waits for the pacing or a token bucket, not
+        for an ACK.
+        """
+        if not self.running:
+            return
+        remaining = self.start_time + self.timeout_interval - time.time()
+        if remaining <= 0 and self.buffer.next_send == self.buffer.head:
+            remaining = self.timeout_interval
+        elif remaining <= 0:
+            if self.buffer.head == self.fin_index:
+                # Only the FIN is left, its ACK may be lost for good once the receiver closed its port
+                self.fin_retries += 1
+                if self.fin_retries > MAX_FIN_RETRIES:
+                    self.__finish()
+                    return
+            self.__switch_CC_state(utils.CCEvent.TIMEOUT)
+            # RFC 6298 5.5 - backs off until an ACK measures the RTT again
+            self.timeout_interval = min(self.timeout_interval * 2, MAX_RTO)
+            self.__slide_window()
+            remaining = self.timeout_interval
+        self.engine.schedule(self, max(remaining, 0), self.__detect_timeout)
+
+    def __slide_window(self):
+        """
+        Sends the buffered segments allowed by the flow and congestion control windows. Paced segments, and segments
+        the token buckets do not allow yet, are left to a timer instead, which sends them a tick at a time, so the
+        window is spread over the RTT instead of overflowing the queues on the path in a burst.
+        """
+        window = self.buffer
+        limit = self.seq_num + min(self.receive_window_size, self.congestion.window)
+        rate = self.congestion.pacing_rate() if self.pacing else None
+        now = time.time()
+        for bucket in self.buckets:
+            share = bucket.share(now)
+            if share is not None:
+                rate = share if rate is None else min(rate, share)
+        while window.has_unsent() and window.seq(window.next_send) <= limit:  # Flow Control
+            index = window.next_send
+            if window.is_sacked(index):  # sent again after a timeout, but the receiver has it already
+                window.next_send += 1
+                continue
+            if self.paused and not window.send_time(index):  # only what was in flight is sent again
+                break
+            now = time.time()
+            size = self.__datagram_size(index)
+            wait = self.next_send_time - now if rate is not None else 0
+            for bucket in self.buckets:
+                wait = max(wait, bucket.delay(size, now))
+            if wait > 0:
+                if self.pacing_timer is None:
+                    self.pacing_timer = self.engine.schedule(self, wait, self.__paced_send)
                 break
+            window.next_send += 1
+            if window.send_time(index):
+                self.retransmissions += 1
+            if index == window.head:  # RFC 6298 5.1 - nothing was in flight, the timer starts
+                self.start_time = now
+            window.mark_sent(index, now)
+            self.__send(index)
+            for bucket in self.buckets:
+                bucket.consume(size, now, self)
+            if rate is not None:
+                # The timer fires up to a tick late, the segments of that tick are sent at once
+                self.next_send_time = max(self.next_send_time, now - timers.TICK) + size / rate
+        if self.outgoing:
+            self.__send_queued()
+
+    def __datagram_size(self, index: int) -> int:
+        window = self.buffer
+        return window.end(index) - window.seq(index) + utils.HEADER_SIZE
+
+    def __paced_send(self):
+        self.pacing_timer = None
+        self.flush()
+
+
+def stripe_ranges(file_size: int, streams: int) -> list[tuple[int, int]]:
+    """
+    :return: the byte ranges of the stripes of a file, as equal as the pages allow
+    """
+    pages = -(-file_size // mmap.PAGESIZE)
+    bounds = [min(pages * i // streams * mmap.PAGESIZE, file_size) for i in range(streams)] + [file_size]
+    return list(zip(bounds, bounds[1:]))
+
+
+def send_range(server_address: tuple[str, int], filename: str, byte_range: tuple[int, int],
+               buffer_capacity: int = DEFAULT_BUFFER_CAPACITY, io_mode: str = None,
+               congestion_control: str = congestion.NEW_RENO):
+    """
+    Sends a byte range of a file on an engine of its own, for a stripe sent by another process.
+    """
+    sender = FileSender(server_address, filename, buffer_capacity=buffer_capacity, io_mode=io_mode,
+                        byte_range=byte_range, congestion_control=congestion_control)
+    return sender.start()
+
+
+def offer_stripes(endpoint: SenderEndpoint, filename: str, streams: int,
+                  wait_events: list[threading.Event, threading.Event] = None,
+                  buffer_capacity: int = DEFAULT_BUFFER_CAPACITY,
+                  congestion_control: str = congestion.NEW_RENO, rate_limit: float = None,
+                  shared_bucket: ratelimit.TokenBucket = None) -> list[FileSender]:
+    """
+    Stripes a file across transfers that wait on a shared endpoint for their receivers, each starts once a receiver
+    sends a connect request with its connection ID, see file_receiver.ServerSocket.connect.
+    :param rate_limit: bytes per second the stripes may send at together, unlimited if None
+    :param shared_bucket: token bucket the stripes share with other transfers
+    :return: the transfers, in the order of their byte ranges
+    """
+    ranges = stripe_ranges(os.path.getsize(filename), streams)
+    senders = [FileSender(None, filename, events=wait_events, buffer_capacity=buffer_capacity, byte_range=byte_range,
+                          endpoint=endpoint, congestion_control=congestion_control,
+                          rate_limit=rate_limit / len(ranges) if rate_limit else None, shared_bucket=shared_bucket)
+               for byte_range in ranges]
+    for sender in senders:
+        shared_engine().add(sender)
+    return senders
+
 
-    def __receive_response(self, results: list, wait_for_response: threading.Event):
-        """
-        Receives the response from the server and handles congestion control state changes.
-        :param results: Output of the thread.
-        """
-        while self.running:
-            segment = self.socket.recvfrom(self.MSS + utils.HEADER_SIZE)[0]
-            self.lock.acquire()
-            _, ack_num, _, _, _, recv_window, _ = utils.unpack_header(segment)
-            if ack_num == self.seq_num:  # If the received segment is the next expected segment
-                self.__switch_CC_state(utils.CCEvent.DUP_ACK)
-            elif ack_num > self.seq_num:
-                self.seq_num = ack_num
-                self.__switch_CC_state(utils.CCEvent.ACK)
-                # Print the progress every 5 percent
-                prog_interval = 5
-                prog = self.progress
-                while (self.seq_num - self.initial_seq_num) / self.file_size >= self.progress * prog_interval / 100:
-                    self.progress += 1
-                if self.events and (self.progress - 1) * prog_interval == 50:
-                    self.events[1].set()
-                    self.events[0].wait()
-                if prog < self.progress:
-                    print(f"Sent {(self.progress - 1) * prog_interval}%")
-                    print(
-                        f"EstimatedRTT={self.estimated_RTT:.2f} DeviationRTT={self.deviation_RTT:.2f} TimeoutInterval={self.timeout_interval:.2f}")
-                while len(self.buffer) and self.buffer[0][0] < self.seq_num:
-                    self.__update_timeout_interval(self.buffer[0][3])
-                    seg = self.buffer.pop(0)
-                    _, _, _, syn, fin, _, data = utils.unpack_header(seg[1])
-                    if len(self.buffer) == 0 and fin and not syn:
-                        self.running = False
-                        self.socket.close()
-                        print('Finished')
-            self.receive_window_size = recv_window
-            self.start_time = time.time()
-            self.lock.release()
-
-    def __update_timeout_interval(self, start_time: float):
-        """
-        Updates the timeout interval based on the RTT.
-        :param start_time: Time when the segment was sent.
-        """
-        end_time = time.time()
-        sample_RTT = end_time - start_time
-        self.estimated_RTT = (1 - self.alpha) * self.estimated_RTT + self.alpha * sample_RTT
-        self.deviation_RTT = (1 - self.beta) * self.deviation_RTT + self.beta * abs(sample_RTT - self.estimated_RTT)
-        self.timeout_interval = self.estimated_RTT + self.gamma * self.deviation_RTT
-
-    def __detect_timeout(self, results: list, wait_for_response: threading.Event):
-        """
-        Detects if the timeout interval has been exceeded.
-        :param results: Output of the thread.
-        """
-        while self.running:
-            self.lock.acquire()
-            if time.time() - self.start_time > self.timeout_interval:
-                self.__switch_CC_state(utils.CCEvent.TIMEOUT)
-            self.lock.release()
-
-    def __slide_window(self, results: list, wait_for_response: threading.Event):
-        """
-        Slides the window based on the congestion control state.
-        :param results: Output of the thread.
-        """
-        while self.running:
-            self.lock.acquire()
-            for seg in self.buffer:
-                # Flow Control
-                if not seg[2] and seg[0] - self.seq_num <= min(self.receive_window_size, self.congestion_window_size):
-                    seg.append(time.time())
-                    self.socket.sendto(seg[1], self.server_address)
-                    self.start_time = time.time()
-                    seg[2] = True
-                elif not seg[2]:
-                    break
-            self.lock.release()
+def send_stripes(server_addresses: list[tuple[str, int]], filename: str,
+                 wait_events: list[threading.Event, threading.Event] = None,
+                 buffer_capacity: int = DEFAULT_BUFFER_CAPACITY, io_mode: str = None, processes: bool = False,
+                 connect_delay: float = CONNECT_DELAY, congestion_control: str = congestion.NEW_RENO):
+    """
+    Sends a file striped across one transfer per address, each with its own byte range and congestion window. The
+    receivers are given connect_delay to bind their ports.
+    :param processes: whether to send each stripe from a process of its own, so the stripes use every CPU. The
+    wait events do not pause such stripes
+    :return: the results of the transfer of the last stripe, which end with the last byte of the file
+    """
+    time.sleep(connect_delay)
+    ranges = stripe_ranges(os.path.getsize(filename), len(server_addresses))
+    if processes:
+        with concurrent.futures.ProcessPoolExecutor(len(server_addresses)) as pool:
+            return list(pool.map(send_range, server_addresses, [filename] * len(ranges), ranges,
+                                 [buffer_capacity] * len(ranges), [io_mode] * len(ranges),
+                                 [congestion_control] * len(ranges)))[-1]
+    senders = [FileSender(address, filename, events=wait_events, buffer_capacity=buffer_capacity, io_mode=io_mode,
+                          byte_range=byte_range, congestion_control=congestion_control)
+               for address, byte_range in zip(server_addresses, ranges)]
+    for sender in senders:
+        shared_engine().add(sender)
+    for sender in senders:
+        sender.finished.wait()
+    return senders[-1].results
 
 
 def send_file(server_address: tuple[str, int], filename: str,
-              wait_events: list[threading.Event, threading.Event] = None):
-    time.sleep(2)
-    client = FileSender(server_address, filename, MSS=1024, events=wait_events)
-    out = client.start()
-    return out
+              wait_events: list[threading.Event, threading.Event] = None,
+              buffer_capacity: int = DEFAULT_BUFFER_CAPACITY, io_mode: str = None,
+              congestion_control: str = congestion.NEW_RENO):
+    return send_stripes([server_address], filename, wait_events, buffer_capacity, io_mode,
+                        congestion_control=congestion_control)
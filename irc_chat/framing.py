@@ -0,0 +1,140 @@
+import socket
+import struct
+import typing
+
+# https://datatracker.ietf.org/doc/html/rfc1459#section-2.3
+LINE = "line"
+LENGTH = "length"
+MODES = (LINE, LENGTH)
+
+DELIMITER = b"\r\n"
+LENGTH_FORMAT = "!I"
+LENGTH_SIZE = struct.calcsize(LENGTH_FORMAT)
+MAX_FRAME_SIZE = 1 << 20
+INITIAL_CAPACITY = 4096
+
+
+class FramingError(ValueError):
+    pass
+
+
+def encode(message: bytes, mode: str = LINE) -> bytes:
+    """
+    Frames a single message for the wire.
+    :param message: message to be framed
+    :param mode: LINE for CR-LF delimited messages, LENGTH for length-prefixed messages
+    :return: the framed message
+    """
+    if mode == LENGTH:
+        return b"".join((struct.pack(LENGTH_FORMAT, len(message)), message))
+    return b"".join((message, DELIMITER))
+
+
+class FrameReader:
+    """
+    Incremental per-connection parser.
+
+    Data is received straight into a reusable bytearray, and complete messages are returned as memoryview
+    slices of it. A returned message is only valid until the next call to recv_into, feed or get_buffer.
+    """
+
+    def __init__(self, mode: str = LINE, capacity: int = INITIAL_CAPACITY, max_frame_size: int = MAX_FRAME_SIZE):
+        if mode not in MODES:
+            raise FramingError(f"Unknown framing mode {mode}")
+        self.mode = mode
+        self.max_frame_size = max_frame_size
+        self.__buffer = bytearray(capacity)
+        self.__start = 0  # first byte that was not returned as a message yet
+        self.__end = 0  # end of the received data
+        self.__scanned = 0  # bytes after __start already searched for a delimiter
+
+    def __len__(self):
+        return self.__end - self.__start
+
+    def get_buffer(self, size_hint: int = -1) -> memoryview:
+        """
+        Returns the free tail of the buffer to receive data into, see asyncio.BufferedProtocol.
+        :param size_hint: minimal amount of free space wanted
+        """
+        self.__reserve(max(size_hint, INITIAL_CAPACITY // 4))
+        return memoryview(self.__buffer)[self.__end:]
+
+    def buffer_updated(self, nbytes: int):
+        self.__end += nbytes
+
+    def recv_into(self, sock: socket.socket) -> int:
+        """
+        Receives once from the socket into the buffer.
+        :return: the number of bytes received, 0 if the peer closed the connection
+        """
+        nbytes = sock.recv_into(self.get_buffer())
+        self.buffer_updated(nbytes)
+        return nbytes
+
+    def feed(self, data: bytes):
+        self.__reserve(len(data))
+        self.__buffer[self.__end:self.__end + len(data)] = data
+        self.__end += len(data)
+
+    def next_frame(self) -> typing.Optional[memoryview]:
+        """
+        Returns the next complete message, or None if more data is needed.
+        """
+        if self.mode == LENGTH:
+            return self.__next_length_frame()
+        return self.__next_line_frame()
+
+    def __iter__(self) -> typing.Iterator[memoryview]:
+        frame = self.next_frame()
+        while frame is not None:
+            yield frame
+            frame = self.next_frame()
+
+    def __next_line_frame(self) -> typing.Optional[memoryview]:
+        start = self.__start
+        i = self.__buffer.find(b"\n", start + self.__scanned, self.__end)
+        if i < 0:
+            self.__scanned = self.__end - start
+            if self.__scanned > self.max_frame_size:
+                raise FramingError(f"Message exceeds {self.max_frame_size} bytes")
+            return None
+        self.__start = i + 1
+        self.__scanned = 0
+        if i > start and self.__buffer[i - 1] == DELIMITER[0]:
+            i -= 1
+        return memoryview(self.__buffer)[start:i]
+
+    def __next_length_frame(self) -> typing.Optional[memoryview]:
+        start = self.__start
+        if self.__end - start < LENGTH_SIZE:
+            return None
+        size, = struct.unpack_from(LENGTH_FORMAT, self.__buffer, start)
+        if size > self.max_frame_size:
+            raise FramingError(f"Message exceeds {self.max_frame_size} bytes")
+        start += LENGTH_SIZE
+        if self.__end - start < size:
+            return None
+        self.__start = start + size
+        return memoryview(self.__buffer)[start:start + size]
+
+    def __reserve(self, size: int):
+        """
+        Makes room for at least size more bytes, moving unread data to the front of the buffer first.
+        """
+        if self.__start == self.__end:
+            self.__start = self.__end = 0
+        if len(self.__buffer) - self.__end >= size:
+            return
+        pending = self.__end - self.__start
+        if self.__start:
+            self.__buffer[:pending] = self.__buffer[self.__start:self.__end]
+            self.__start, self.__end = 0, pending
+        if len(self.__buffer) - self.__end >= size:
+            return
+        capacity = max(len(self.__buffer) * 2, pending + size)
+        try:
+            self.__buffer.extend(bytes(capacity - len(self.__buffer)))
+        except BufferError:  # a returned message still references the buffer
+            buffer = bytearray(capacity)
+            buffer[:pending] = self.__buffer[:pending]
+            self.__buffer = buffer
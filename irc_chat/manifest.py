@@ -0,0 +1,82 @@
+import functools
+import hashlib
+import os
+import typing
+
+CHUNK_SIZE = 1 << 20
+DIGEST_SIZE = 16  # bytes of the BLAKE2b digest of a chunk
+CACHE_SIZE = 256  # files whose manifest is kept
+
+
+class Manifest:
+    """
+    BLAKE2b digests of the chunks of a file, which tell the parts of a partial download that are already right, so
+    the download resumes after them, and verify the file once it is complete.
+    """
+    __slots__ = ("file_size", "chunk_size", "digests")
+
+    def __init__(self, file_size: int, digests: typing.List[str], chunk_size: int = CHUNK_SIZE):
+        self.file_size = file_size
+        self.chunk_size = chunk_size
+        self.digests = digests  # hexadecimal, one per chunk, the last chunk may be shorter
+
+    def encode(self) -> str:
+        return ",".join(self.digests)
+
+    @classmethod
+    def decode(cls, file_size: str, chunk_size: str, digests: str) -> 'Manifest':
+        return cls(int(file_size), digests.strip().split(","), int(chunk_size))
+
+    def verified_end(self, path: str, start: int, end: int) -> int:
+        """
+        :return: the end of the part of the range of the file at path that matches the manifest, start if none
+        """
+        position = start
+        try:
+            with open(path, "rb") as file:
+                while position < end:
+                    index = position // self.chunk_size
+                    if not self.__chunk_matches(file, index):
+                        break
+                    position = min((index + 1) * self.chunk_size, end)
+        except FileNotFoundError:
+            pass
+        return position
+
+    def first_mismatch(self, path: str) -> typing.Optional[int]:
+        """
+        :return: the offset of the first chunk of the file at path that does not match the manifest, None if the
+        whole file does
+        """
+        if os.path.getsize(path) != self.file_size:
+            return 0
+        end = self.verified_end(path, 0, self.file_size)
+        return end if end < self.file_size else None
+
+    def __chunk_matches(self, file: typing.BinaryIO, index: int) -> bool:
+        start = index * self.chunk_size
+        length = min(self.chunk_size, self.file_size - start)
+        file.seek(start)
+        data = file.read(length)
+        return len(data) == length and chunk_digest(data) == self.digests[index]
+
+
+def chunk_digest(data: bytes) -> str:
+    return hashlib.blake2b(data, digest_size=DIGEST_SIZE).hexdigest()
+
+
+@functools.lru_cache(maxsize=CACHE_SIZE)
+def _compute(path: str, mtime_ns: int, file_size: int) -> Manifest:
+    digests = []
+    with open(path, "rb") as file:
+        while chunk := file.read(CHUNK_SIZE):
+            digests.append(chunk_digest(chunk))
+    return Manifest(file_size, digests)
+
+
+def file_manifest(path: str) -> Manifest:
+    """
+    :return: the manifest of the file at path, computed again only once the file changed
+    """
+    stat = os.stat(path)
+    return _compute(os.path.abspath(path), stat.st_mtime_ns, stat.st_size)
@@ -0,0 +1,99 @@
+import collections
+import itertools
+import os
+import socket
+import threading
+
+DROP = "drop"
+DISCONNECT = "disconnect"
+POLICIES = (DROP, DISCONNECT)
+
+HIGH_WATERMARK = 256 * 1024
+LOW_WATERMARK = 64 * 1024
+
+try:
+    IOV_MAX = os.sysconf("SC_IOV_MAX")  # most buffers a single sendmsg accepts
+except (AttributeError, ValueError, OSError):
+    IOV_MAX = 1024
+
+
+class SlowConsumerError(Exception):
+    pass
+
+
+class OutboundQueue:
+    """
+    Bounded outbound buffer of a single non-blocking connection.
+
+    Once the queued bytes reach the high watermark the connection is throttled until it drains below the low
+    watermark. While throttled, new messages are dropped or SlowConsumerError is raised, according to the policy.
+    """
+
+    def __init__(self, high_watermark: int = HIGH_WATERMARK, low_watermark: int = LOW_WATERMARK,
+                 policy: str = DROP):
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown slow consumer policy {policy}")
+        if low_watermark > high_watermark:
+            raise ValueError("Low watermark cannot be above the high watermark")
+        self.high_watermark = high_watermark
+        self.low_watermark = low_watermark
+        self.policy = policy
+        self.size = 0
+        self.dropped = 0
+        self.throttled = False
+        self.__queue = collections.deque()
+        self.__lock = threading.Lock()  # downloads reply from their own threads
+
+    def __len__(self):
+        return self.size
+
+    def __bool__(self):
+        return self.size > 0
+
+    def push(self, data: bytes) -> bool:
+        """
+        Queues data to be sent.
+        :param data: data to be queued
+        :return: True if the data was queued, False if it was dropped
+        :raises SlowConsumerError: if the connection is throttled and the policy is DISCONNECT
+        """
+        with self.__lock:
+            if self.throttled:
+                if self.policy == DISCONNECT:
+                    raise SlowConsumerError(f"Outbound queue exceeded {self.high_watermark} bytes")
+                self.dropped += 1
+                return False
+            self.__queue.append(data)
+            self.size += len(data)
+            if self.size >= self.high_watermark:
+                self.throttled = True
+            return True
+
+    def flush(self, sock: socket.socket) -> bool:
+        """
+        Sends as much queued data as the socket accepts without blocking.
+        Queued messages are gathered into a single sendmsg call, up to IOV_MAX of them at a time, and are never
+        copied. A partially sent message is replaced by a memoryview of its remaining bytes.
+        :param sock: non-blocking socket of the connection
+        :return: True if the queue is empty, False if the socket has to become writable first
+        """
+        with self.__lock:
+            queue = self.__queue
+            gather = hasattr(sock, "sendmsg")
+            while queue:
+                try:
+                    if gather and len(queue) > 1:
+                        sent = sock.sendmsg(itertools.islice(queue, IOV_MAX))
+                    else:
+                        sent = sock.send(queue[0])
+                except (BlockingIOError, InterruptedError):
+                    break
+                self.size -= sent
+                while queue and sent >= len(queue[0]):
+                    sent -= len(queue.popleft())
+                if sent:  # the socket buffer is full
+                    queue[0] = memoryview(queue[0])[sent:]
+                    break
+            if self.throttled and self.size <= self.low_watermark:
+                self.throttled = False
+            return not queue
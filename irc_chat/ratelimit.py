@@ -0,0 +1,67 @@
+import typing
+
+import timers
+import utils
+
+IDLE_TIME = 0.1  # seconds after which a transfer that sent nothing no longer takes a share of the rate
+
+
+class TokenBucket:
+    """
+    Limits the rate of the datagrams of the transfers that share the bucket. Tokens are bytes, they accumulate at the
+    rate up to the burst, and a datagram may be sent once the bucket holds its size. Retransmissions are sent at once
+    and put the bucket in debt, which delays the next datagrams instead.
+    While the bucket is not full, the transfers that sent lately each get an equal share of the rate, so the ones whose
+    timers happen to fire first do not take every token.
+    Only used from the thread of the engine of the transfers, see file_sender.SenderEngine.
+    """
+    __slots__ = ("rate", "burst", "tokens", "last_update", "senders")
+
+    def __init__(self, rate: float, burst: int = None):
+        """
+        :param rate: bytes per second
+        :param burst: bytes sent at once after an idle period, at least what the rate allows in a couple of ticks of
+        the timer wheel, which is how late a waiting transfer may wake up
+        """
+        if rate <= 0:
+            raise ValueError("The rate of a token bucket must be positive")
+        self.rate = rate
+        self.burst = burst or max(int(2 * rate * timers.TICK), utils.MAX_DATAGRAM_SIZE)
+        self.tokens = float(self.burst)
+        self.last_update = None
+        self.senders = {}  # sender: time of its last datagram
+
+    def __refill(self, now: float):
+        if self.last_update is not None:
+            self.tokens = min(self.burst, self.tokens + (now - self.last_update) * self.rate)
+        self.last_update = now
+
+    def delay(self, size: int, now: float) -> float:
+        """
+        :return: seconds until size bytes may be sent, 0 if they may be sent now
+        """
+        self.__refill(now)
+        return max(min(size, self.burst) - self.tokens, 0) / self.rate
+
+    def consume(self, size: int, now: float, sender: object = None):
+        self.__refill(now)
+        self.tokens -= size
+        self.senders[sender] = now
+
+    def remove(self, sender: object):
+        """
+        Forgets a transfer once it is over, its share goes to the others at once and the bucket no longer keeps it.
+        """
+        self.senders.pop(sender, None)
+
+    def share(self, now: float) -> typing.Optional[float]:
+        """
+        :return: bytes per second each transfer may send at while the bucket is drained, None while it is full
+        """
+        self.__refill(now)
+        if self.tokens >= self.burst:
+            return None
+        for sender, last_sent in list(self.senders.items()):
+            if now - last_sent > IDLE_TIME:
+                del self.senders[sender]
+        return self.rate / max(len(self.senders), 1)
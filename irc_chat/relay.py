@@ -0,0 +1,156 @@
+import collections
+import select
+import socket
+import struct
+import time
+import typing
+
+import framing
+
+# Operations carried between server processes
+CLAIM = 1  # nick, old nick -> RESULT ok
+RELEASE = 2  # nick
+LOOKUP = 3  # nick -> RESULT ok
+LIST = 4  # -> RESULT nick...
+BROADCAST = 5  # message
+PRIVATE = 6  # nick, message
+RESULT = 7  # field...
+HELLO = 8  # node name, first message on a link between nodes
+KILL = 9  # nick, a user lost its nickname to a user of another node
+CHANNEL = 10  # channel, message
+
+FIELD_FORMAT = "!I"
+FIELD_SIZE = struct.calcsize(FIELD_FORMAT)
+OK = b"1"
+REQUEST_TIMEOUT = 5.0  # seconds a server process waits for the result of a request
+
+Message = typing.Tuple[int, typing.List[bytes]]
+
+
+def pack(op: int, *fields: bytes) -> bytes:
+    """
+    Encodes an operation and its fields as a single length-prefixed frame.
+    """
+    parts = [bytes((op,))]
+    for field in fields:
+        parts.append(struct.pack(FIELD_FORMAT, len(field)))
+        parts.append(field)
+    return framing.encode(b"".join(parts), framing.LENGTH)
+
+
+def unpack(frame: memoryview) -> Message:
+    op = frame[0]
+    fields = []
+    offset = 1
+    while offset < len(frame):
+        size, = struct.unpack_from(FIELD_FORMAT, frame, offset)
+        offset += FIELD_SIZE
+        fields.append(bytes(frame[offset:offset + size]))
+        offset += size
+    return op, fields
+
+
+class RelayConnection:
+    """
+    Link to another server process. Outgoing messages are batched and written with a single send on flush.
+    """
+
+    def __init__(self, sock: socket.socket):
+        self.socket = sock
+        self.reader = framing.FrameReader(framing.LENGTH)
+        self.__batch = []
+
+    def fileno(self) -> int:
+        return self.socket.fileno()
+
+    def send(self, op: int, *fields: bytes):
+        self.__batch.append(pack(op, *fields))
+
+    def send_frame(self, frame: bytes):
+        self.__batch.append(frame)
+
+    def take_batch(self) -> bytes:
+        data = b"".join(self.__batch)
+        self.__batch.clear()
+        return data
+
+    def flush(self):
+        if self.__batch:
+            self.socket.sendall(self.take_batch())
+
+    def receive(self) -> typing.List[Message]:
+        """
+        Receives once and returns every complete message.
+        :raises ConnectionError: if the other side closed the link
+        """
+        if not self.reader.recv_into(self.socket):
+            raise ConnectionError("Relay link closed")
+        return [unpack(frame) for frame in self.reader]
+
+    def close(self):
+        self.socket.close()
+
+
+class RequestLink(RelayConnection):
+    """
+    Relay connection that can also wait for the result of a request. Messages received while waiting are kept
+    and returned by the next call to process. The results of the requests that timed out are dropped when they
+    come, the results come in the order of the requests.
+    """
+
+    def __init__(self, sock: socket.socket):
+        super().__init__(sock)
+        self.__pending = collections.deque()
+        self.__late_results = 0
+
+    def has_pending(self) -> bool:
+        return bool(self.__pending)
+
+    def request(self, op: int, *fields: bytes, timeout: float = REQUEST_TIMEOUT) -> typing.List[bytes]:
+        """
+        Sends a request and waits for its result.
+        :param timeout: seconds to wait for the result
+        :raises TimeoutError: if the result did not come in time
+        :raises ConnectionError: if the other side closed the link
+        """
+        self.send(op, *fields)
+        self.flush()
+        deadline = time.monotonic() + timeout
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 or not select.select([self.socket], [], [], remaining)[0]:
+                self.__late_results += 1
+                raise TimeoutError(f"No result of the relay request in {timeout} seconds")
+            messages = self.receive()
+            for i, (message_op, message_fields) in enumerate(messages):
+                if message_op == RESULT and not self.__late_results:
+                    self.__pending.extend(messages[i + 1:])
+                    return message_fields
+                if message_op == RESULT:
+                    self.__late_results -= 1
+                else:
+                    self.__pending.append((message_op, message_fields))
+
+    def process(self) -> typing.List[Message]:
+        """
+        Returns the messages kept while waiting for a request, followed by newly received ones.
+        """
+        messages = list(self.__pending)
+        self.__pending.clear()
+        return messages + self.__drop_late_results(self.receive())
+
+    def process_pending(self) -> typing.List[Message]:
+        messages = list(self.__pending)
+        self.__pending.clear()
+        return messages
+
+    def __drop_late_results(self, messages: typing.List[Message]) -> typing.List[Message]:
+        if not self.__late_results:
+            return messages
+        kept = []
+        for message in messages:
+            if message[0] == RESULT and self.__late_results:
+                self.__late_results -= 1
+            else:
+                kept.append(message)
+        return kept
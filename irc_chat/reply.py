@@ -4,13 +4,62 @@ import command
 
 
 class Reply:
+    __slots__ = ("__type", "__prefix", "__suffix", "__message", "reply_code", "token", "wire_prefix", "__text",
+                 "__bytes")
+
     def __init__(self, reply_type: str = "RPL", reply_prefix: str = "<", reply_suffix: str = ">",
                  reply_message: str = "", reply_code: int = 0):
-        self.reply_type = reply_type
-        self.reply_prefix = reply_prefix
-        self.reply_suffix = reply_suffix
-        self.reply_message = reply_message
+        self.__type = reply_type
+        self.__prefix = reply_prefix
+        self.__suffix = reply_suffix
+        self.__message = reply_message
         self.reply_code = reply_code
+        self.__compile()
+
+    def __compile(self):
+        """
+        Precomputes the text and the encoded bytes of the reply, must be called whenever one of its parts changes.
+        """
+        self.token = self.__prefix + self.__type + self.__suffix
+        self.wire_prefix = (self.token + " ").encode()  # encoded start of a reply with a non-empty message
+        self.__text = self.token + self.__spaced_message
+        self.__bytes = self.__text.encode()
+
+    @property
+    def reply_type(self) -> str:
+        return self.__type
+
+    @reply_type.setter
+    def reply_type(self, reply_type: str):
+        self.__type = reply_type
+        self.__compile()
+
+    @property
+    def reply_prefix(self) -> str:
+        return self.__prefix
+
+    @reply_prefix.setter
+    def reply_prefix(self, reply_prefix: str):
+        self.__prefix = reply_prefix
+        self.__compile()
+
+    @property
+    def reply_suffix(self) -> str:
+        return self.__suffix
+
+    @reply_suffix.setter
+    def reply_suffix(self, reply_suffix: str):
+        self.__suffix = reply_suffix
+        self.__compile()
+
+    @property
+    def reply_message(self) -> str:
+        return self.__message
+
+    @reply_message.setter
+    def reply_message(self, reply_message: str):
+        self.__message = reply_message
+        self.__compile()
 
     def set_code(self, code: int):
         self.reply_code = code
@@ -22,16 +71,18 @@ class Reply:
 
     @property
     def __spaced_message(self):
-        return " " + self.reply_message if self.reply_message else ""
+        return " " + self.__message if self.__message else ""
 
     def __str__(self):
-        return self.reply_prefix + self.reply_type + self.reply_suffix + self.__spaced_message
+        return self.__text
 
     def encode(self, encoding: str = "utf-8", errors: str = "strict") -> bytes:
-        return str(self).encode(encoding, errors)
+        if encoding == "utf-8" and errors == "strict":
+            return self.__bytes
+        return self.__text.encode(encoding, errors)
 
     def __bytes__(self):
-        return self.encode()
+        return self.__bytes
 
     def is_base_format(self, message: str) -> bool:
         if not message.startswith(self.reply_prefix):
@@ -83,10 +134,14 @@ base: dict[str, Reply] = {
 
 replies = {
     "RPL_CONNECTED": "Connected to server",
+    "RPL_FRAMING": "Framing switched to",
     "RPL_WELCOME": "Welcome to the server",
     "RPL_DISCONNECTED": "Disconnected from server",
     "RPL_PRVTMSGON": "Private messages are now enabled",
     "RPL_PRVTMSGOFF": "Private messages are now disabled",
+    "RPL_JOINED": "Joined channel",
+    "RPL_PARTED": "Left channel",
+    "RPL_CHANMSGON": "Messages are now sent to the channel",
     "RPL_DOWNLOADSTART": "Download started",
     "RPL_DOWNLOADPORT": "Download port",
     "RPL_PROCEED": "Please proceed the download using the command " + command.commands["PROCEED"].template_string,
@@ -99,6 +154,11 @@ errors = {
     "ERR_NONICKNAMEGIVEN": "No nickname given, please connect using the command " + command.commands[
         "CONNECT"].template_string,
     "ERR_FILENOTFOUND": "File not found",
+    "ERR_BADSTREAMS": "The number of streams must be a positive number",
+    "ERR_UNKNOWNFRAMING": "Unknown framing mode",
+    "ERR_LINEBREAK": "Messages cannot contain line breaks",
+    "ERR_BADCHANNAME": "Channel names must start with #",
+    "ERR_NOTONCHANNEL": "You are not on that channel",
 }
 
 replies = {k: base["REPLY"].with_message(v) for k, v in replies.items()}
@@ -106,16 +166,45 @@ errors = {k: base["ERROR"].with_message(v) for k, v in errors.items()}
 
 all_replies = replies | errors
 
+_base_table: dict[str, Reply] = {}  # reply token: base reply
+_reply_table: dict[tuple[str, str], Reply] = {}  # (reply token, reply message): reply
+_suffixes: tuple[str, ...] = ()
 
-def parse_reply(message: str) -> typing.Union[Reply, None]:
+
+def build_dispatch():
+    """
+    Rebuilds the reply lookup tables, must be called after changing the registered replies.
+    """
+    global _suffixes
+    _base_table.clear()
+    _reply_table.clear()
+    for reply in base.values():
+        _base_table.setdefault(reply.token, reply)
     for reply in all_replies.values():
-        if reply.is_format(message):
-            return reply
+        _reply_table.setdefault((reply.token, reply.reply_message), reply)
+    _suffixes = tuple(dict.fromkeys(reply.reply_suffix for reply in base.values()))
+
+
+def _split(message: str, table: typing.Container[str]) -> typing.Union[tuple[str, str], None]:
+    """
+    Splits a message into its reply token and its message, if the token is in the table.
+    """
+    for suffix in _suffixes:
+        end = message.find(suffix) + len(suffix)
+        if end >= len(suffix) and message[:end] in table:
+            rest = message[end:]
+            return message[:end], rest[1:] if rest.startswith(" ") else rest
     return None
 
 
+def parse_reply(message: str) -> typing.Union[Reply, None]:
+    parts = _split(message, _base_table)
+    return _reply_table.get(parts) if parts else None
+
+
 def parse_base(message: str) -> typing.Union[Reply, None]:
-    for reply in base.values():
-        if reply.is_base_format(message):
-            return reply.with_message(reply.extract_message(message))
-    return None
+    parts = _split(message, _base_table)
+    return _base_table[parts[0]].with_message(parts[1]) if parts else None
+
+
+build_dispatch()
@@ -1,59 +1,177 @@
 import argparse
+import asyncio
+import collections
+import functools
 import os
 import select
 import socket
 import threading
-import time
+import typing
 
+import aio
 import command
+import congestion
+import federation
 import file_sender
+import framing
+import manifest
+import outbound
+import ratelimit
+import relay
 import reply
+import workers
 
-BUFFER_SIZE = 1024
 FILES_DIR = "files/"
+CHANNEL_PREFIX = b"#"
+MAX_DOWNLOAD_STREAMS = 16
+
+# Framed constant replies, by framing mode and reply name
+WIRE_REPLIES = {mode: {name: framing.encode(rep.encode(), mode) for name, rep in reply.all_replies.items()}
+                for mode in framing.MODES}
 
 
 class Server:
     __user2socket: dict[bytes, socket.socket] = {}
     __socket2user: dict[socket.socket, bytes] = {}
-    __user_message_mode: dict[socket.socket, socket.socket] = {}
-    __connections: list[socket.socket]
+    __user_message_mode: dict[socket.socket, typing.Union[socket.socket, bytes]] = {}
+    __user_channel_mode: dict[socket.socket, bytes] = {}
+    __channels: dict[bytes, set[socket.socket]] = {}
+    __user_channels: dict[socket.socket, set[bytes]] = {}
+    __connections: set[socket.socket]
     __proceedings: dict[socket.socket, list[threading.Event, threading.Event]]
-
-    def __init__(self, host: str, port: int):
+    __readers: dict[socket.socket, framing.FrameReader]
+    __outbound: dict[socket.socket, outbound.OutboundQueue]
+
+    def __init__(self, host: str, port: int, high_watermark: int = outbound.HIGH_WATERMARK,
+                 low_watermark: int = outbound.LOW_WATERMARK, slow_consumer_policy: str = outbound.DROP,
+                 reuse_port: bool = False, bus: typing.Union[workers.WorkerBus, federation.Federation] = None,
+                 transfer_buffer: int = file_sender.DEFAULT_BUFFER_CAPACITY, transfer_port: int = 0,
+                 congestion_control: str = congestion.NEW_RENO, transfer_rate: float = 0,
+                 total_transfer_rate: float = 0):
+        """
+        :param reuse_port: whether other processes may listen on the same port, see workers.serve
+        :param bus: link to the other server processes or nodes, None for a standalone server
+        :param transfer_buffer: bytes buffered by each file transfer, which bounds its window
+        :param transfer_port: UDP port shared by every file transfer, any free port if 0
+        :param congestion_control: congestion control of the file transfers, one of congestion.ALGORITHMS
+        :param transfer_rate: bytes per second each download may be sent at, unlimited if 0
+        :param total_transfer_rate: bytes per second every download together may be sent at, unlimited if 0, which
+        leaves the rest of the uplink to the chat
+        """
         self.__host = host
         self.__port = port
+        self.__bus = bus
+        self.__bus_flush_scheduled = False
+        self.__high_watermark = high_watermark
+        self.__low_watermark = low_watermark
+        self.__slow_consumer_policy = slow_consumer_policy
+        self.__transfer_buffer = transfer_buffer
+        self.__congestion_control = congestion_control
+        self.__transfer_rate = transfer_rate or None
+        # Shared by the transfers of every download, which all run on the thread of file_sender.shared_engine
+        self.__transfer_bucket = ratelimit.TokenBucket(total_transfer_rate) if total_transfer_rate else None
+        # The clients connect the transfers of their downloads to it, see file_sender.SenderEndpoint
+        self.__transfer_endpoint = file_sender.SenderEndpoint(transfer_port, file_sender.SOCKET_BUFFER_CAPACITY)
 
         self.__user2socket = {}  # nickname: client_socket
         self.__socket2user = {}  # client_socket: nickname
-        self.__user_message_mode = {}  # client_socket: client_socket
+        self.__user_message_mode = {}  # client_socket: client_socket, or nickname of a user of another process
+        self.__user_channel_mode = {}  # client_socket: channel its messages are sent to
+        self.__channels = {}  # channel: client sockets of its members
+        self.__user_channels = {}  # client_socket: channels it joined
         self.__proceedings = {}  # client_socket: threading.Event
+        self.__readers = {}  # client_socket: framing.FrameReader
+        self.__outbound = {}  # client_socket: outbound.OutboundQueue
+        self.__pending_writes = set()  # client sockets waiting to become writable
+        self.__unflushed = set()  # client sockets with fan-out messages queued during the current loop iteration
+        self.__slow_consumers = set()  # client sockets to be disconnected
 
         self.__user_count = 0
 
         self.__listening_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         self.__listening_socket.setblocking(False)
         self.__listening_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        if reuse_port:
+            self.__listening_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
         self.__listening_socket.bind((self.__host, self.__port))
-        self.__listening_socket.listen(5)
+        self.__listening_socket.listen(socket.SOMAXCONN)
 
-        self.__connections = [self.__listening_socket]
+        self.__connections = {self.__listening_socket}
+        self.__loop = None
+        # Callbacks handed to the select loop by other threads, which wake it up through the socket pair
+        self.__calls = collections.deque()
+        self.__wakeup_receiver, self.__wakeup_sender = socket.socketpair()
+        self.__wakeup_receiver.setblocking(False)
+        self.__download_tasks = set()  # of the asyncio mode
 
         print(f"Server started on {self.__host}:{self.__port}")
         self.__files = os.listdir(FILES_DIR)
 
     def run(self):
+        bus = [self.__bus] if self.__bus is not None else []
         while True:
-            readable, writable, exceptional = select.select(self.__connections, [], [])
+            timeout = 0 if self.__bus is not None and self.__bus.has_pending() else None
+            readable, writable, exceptional = select.select([*self.__connections, *bus, self.__wakeup_receiver],
+                                                            self.__pending_writes, [], timeout)
+            for u in writable:
+                self.__flush(u)
             for u in readable:
                 if u is self.__listening_socket:  # new connection
                     self.__accept_new_client(u)
+                elif u is self.__wakeup_receiver:  # callbacks from other threads
+                    self.__run_calls()
+                elif u is self.__bus:  # message from another server process
+                    self.__handle_bus()
                 else:  # new message
                     self.__handle_user_message(u)
+            if self.__bus is not None and self.__bus.has_pending():
+                self.__handle_bus(readable=False)
 
             for sock in exceptional:
                 sock.close()
-                self.__connections.remove(sock)
+                self.__connections.discard(sock)
+            self.__disconnect_slow_consumers()
+            self.__flush_bus()
+            self.__flush_unflushed()
+
+    def run_async(self, use_uvloop: bool = False):
+        """
+        Serve the same command set on an asyncio event loop instead of select.
+        :param use_uvloop: whether to install the uvloop event loop policy if it is available
+        """
+        if use_uvloop and not aio.install_uvloop():
+            print("uvloop is not installed, falling back to the default asyncio event loop")
+        asyncio.run(self.__serve_async())
+
+    async def __serve_async(self):
+        self.__loop = asyncio.get_running_loop()
+        if self.__bus is not None:
+            self.__loop.add_reader(self.__bus.fileno(), self.__handle_bus)
+        server = await self.__loop.create_server(
+            lambda: aio.ChatProtocol(self.__accept_async_client, self.__handle_user_frames,
+                                     self.__handle_async_client_lost),
+            sock=self.__listening_socket)
+        async with server:
+            await server.serve_forever()
+
+    def __call_soon(self, callback: typing.Callable, *args):
+        """
+        Call a callback on the thread of the loop, from any thread.
+        """
+        if self.__loop is not None:
+            self.__loop.call_soon_threadsafe(callback, *args)
+            return
+        self.__calls.append(functools.partial(callback, *args))
+        self.__wakeup_sender.send(b"\0")
+
+    def __run_calls(self):
+        try:
+            while self.__wakeup_receiver.recv(4096):
+                pass
+        except BlockingIOError:
+            pass
+        while self.__calls:
+            self.__calls.popleft()()
 
     def __broadcast(self, message: bytes, exclude: socket = None, prefix: bytes = b"", excluded_prefix: bool = False):
         """
@@ -65,9 +183,27 @@ class Server:
         """
         if exclude and excluded_prefix and exclude in self.__socket2user and not prefix:
             prefix = self.__socket2user[exclude] + b"> "
-        for client in self.__socket2user:
+        message = prefix + message
+        self.__deliver(message, exclude)
+        if self.__bus is not None:
+            self.__bus.broadcast(message)
+            self.__schedule_bus_flush()
+
+    def __deliver(self, message: bytes, exclude: socket = None, recipients: typing.Iterable[socket.socket] = None):
+        """
+        Send message to the clients connected to this process, except the one specified by exclude.
+        The message is framed once per framing mode and the same bytes are queued for every recipient.
+        :param message: message to be delivered
+        :param exclude: socket of the client to be excluded
+        :param recipients: client sockets to deliver to, every connected user by default
+        """
+        frames = {}  # framing mode: framed message
+        for client in self.__socket2user if recipients is None else recipients:
             if client is not exclude:
-                client.sendall(prefix + message)
+                mode = self.__readers[client].mode
+                if mode not in frames:
+                    frames[mode] = framing.encode(message, mode)
+                self.__enqueue(client, frames[mode])
 
     def __private_message(self, client_socket: socket.socket, message: bytes, prefix: bytes = b"",
                           excluded_prefix: bool = False):
@@ -82,18 +218,166 @@ class Server:
             prefix = self.__socket2user[client_socket] + b"@PM> "
         if client_socket in self.__user_message_mode:
             receiver = self.__user_message_mode[client_socket]
-            if receiver in self.__socket2user:
-                receiver.sendall(prefix + message)
+            if isinstance(receiver, bytes):  # user of another server process
+                self.__bus.private(receiver, prefix + message)
+                self.__schedule_bus_flush()
+            elif receiver in self.__socket2user:
+                self.__write(receiver, self.__frame(receiver, prefix + message))
+
+    def __channel_message(self, client_socket: socket.socket, message: bytes):
+        """
+        Send a message to the members of the channel the user talks to, costs O(members of the channel).
+        :param client_socket:  client socket of the sender
+        :param message:  message to be sent
+        """
+        channel = self.__user_channel_mode[client_socket]
+        message = self.__socket2user[client_socket] + b"@" + channel + b"> " + message
+        self.__deliver(message, client_socket, self.__channels.get(channel, ()))
+        if self.__bus is not None:
+            self.__bus.channel(channel, message)
+            self.__schedule_bus_flush()
 
     def __send_all(self, client_socket: socket.socket, data: bytes, prefix: str = ""):
         """
-        Send data to all connected clients except the one specified by client_socket.
-        :param client_socket:  client socket of the client to be excluded
+        Send a reply to a single client. Never blocks, message boundaries are kept by the framing.
+        :param client_socket:  client socket of the receiving client
         :param data:  data to be sent
         :param prefix:  prefix to be added to the message
         """
-        client_socket.sendall(prefix.encode() + data)
-        time.sleep(0.1)
+        self.__write(client_socket, self.__frame(client_socket, prefix.encode() + data))
+
+    def __write(self, client_socket: socket.socket, data: bytes):
+        """
+        Queue framed data for a client and send as much of it as possible without blocking.
+        Slow or broken connections are marked to be disconnected instead of stalling the caller.
+        :param client_socket:  client socket of the receiving client
+        :param data:  framed data to be sent
+        """
+        queue = self.__outbound.get(client_socket)
+        if queue is None:
+            return
+        try:
+            queue.push(data)
+            if not queue.flush(client_socket):
+                self.__pending_writes.add(client_socket)
+        except (outbound.SlowConsumerError, OSError):
+            self.__mark_slow_consumer(client_socket)
+
+    def __enqueue(self, client_socket: socket.socket, data: bytes):
+        """
+        Queue framed data for a client without sending it. In the select loop, everything queued for a client
+        during an iteration is sent at its end with a single sendmsg, so a burst of broadcasts costs one syscall per
+        recipient instead of one per message. The asyncio transports buffer and send by themselves.
+        :param client_socket:  client socket of the receiving client
+        :param data:  framed data to be sent, shared by every recipient
+        """
+        if self.__loop is not None:
+            self.__write(client_socket, data)
+            return
+        queue = self.__outbound.get(client_socket)
+        if queue is None:
+            return
+        try:
+            queue.push(data)
+        except outbound.SlowConsumerError:
+            self.__mark_slow_consumer(client_socket)
+            return
+        self.__unflushed.add(client_socket)
+
+    def __flush_unflushed(self):
+        for client_socket in self.__unflushed:
+            if client_socket not in self.__pending_writes:  # otherwise sent once the socket is writable
+                self.__flush(client_socket)
+        self.__unflushed.clear()
+
+    def __flush(self, client_socket: socket.socket):
+        """
+        Send queued data to a client, keeping it in the pending writes until all of it is sent.
+        :param client_socket:  client socket of the client
+        """
+        queue = self.__outbound.get(client_socket)
+        try:
+            if queue is None or queue.flush(client_socket):
+                self.__pending_writes.discard(client_socket)
+            else:
+                self.__pending_writes.add(client_socket)
+        except OSError:
+            self.__mark_slow_consumer(client_socket)
+
+    def __mark_slow_consumer(self, client_socket: socket.socket):
+        if not self.__slow_consumers and self.__loop is not None:
+            self.__loop.call_soon_threadsafe(self.__disconnect_slow_consumers)
+        self.__slow_consumers.add(client_socket)
+
+    def __disconnect_slow_consumers(self):
+        while self.__slow_consumers:
+            client_socket = next(iter(self.__slow_consumers))
+            self.__handle_user_disconnect(client_socket)
+            self.__slow_consumers.discard(client_socket)
+
+    def __handle_bus(self, readable: bool = True):
+        """
+        Deliver the messages relayed from the other server processes or nodes.
+        :param readable: whether the bus has new data, otherwise only messages received earlier are delivered
+        """
+        try:
+            messages = self.__bus.process() if readable else self.__bus.process_pending()
+        except ConnectionError:
+            raise SystemExit("Lost the connection to the other server processes")
+        for op, fields in messages:
+            if op == relay.BROADCAST:
+                self.__deliver(fields[0])
+            elif op == relay.PRIVATE:
+                receiver = self.__user2socket.get(fields[0])
+                if receiver is not None:
+                    self.__write(receiver, self.__frame(receiver, fields[1]))
+            elif op == relay.CHANNEL:
+                members = self.__channels.get(fields[0])
+                if members:
+                    self.__deliver(fields[1], recipients=members)
+            elif op == relay.KILL:
+                client_socket = self.__user2socket.get(fields[0])
+                if client_socket is not None:
+                    self.__send_reply(client_socket, "ERR_NICKNAMEINUSE")
+                    self.__handle_user_disconnect(client_socket)
+        self.__schedule_bus_flush()  # handling them may have batched messages for the other nodes
+
+    def __schedule_bus_flush(self):
+        """
+        Make sure the messages batched for the other server processes are sent, and the messages received while
+        waiting for a request are delivered, once the current event is handled.
+        The select loop does both at the end of every iteration.
+        """
+        if self.__loop is not None and not self.__bus_flush_scheduled:
+            self.__bus_flush_scheduled = True
+            self.__loop.call_soon_threadsafe(self.__flush_bus)
+
+    def __flush_bus(self):
+        self.__bus_flush_scheduled = False
+        if self.__bus is not None:
+            try:
+                self.__bus.flush()
+            except ConnectionError:
+                raise SystemExit("Lost the connection to the other server processes")
+            if self.__bus.has_pending():
+                self.__handle_bus(readable=False)
+
+    def __send_reply(self, client_socket: socket.socket, name: str):
+        """
+        Send a constant reply to a single client, reusing its prebuilt frame.
+        :param client_socket:  client socket of the receiving client
+        :param name:  name of the reply in reply.all_replies
+        """
+        self.__write(client_socket, WIRE_REPLIES[self.__readers[client_socket].mode][name])
+
+    def __frame(self, client_socket: socket.socket, data: bytes) -> bytes:
+        """
+        Frame data using the framing mode negotiated with the client.
+        :param client_socket:  client socket of the receiving client
+        :param data:  message to be framed
+        :return:  the framed message
+        """
+        return framing.encode(data, self.__readers[client_socket].mode)
 
     def __accept_new_client(self, listening_socket: socket.socket):
         """
@@ -102,11 +386,33 @@ class Server:
         """
         client_socket, client_address = listening_socket.accept()
         client_socket.setblocking(False)
-        self.__connections.append(client_socket)
-        self.__send_all(client_socket, reply.all_replies["RPL_CONNECTED"].encode())
+        self.__connections.add(client_socket)
+        self.__outbound[client_socket] = outbound.OutboundQueue(self.__high_watermark, self.__low_watermark,
+                                                                self.__slow_consumer_policy)
+        self.__greet_new_client(client_socket, client_address)
+
+    def __accept_async_client(self, connection: aio.TransportSocket) -> framing.FrameReader:
+        """
+        Register a new client connection accepted by the asyncio event loop.
+        :param connection:  socket-like wrapper of the client transport
+        :return:  the frame reader the connection receives into
+        """
+        self.__connections.add(connection)
+        self.__outbound[connection] = aio.TransportQueue(connection, self.__high_watermark, self.__low_watermark,
+                                                         self.__slow_consumer_policy)
+        return self.__greet_new_client(connection, connection.getpeername())
+
+    def __handle_async_client_lost(self, connection: aio.TransportSocket):
+        if connection in self.__connections:
+            self.__handle_user_disconnect(connection)
+
+    def __greet_new_client(self, client_socket: socket.socket, client_address) -> framing.FrameReader:
+        reader = self.__readers[client_socket] = framing.FrameReader()
+        self.__send_reply(client_socket, "RPL_CONNECTED")
         if client_socket not in self.__socket2user:
-            self.__send_all(client_socket, reply.all_replies["ERR_NONICKNAMEGIVEN"].encode())
+            self.__send_reply(client_socket, "ERR_NONICKNAMEGIVEN")
         print(f"New client connected: {client_address}")
+        return reader
 
     def __handle_user_message(self, client_socket: socket.socket):
         """
@@ -115,64 +421,119 @@ class Server:
         :return:  void
         """
         try:
-            data = client_socket.recv(BUFFER_SIZE)
-            cur_data = data
-            while len(cur_data) >= BUFFER_SIZE:
-                cur_data = client_socket.recv(BUFFER_SIZE)
-                data += cur_data
-            if not data:
+            if not self.__readers[client_socket].recv_into(client_socket):
                 self.__handle_user_disconnect(client_socket)
                 return
+        except BlockingIOError:
+            return
+        except Exception as e:
+            self.__handle_user_disconnect(client_socket)
+            return
+        self.__handle_user_frames(client_socket)
+
+    def __handle_user_frames(self, client_socket: socket.socket):
+        """
+        Handle every complete message buffered for a client.
+        :param client_socket:  client socket of the client
+        :return:  void
+        """
+        reader = self.__readers.get(client_socket)
+        if reader is None:
+            return
+        try:
+            for data in reader:
+                self.__handle_user_data(client_socket, data)
+                if client_socket not in self.__readers:  # disconnected while handling the message
+                    return
+        except framing.FramingError:
+            self.__handle_user_disconnect(client_socket)
 
-            cmd = command.parse_command(data.decode())
+    def __handle_user_data(self, client_socket: socket.socket, data: memoryview):
+        """
+        Handle a single message from a client.
+        :param client_socket:  client socket of the client
+        :param data:  message received from the client
+        :return:  void
+        """
+        try:
+            text = str(data, "utf-8")
+            # A length-prefixed message must not smuggle more messages into the clients that use line framing
+            if "\r" in text or "\n" in text:
+                self.__send_reply(client_socket, "ERR_LINEBREAK")
+                return
+            cmd, args = command.parse(text)
             if cmd is command.commands["CONNECT"]:
-                self.__handle_user_connect(client_socket, cmd, data)
+                self.__handle_user_connect(client_socket, cmd, args)
+                return
+            if cmd is command.commands["FRAMING"]:
+                self.__handle_user_framing(client_socket, cmd, args)
                 return
             if client_socket not in self.__socket2user:
-                self.__send_all(client_socket, reply.all_replies["ERR_NONICKNAMEGIVEN"].encode())
+                self.__send_reply(client_socket, "ERR_NONICKNAMEGIVEN")
                 return
             if cmd is command.commands["DISCONNECT"] or cmd is command.commands["QUIT"]:
                 self.__handle_user_disconnect(client_socket)
             elif cmd is command.commands["NICK"]:
-                self.__handle_user_connect(client_socket, cmd, data)
+                self.__handle_user_connect(client_socket, cmd, args)
             elif cmd is command.commands["LIST"] or cmd is command.commands["GET_USERS"]:
                 self.__handle_user_list(client_socket)
             elif cmd is command.commands["SET_MSG"]:
-                self.__handle_user_set_msg_mode(client_socket, cmd, data)
+                self.__handle_user_set_msg_mode(client_socket, cmd, args)
             elif cmd is command.commands["SET_MSG_ALL"]:
-                self.__handle_user_set_msg_mode(client_socket, cmd, data, True)
+                self.__handle_user_set_msg_mode(client_socket, cmd, args, True)
+            elif cmd is command.commands["JOIN"]:
+                self.__handle_user_join(client_socket, cmd, args)
+            elif cmd is command.commands["PART"]:
+                self.__handle_user_part(client_socket, cmd, args)
             elif cmd is command.commands["GET_LIST_FILE"]:
                 self.__handle_user_get_file_list(client_socket)
-            elif cmd is command.commands["DOWNLOAD"]:
-                self.__handle_user_download(client_socket, cmd, data)
+            elif cmd is command.commands["DOWNLOAD"] or cmd is command.commands["DOWNLOAD_STRIPED"]:
+                self.__handle_user_download(client_socket, cmd, args)
             elif cmd is command.commands["PROCEED"]:
-                self.__handle_user_proceed(client_socket, cmd, data)
+                self.__handle_user_proceed(client_socket, cmd, args)
             else:
                 if client_socket in self.__proceedings and self.__proceedings[client_socket][1].is_set():
-                    self.__send_all(client_socket, reply.all_replies["RPL_PROCEED"].encode())
+                    self.__send_reply(client_socket, "RPL_PROCEED")
                 if client_socket in self.__user_message_mode:
                     self.__private_message(client_socket, data, prefix=self.__socket2user[client_socket] + b"@PM> ")
+                elif client_socket in self.__user_channel_mode:
+                    self.__channel_message(client_socket, data)
                 else:
                     self.__broadcast(data, exclude=client_socket, prefix=self.__socket2user[client_socket] + b"> ")
+        except TimeoutError:  # a request to the other server processes, the user may try again
+            self.__send_all(client_socket, reply.base["ERROR"].with_message(
+                "The other server processes did not answer in time").encode())
         except Exception as e:
             self.__handle_user_disconnect(client_socket)
 
-    def __handle_user_connect(self, client_socket: socket.socket, cmd: command.Command, data: bytes):
+    def __handle_user_connect(self, client_socket: socket.socket, cmd: command.Command, args: list[str]):
         """
         Handle a CONNECT command from a client.
         :param client_socket:  client socket of the client
         :param cmd:  command to be handled
-        :param data:  data to be handled
+        :param args:  arguments of the command
         :return:  void
         """
-        nickname = cmd.get_args(data.decode())[0].encode()
+        nickname = args[0].encode()
         if nickname in self.__user2socket:
-            self.__send_all(client_socket, reply.all_replies["ERR_NICKNAMEINUSE"].encode())
+            self.__send_reply(client_socket, "ERR_NICKNAMEINUSE")
             return
         if b' ' in nickname:
             self.__send_all(client_socket, reply.base["ERROR"].with_message("Nickname cannot contain spaces").encode())
             return
+        if nickname.startswith(CHANNEL_PREFIX):
+            self.__send_all(client_socket, reply.base["ERROR"].with_message(
+                "Nickname cannot start with " + CHANNEL_PREFIX.decode()).encode())
+            return
         old_nickname = self.__socket2user.get(client_socket, None)
+        if self.__bus is not None:
+            claimed = self.__bus.claim_nick(nickname, old_nickname or b"")
+            self.__schedule_bus_flush()
+            if not claimed:
+                self.__send_reply(client_socket, "ERR_NICKNAMEINUSE")
+                return
+        if old_nickname is not None:
+            del self.__user2socket[old_nickname]
         self.__user2socket[nickname] = client_socket
         self.__socket2user[client_socket] = nickname
         if old_nickname is None:
@@ -181,77 +542,285 @@ class Server:
                              prefix=b"Server> ")
             print(f"{client_socket.getpeername()} connected as {nickname.decode()}")
         else:
-            self.__broadcast(f"{old_nickname} is now known as {nickname.decode()}".encode(), exclude=client_socket)
+            self.__broadcast(f"{old_nickname.decode()} is now known as {nickname.decode()}".encode(),
+                             exclude=client_socket)
             print(f"{client_socket.getpeername()} changed nickname from {old_nickname.decode()} to {nickname.decode()}")
 
+    def __handle_user_framing(self, client_socket: socket.socket, cmd: command.Command, args: list[str]):
+        """
+        Handle a FRAMING command from a client. The reply is still sent using the previous framing mode.
+        :param client_socket:  client socket of the client
+        :param cmd:  command to be handled
+        :param args:  arguments of the command
+        :return:  void
+        """
+        mode = args[0]
+        if mode not in framing.MODES:
+            self.__send_reply(client_socket, "ERR_UNKNOWNFRAMING")
+            return
+        self.__send_all(client_socket, reply.all_replies["RPL_FRAMING"].encode() + b' ' + mode.encode())
+        self.__readers[client_socket].mode = mode
+
     def __handle_user_disconnect(self, client_socket: socket.socket):
+        if client_socket not in self.__readers:
+            return
         if client_socket in self.__socket2user:
             nickname = self.__socket2user[client_socket]
             del self.__user2socket[nickname]
             del self.__socket2user[client_socket]
+            if self.__bus is not None:
+                self.__bus.release_nick(nickname)
             self.__broadcast(f"{nickname.decode()} has left the chat".encode())
-        print(f"{client_socket.getpeername()} disconnected")
-        client_socket.sendall(reply.all_replies["RPL_DISCONNECTED"].encode())
+        try:
+            print(f"{client_socket.getpeername()} disconnected")
+        except OSError:  # the connection was reset by the peer
+            print("Client disconnected")
+        for channel in self.__user_channels.pop(client_socket, ()):
+            self.__leave_channel(client_socket, channel)
+        self.__user_message_mode.pop(client_socket, None)
+        self.__user_channel_mode.pop(client_socket, None)
+        if client_socket not in self.__slow_consumers:
+            self.__send_reply(client_socket, "RPL_DISCONNECTED")
         client_socket.close()
-        self.__connections.remove(client_socket)
+        self.__connections.discard(client_socket)
+        self.__readers.pop(client_socket, None)
+        self.__outbound.pop(client_socket, None)
+        self.__pending_writes.discard(client_socket)
+        self.__unflushed.discard(client_socket)
+        self.__slow_consumers.discard(client_socket)
 
     def __handle_user_list(self, client_socket: socket.socket):
-        user_list = b",".join(self.__user2socket.keys())
-        self.__send_all(client_socket, reply.base["REPLY"].with_message(user_list.decode()).encode())
+        if self.__bus is not None:
+            user_list = b",".join(self.__bus.list_nicks())
+            self.__schedule_bus_flush()
+        else:
+            user_list = b",".join(self.__user2socket.keys())
+        self.__send_all(client_socket, reply.base["REPLY"].wire_prefix + user_list)
 
-    def __handle_user_set_msg_mode(self, client_socket: socket.socket, cmd: command.Command, data: bytes,
+    def __handle_user_set_msg_mode(self, client_socket: socket.socket, cmd: command.Command, args: list[str],
                                    to_all: bool = False):
-        if to_all and client_socket in self.__user_message_mode:
+        if to_all and (client_socket in self.__user_message_mode or client_socket in self.__user_channel_mode):
             self.__user_message_mode.pop(client_socket, None)
-            self.__send_all(client_socket, reply.all_replies["RPL_PRVTMSGOFF"].encode())
+            self.__user_channel_mode.pop(client_socket, None)
+            self.__send_reply(client_socket, "RPL_PRVTMSGOFF")
             return
-        args = cmd.get_args(data.decode())
         nick = args[0].encode()
-        if nick not in self.__user2socket:
-            self.__send_all(client_socket, reply.all_replies["ERR_NOSUCHNICK"].encode())
+        if nick.startswith(CHANNEL_PREFIX):
+            if nick not in self.__user_channels.get(client_socket, ()):
+                self.__send_reply(client_socket, "ERR_NOTONCHANNEL")
+                return
+            self.__user_message_mode.pop(client_socket, None)
+            self.__user_channel_mode[client_socket] = nick
+            self.__send_reply(client_socket, "RPL_CHANMSGON")
             return
-        self.__user_message_mode[client_socket] = self.__user2socket[nick]
-        self.__send_all(client_socket, reply.all_replies["RPL_PRVTMSGON"].encode())
+        self.__user_channel_mode.pop(client_socket, None)
+        if nick in self.__user2socket:
+            self.__user_message_mode[client_socket] = self.__user2socket[nick]
+        elif self.__has_remote_nick(nick):
+            self.__user_message_mode[client_socket] = nick
+        else:
+            self.__send_reply(client_socket, "ERR_NOSUCHNICK")
+            return
+        self.__send_reply(client_socket, "RPL_PRVTMSGON")
+
+    def __handle_user_join(self, client_socket: socket.socket, cmd: command.Command, args: list[str]):
+        channel = args[0].encode()
+        if not channel.startswith(CHANNEL_PREFIX) or b' ' in channel:
+            self.__send_reply(client_socket, "ERR_BADCHANNAME")
+            return
+        channels = self.__user_channels.setdefault(client_socket, set())
+        if channel not in channels:
+            nickname = self.__socket2user[client_socket]
+            members = self.__channels.setdefault(channel, set())
+            notice = b"Server@" + channel + b"> '" + nickname + b"' joined the channel"
+            self.__deliver(notice, recipients=members)
+            if self.__bus is not None:
+                self.__bus.channel(channel, notice)
+                self.__schedule_bus_flush()
+            members.add(client_socket)
+            channels.add(channel)
+        self.__send_all(client_socket, reply.all_replies["RPL_JOINED"].encode() + b" " + channel)
+
+    def __handle_user_part(self, client_socket: socket.socket, cmd: command.Command, args: list[str]):
+        channel = args[0].encode()
+        channels = self.__user_channels.get(client_socket, set())
+        if channel not in channels:
+            self.__send_reply(client_socket, "ERR_NOTONCHANNEL")
+            return
+        channels.discard(channel)
+        self.__leave_channel(client_socket, channel)
+        if self.__user_channel_mode.get(client_socket) == channel:
+            del self.__user_channel_mode[client_socket]
+        self.__send_all(client_socket, reply.all_replies["RPL_PARTED"].encode() + b" " + channel)
+
+    def __leave_channel(self, client_socket: socket.socket, channel: bytes):
+        """
+        Remove a user from the members of a channel and tell the remaining members, the reverse index is left to the
+        caller.
+        """
+        members = self.__channels.get(channel)
+        if members is None:
+            return
+        members.discard(client_socket)
+        if not members:
+            del self.__channels[channel]
+        nickname = self.__socket2user.get(client_socket)
+        if nickname is None:  # already removed by a disconnect
+            return
+        notice = b"Server@" + channel + b"> '" + nickname + b"' left the channel"
+        self.__deliver(notice, recipients=members)
+        if self.__bus is not None:
+            self.__bus.channel(channel, notice)
+            self.__schedule_bus_flush()
+
+    def __has_remote_nick(self, nick: bytes) -> bool:
+        if self.__bus is None:
+            return False
+        found = self.__bus.has_nick(nick)
+        self.__schedule_bus_flush()
+        return found
 
     def __handle_user_get_file_list(self, client_socket: socket.socket):
         self.__files = os.listdir(FILES_DIR)
         file_list = ", ".join(self.__files)
         self.__send_all(client_socket, reply.base["REPLY"].with_message(file_list).encode())
 
-    def __handle_user_download(self, client_socket: socket.socket, cmd: command.Command, data: bytes):
-        down_thread = threading.Thread(target=self.__handle_user_download_thread,
-                                       args=(client_socket, cmd, data))
+    def __handle_user_download(self, client_socket: socket.socket, cmd: command.Command, args: list[str]):
+        request = self.__parse_download(client_socket, cmd, args)
+        if request is None:
+            return
+        if self.__loop is not None:
+            task = self.__loop.create_task(self.__handle_user_download_async(client_socket, *request))
+            self.__download_tasks.add(task)  # the loop keeps weak references to its tasks only
+            task.add_done_callback(self.__download_tasks.discard)
+            return
+        down_thread = threading.Thread(target=self.__handle_user_download_thread, args=(client_socket, *request))
         down_thread.start()
 
-    def __handle_user_download_thread(self, client_socket: socket.socket, cmd: command.Command, data: bytes):
-        args = cmd.get_args(data.decode())
-        filename = args[0]
-        output_path = args[1]
-
-        # Establish new avalible port and closing it for the filesender port - TODO: make this less hacky
-        server_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-        server_socket.bind(('', 0))
-        server_port = server_socket.getsockname()[1]
-        server_socket.close()
-        self.__send_all(client_socket, command.commands["SERVER_DOWNLOAD"].format(output_path, server_port).encode())
-        client_address = client_socket.getpeername()
-        print(f"Starting a new thread from {client_address} at port {server_port}")
+    def __handle_user_download_thread(self, client_socket: socket.socket, file_path: str, output_path: str,
+                                      streams: int):
+        """
+        The download of the select mode hashes the file for its manifest on a thread of its own, and hands the rest
+        back to the select loop, which alone writes to the clients.
+        """
+        file_manifest = manifest.file_manifest(file_path) if os.path.getsize(file_path) else None
+        self.__call_soon(self.__start_download, client_socket, file_path, output_path, streams, file_manifest)
 
-        if not os.path.isfile(os.path.join(FILES_DIR, filename)):
-            self.__send_all(client_socket, reply.all_replies["ERR_FILENOTFOUND"].encode())
-            return
+    def __start_download(self, client_socket: socket.socket, file_path: str, output_path: str, streams: int,
+                         file_manifest: typing.Optional[manifest.Manifest]):
+        """
+        Offers the download, and reports it once every transfer finished, on the thread of the select loop.
+        """
+        senders = self.__offer_download(client_socket, file_path, output_path, streams, file_manifest)
+        unfinished = set(senders)
+
+        def finished(sender: file_sender.FileSender):
+            if sender in unfinished:  # the callback of a transfer may be called twice
+                unfinished.remove(sender)
+                if not unfinished:
+                    self.__report_download(client_socket, file_path, senders)
+
+        for sender in senders:
+            sender.add_done_callback(functools.partial(self.__call_soon, finished, sender))
+
+    async def __handle_user_download_async(self, client_socket: socket.socket, file_path: str, output_path: str,
+                                           streams: int):
+        """
+        The download of the asyncio mode, a task that waits for the transfers without holding a thread, the file is
+        hashed for its manifest on the default executor.
+        """
+        file_manifest = None
+        if os.path.getsize(file_path):
+            file_manifest = await self.__loop.run_in_executor(None, manifest.file_manifest, file_path)
+        senders = self.__offer_download(client_socket, file_path, output_path, streams, file_manifest)
+        await asyncio.gather(*(self.__transfer_finished(sender) for sender in senders))
+        self.__report_download(client_socket, file_path, senders)
+
+    def __transfer_finished(self, sender: file_sender.FileSender) -> asyncio.Future:
+        """
+        :return: a future of the loop done once the transfer finished, on the thread of the engine of the transfers
+        """
+        future = self.__loop.create_future()
+
+        def set_finished():
+            if not future.done():
+                future.set_result(None)
+
+        sender.add_done_callback(lambda: self.__loop.call_soon_threadsafe(set_finished))
+        return future
+
+    def __parse_download(self, client_socket: socket.socket, cmd: command.Command,
+                         args: list[str]) -> typing.Optional[typing.Tuple[str, str, int]]:
+        """
+        :param cmd: DOWNLOAD, or DOWNLOAD_STRIPED with the number of streams before the output path
+        :return: the path of the file, the output path and the streams of a download, None if the request is invalid
+        """
+        if cmd is command.commands["DOWNLOAD_STRIPED"]:
+            filename, count, output_path = args
+            if not count.isdigit() or int(count) < 1:
+                self.__send_reply(client_socket, "ERR_BADSTREAMS")
+                return None
+            streams = min(int(count), MAX_DOWNLOAD_STREAMS)
+        else:
+            filename, output_path = args
+            streams = 1
+
+        file_path = os.path.join(FILES_DIR, filename)
+        if not os.path.isfile(file_path):
+            self.__send_reply(client_socket, "ERR_FILENOTFOUND")
+            return None
+        return file_path, output_path, streams
+
+    def __offer_download(self, client_socket: socket.socket, file_path: str, output_path: str, streams: int,
+                         file_manifest: typing.Optional[manifest.Manifest]) -> list[file_sender.FileSender]:
+        """
+        Offers the stripes of the file to the client, the transfers wait for the client to connect to them, from the
+        address they then send to.
+        :param file_manifest: lets the client resume a partial download and verify the file, None for an empty file
+        :return: the transfers, none if the client disconnected while the file was hashed
+        """
+        if client_socket not in self.__socket2user:
+            return []
+        if file_manifest is not None:
+            self.__send_all(client_socket, command.commands["SERVER_MANIFEST"].encode(
+                file_manifest.file_size, file_manifest.chunk_size, file_manifest.encode(), output_path))
 
         evee1 = threading.Event()
         evee2 = threading.Event()
         self.__proceedings[client_socket] = [evee1, evee2]
-        print(f"Send {filename} to {client_address[0]}")
-        results = file_sender.send_file((client_address[0], server_port), os.path.join(FILES_DIR, filename),
-                                        self.__proceedings[client_socket])
-        last_byte = results[0][0]
-        message = f"User {self.__socket2user[client_socket].decode()} downloaded 100%. Last byte: {last_byte}"
+        senders = file_sender.offer_stripes(self.__transfer_endpoint, file_path, streams,
+                                            self.__proceedings[client_socket], self.__transfer_buffer,
+                                            self.__congestion_control, self.__transfer_rate,
+                                            self.__transfer_bucket)
+        connection_ids = [sender.connection_id for sender in senders]
+        self.__send_all(client_socket, command.commands["SERVER_DOWNLOAD"].encode(
+            self.__transfer_endpoint.port, ",".join(map(str, connection_ids)), output_path))
+        print(f"Send {os.path.basename(file_path)} to {client_socket.getpeername()[0]} as connections "
+              f"{connection_ids}")
+        return senders
+
+    def __report_download(self, client_socket: socket.socket, file_path: str,
+                          senders: list[file_sender.FileSender]):
+        """
+        Tells the client its download finished, once every transfer of the download did.
+        """
+        filename = os.path.basename(file_path)
+        if not senders or client_socket not in self.__socket2user:  # disconnected meanwhile
+            return
+        client_address = client_socket.getpeername()
+        if not all(sender.connected for sender in senders):
+            print(f"{client_address[0]} did not connect to the download of {filename}")
+            return
+        if any(sender.error is not None for sender in senders):
+            print(f"The download of {filename} by {client_address[0]} failed")
+            return
+        message = f"User {self.__socket2user[client_socket].decode()} downloaded 100%."
+        results = senders[-1].results
+        if results[0]:  # an empty file has no last byte
+            message += f" Last byte: {results[0][0]}"
         self.__send_all(client_socket, reply.base["REPLY"].with_message(message).encode())
 
-    def __handle_user_proceed(self, client_socket: socket.socket, cmd: command.Command, data: bytes):
+    def __handle_user_proceed(self, client_socket: socket.socket, cmd: command.Command, args: list[str]):
         if client_socket not in self.__proceedings:
             return
         self.__proceedings[client_socket][0].set()
@@ -282,14 +851,147 @@ def get_args():
         type=int,
         help="Port on which to listen",
     )
+    parser.add_argument(
+        "--asyncio",
+        dest="use_asyncio",
+        action="store_true",
+        help="Serve clients on an asyncio event loop instead of select",
+    )
+    parser.add_argument(
+        "--uvloop",
+        dest="use_uvloop",
+        action="store_true",
+        help="Use the uvloop event loop policy in asyncio mode, if installed",
+    )
+    parser.add_argument(
+        "--high-watermark",
+        dest="high_watermark",
+        default=outbound.HIGH_WATERMARK,
+        type=int,
+        help="Queued bytes at which a client is considered a slow consumer",
+    )
+    parser.add_argument(
+        "--low-watermark",
+        dest="low_watermark",
+        default=outbound.LOW_WATERMARK,
+        type=int,
+        help="Queued bytes below which a slow consumer receives messages again",
+    )
+    parser.add_argument(
+        "--slow-consumer",
+        dest="slow_consumer_policy",
+        default=outbound.DROP,
+        choices=outbound.POLICIES,
+        help="Whether to drop messages to slow consumers or to disconnect them",
+    )
+    parser.add_argument(
+        "-w",
+        "--workers",
+        dest="workers",
+        default=1,
+        type=int,
+        help="Number of worker processes sharing the port",
+    )
+    parser.add_argument(
+        "--link-port",
+        dest="link_port",
+        default=None,
+        type=int,
+        help="Port on which to accept links from other server nodes",
+    )
+    parser.add_argument(
+        "--peer",
+        dest="peers",
+        default=[],
+        action="append",
+        type=federation.parse_address,
+        help="Address (host:port) of the link port of another server node, may be repeated",
+    )
+    parser.add_argument(
+        "--node-name",
+        dest="node_name",
+        default=None,
+        type=str,
+        help="Unique name of this server node, defaults to its link address",
+    )
+    parser.add_argument(
+        "--transfer-buffer",
+        dest="transfer_buffer",
+        default=file_sender.DEFAULT_BUFFER_CAPACITY,
+        type=int,
+        help="Bytes buffered by each file transfer, which bounds its window",
+    )
+    parser.add_argument(
+        "--transfer-port",
+        dest="transfer_port",
+        default=0,
+        type=int,
+        help="UDP port shared by every file transfer, any free port if 0",
+    )
+    parser.add_argument(
+        "--congestion-control",
+        dest="congestion_control",
+        default=congestion.NEW_RENO,
+        choices=congestion.ALGORITHMS,
+        help="Congestion control of the file transfers",
+    )
+    parser.add_argument(
+        "--transfer-rate",
+        dest="transfer_rate",
+        default=0,
+        type=float,
+        help="Bytes per second each download may be sent at, unlimited if 0",
+    )
+    parser.add_argument(
+        "--total-transfer-rate",
+        dest="total_transfer_rate",
+        default=0,
+        type=float,
+        help="Bytes per second every download of a server process together may be sent at, unlimited if 0",
+    )
 
-    return parser.parse_args()
+    options = parser.parse_args()
+    if options.peers and options.link_port is None:
+        parser.error("--peer requires --link-port")
+    if options.link_port is not None and options.workers > 1:
+        parser.error("--link-port cannot be used with --workers")
+    if options.transfer_port and options.workers > 1:
+        parser.error("--transfer-port cannot be used with --workers")
+    if options.transfer_rate < 0 or options.total_transfer_rate < 0:
+        parser.error("transfer rates cannot be negative")
+    return options
 
 
 def main():
     options = get_args()
-    server = Server(options.listen_address, options.listen_port)
-    server.run()
+
+    def make_server(bus: workers.WorkerBus = None) -> Server:
+        return Server(options.listen_address, options.listen_port, options.high_watermark, options.low_watermark,
+                      options.slow_consumer_policy, reuse_port=bus is not None, bus=bus,
+                      transfer_buffer=options.transfer_buffer, transfer_port=options.transfer_port,
+                      congestion_control=options.congestion_control, transfer_rate=options.transfer_rate,
+                      total_transfer_rate=options.total_transfer_rate)
+
+    def make_node() -> Server:
+        name = options.node_name or f"{options.listen_address}:{options.link_port}"
+        bus = federation.Federation(name, (options.listen_address, options.link_port), options.peers)
+        return Server(options.listen_address, options.listen_port, options.high_watermark, options.low_watermark,
+                      options.slow_consumer_policy, bus=bus, transfer_buffer=options.transfer_buffer,
+                      transfer_port=options.transfer_port, congestion_control=options.congestion_control,
+                      transfer_rate=options.transfer_rate, total_transfer_rate=options.total_transfer_rate)
+
+    def run_server(server: Server):
+        if options.use_asyncio or options.use_uvloop:
+            server.run_async(options.use_uvloop)
+        else:
+            server.run()
+
+    if options.workers > 1:
+        workers.serve(options.workers, make_server, run_server)
+    elif options.link_port is not None:
+        run_server(make_node())
+    else:
+        run_server(make_server())
 
 
 if __name__ == '__main__':
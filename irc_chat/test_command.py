@@ -0,0 +1,68 @@
+import pytest
+
+import command
+import reply
+
+
+@pytest.mark.parametrize("name", command.commands)
+def test_parse_formatted_commands(name):
+    cmd = command.commands[name]
+    args = [f"arg{i}" for i in range(cmd.num_args)]
+    message = cmd.format(*args)
+    parsed, parsed_args = command.parse(message)
+    assert parsed is cmd
+    if args:
+        assert parsed_args == args
+    assert cmd.is_format(message)
+
+
+def test_parse_keeps_spaces_in_last_argument():
+    cmd, args = command.parse("<download> big file.txt out file.txt")
+    assert cmd is command.commands["DOWNLOAD"]
+    assert args == ["big", "file.txt out file.txt"]
+    cmd, args = command.parse("<download_striped> big 4 out file 2")
+    assert cmd is command.commands["DOWNLOAD_STRIPED"]
+    assert args == ["big", "4", "out file 2"]
+
+
+@pytest.mark.parametrize("message", ["hello <connect> alice", "<connect>", "<unknown> x", "plain text", ""])
+def test_parse_not_a_command(message):
+    assert command.parse(message) == (None, [])
+
+
+def test_parse_longest_token_only():
+    # <set_msg> must not be taken for <set_msg_all>, or the other way around
+    assert command.parse_command("<set_msg_all>") is command.commands["SET_MSG_ALL"]
+    assert command.parse("<set_msg> bob") == (command.commands["SET_MSG"], ["bob"])
+
+
+def test_parse_reply():
+    for rep in reply.all_replies.values():
+        assert reply.parse_reply(str(rep)) is rep
+
+
+def test_parse_base_with_any_message():
+    rep = reply.parse_base("<ERR> Something went wrong")
+    assert rep.reply_type == "ERR"
+    assert rep.reply_message == "Something went wrong"
+    assert reply.parse_base("<RPL>").reply_message == ""
+    assert reply.parse_base("<connect> alice") is None
+    assert reply.parse_reply("<RPL> Not a registered reply") is None
+
+
+@pytest.mark.parametrize("name", command.commands)
+def test_precomputed_format_matches_template(name):
+    cmd = command.commands[name]
+    args = [f"arg{i}" for i in range(cmd.num_args)]
+    message = cmd.template.substitute(dict(zip(cmd.args, args)))
+    assert cmd.format(*args) == message
+    assert cmd.encode(*args) == message.encode()
+
+
+def test_add_arg_recompiles():
+    cmd = command.Command("test", "first")
+    cmd.add_arg("second")
+    assert cmd.format("a", "b") == "<test> a b"
+    assert cmd.encode("a", "b") == b"<test> a b"
+    with pytest.raises(ValueError):
+        cmd.format("a")
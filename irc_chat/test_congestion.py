@@ -0,0 +1,127 @@
+import pytest
+
+import congestion
+import utils
+
+MSS = 1000
+
+
+def test_create():
+    assert isinstance(congestion.create(congestion.NEW_RENO, MSS, 64 * MSS), congestion.NewReno)
+    assert isinstance(congestion.create(congestion.CUBIC, MSS, 64 * MSS), congestion.Cubic)
+    assert isinstance(congestion.create(congestion.BBR, MSS, 64 * MSS), congestion.BBRLite)
+    with pytest.raises(ValueError):
+        congestion.create("vegas", MSS, 64 * MSS)
+    with pytest.raises(TypeError):
+        congestion.CongestionControl(MSS, 64 * MSS)
+
+
+def test_pacing_rate():
+    control = congestion.NewReno(MSS, 64 * MSS)
+    assert control.pacing_rate() is None  # until the RTT is known
+    control.update_RTT(0.1)
+    assert control.pacing_rate() == pytest.approx(control.SLOW_START_PACING_GAIN * MSS / 0.1)
+    control.update_RTT(0.9)
+    assert control.smoothed_RTT == pytest.approx(0.2)
+
+
+def test_set_MSS_keeps_the_segments():
+    control = congestion.NewReno(MSS, 64 * MSS)
+    control.window = 10 * MSS
+    control.set_MSS(2 * MSS)
+    assert control.window == 20 * MSS and control.MSS == 2 * MSS
+
+
+def test_new_reno_slow_start_and_congestion_avoidance():
+    control = congestion.NewReno(MSS, 4 * MSS)
+    for _ in range(3):
+        control.on_ack(2 * MSS, 0.1, 0, 0.0)  # a segment per ACK, however much it acknowledges
+    assert control.window == 4 * MSS
+    assert control.status == utils.CCStatus.CONGESTION_AVOIDANCE
+    for _ in range(4):
+        control.on_ack(MSS, 0.1, 0, 0.0)
+    assert 4 * MSS < control.window <= 5 * MSS  # about a segment per window
+
+
+def test_new_reno_fast_recovery():
+    control = congestion.NewReno(MSS, 64 * MSS)
+    control.window = 20 * MSS
+    control.on_fast_retransmit(20 * MSS)
+    assert control.ss_threshold == 10 * MSS
+    assert control.window == 13 * MSS
+    control.on_duplicate_ack()
+    assert control.window == 14 * MSS
+    control.on_ack(5 * MSS, None, 15 * MSS, 0.0)
+    assert control.window == 14 * MSS  # not grown during the recovery
+    control.on_partial_ack(5 * MSS)
+    assert control.window == 10 * MSS
+    control.on_recovery_end(10 * MSS)
+    assert control.window == 10 * MSS
+    assert control.status == utils.CCStatus.CONGESTION_AVOIDANCE
+
+
+def test_new_reno_timeout():
+    control = congestion.NewReno(MSS, 64 * MSS)
+    control.window = 20 * MSS
+    control.on_timeout(3 * MSS)
+    assert control.window == MSS
+    assert control.ss_threshold == 2 * MSS
+    assert control.status == utils.CCStatus.SLOW_START
+
+
+def test_cubic_climbs_back_to_the_window_of_the_loss():
+    control = congestion.Cubic(MSS, 64 * MSS)
+    control.window = 100 * MSS
+    control.status = utils.CCStatus.CONGESTION_AVOIDANCE
+    control.on_fast_retransmit(100 * MSS)
+    assert control.ss_threshold == 70 * MSS
+    control.on_recovery_end(70 * MSS)
+    assert control.window == 70 * MSS
+    K = (30 / control.C) ** (1 / 3)  # seconds to climb back 30 segments
+    now, RTT = 0.0, 0.1
+    while now < K:
+        for _ in range(control.window // MSS):
+            control.on_ack(MSS, RTT, control.window, now)
+        now += RTT
+    assert control.K == pytest.approx(K)
+    assert 95 * MSS <= control.window <= 105 * MSS  # plateaus near the window of the loss
+    while now < 2 * K:
+        for _ in range(control.window // MSS):
+            control.on_ack(MSS, RTT, control.window, now)
+        now += RTT
+    assert control.window > 110 * MSS  # then probes beyond it
+
+
+def test_cubic_fast_convergence():
+    control = congestion.Cubic(MSS, 64 * MSS)
+    control.window = 100 * MSS
+    control.on_timeout(100 * MSS)
+    assert control.max_window == 100 * MSS and control.window == MSS
+    control.window = 50 * MSS
+    control.on_timeout(50 * MSS)
+    assert control.max_window == int(50 * MSS * (1 + control.BETA) / 2)
+
+
+def test_bbr_finds_the_bottleneck():
+    control = congestion.BBRLite(MSS, 64 * MSS)
+    rate, RTT = 1000 * MSS, 0.05  # bytes per second, and the delivery rate the path allows
+    now = 0.0
+    while now < 5:
+        now += MSS / rate
+        control.on_ack(MSS, RTT, min(control.window, int(rate * RTT * 2)), now)
+    assert control.filled_pipe
+    assert control.bandwidth() == pytest.approx(rate, rel=0.1)
+    assert control.min_RTT == RTT
+    assert control.window == pytest.approx(control.WINDOW_GAIN * rate * RTT, rel=0.1)
+    assert control.pacing_rate() == pytest.approx(control.pacing_gain * control.bandwidth())
+
+
+def test_bbr_recovery_conserves_the_window():
+    control = congestion.BBRLite(MSS, 64 * MSS)
+    control.window = 40 * MSS
+    control.on_fast_retransmit(30 * MSS)
+    assert control.window == 30 * MSS
+    control.on_duplicate_ack()
+    assert control.window == 31 * MSS
+    control.on_recovery_end(20 * MSS)
+    assert control.window == 40 * MSS
@@ -0,0 +1,138 @@
+import socket
+import time
+
+import pytest
+
+import federation
+import relay
+
+LOCALHOST = "127.0.0.1"
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind((LOCALHOST, 0))
+        return sock.getsockname()[1]
+
+
+def link_nodes(first_name: str, second_name: str) -> tuple:
+    """
+    :return: two nodes, the second one links to the first one
+    """
+    address = (LOCALHOST, free_port())
+    first = federation.Federation(first_name, address, [])
+    return first, federation.Federation(second_name, (LOCALHOST, free_port()), [address])
+
+
+@pytest.fixture
+def nodes():
+    first, second = link_nodes("a", "b")
+    yield first, second
+    first.close()
+    second.close()
+
+
+def pump(*nodes, until=lambda: False, seconds: float = 0.2) -> dict:
+    """
+    Runs the loops of the nodes for a while, or until a condition holds.
+    :return: the messages each node received for its server
+    """
+    received = {node: [] for node in nodes}
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline and not until():
+        for node in nodes:
+            received[node] += node.process()
+            node.flush()
+        time.sleep(0.001)
+    return received
+
+
+def test_parse_address():
+    assert federation.parse_address("example.org:6667") == ("example.org", 6667)
+    assert federation.parse_address(":6667") == (LOCALHOST, 6667)
+
+
+def test_nick_registry_is_replicated(nodes):
+    first, second = nodes
+    pump(first, second)
+    assert first.claim_nick(b"alice")
+    pump(first, second, until=lambda: second.has_nick(b"alice"))
+    assert not second.claim_nick(b"alice")
+    assert first.claim_nick(b"alicia", b"alice")
+    pump(first, second, until=lambda: not second.has_nick(b"alice"))
+    assert second.list_nicks() == [b"alicia"]
+    first.release_nick(b"alicia")
+    pump(first, second, until=lambda: not second.list_nicks())
+    assert second.list_nicks() == []
+
+
+def test_messages_between_nodes(nodes):
+    first, second = nodes
+    pump(first, second)
+    second.claim_nick(b"carol")
+    pump(first, second, until=lambda: first.has_nick(b"carol"))
+    first.broadcast(b"hello everyone")
+    first.channel(b"#python", b"hello channel")
+    first.private(b"carol", b"hello carol")
+    first.private(b"nobody", b"dropped")
+    received = pump(first, second)
+    assert received[second] == [(relay.BROADCAST, [b"hello everyone"]),
+                                (relay.CHANNEL, [b"#python", b"hello channel"]),
+                                (relay.PRIVATE, [b"carol", b"hello carol"])]
+    assert received[first] == []
+
+
+def test_nick_collision(nodes):
+    first, second = nodes
+    pump(first, second)
+    assert first.claim_nick(b"bob") and second.claim_nick(b"bob")  # at the same time
+    received = pump(first, second)
+    assert received[first] == []
+    assert received[second] == [(relay.KILL, [b"bob"])]  # the first node by name keeps it
+    assert first.has_nick(b"bob") and second.has_nick(b"bob")
+
+
+def test_lost_link_forgets_the_users_of_the_node():
+    first, second = link_nodes("a", "b")
+    pump(first, second)
+    second.claim_nick(b"dave")
+    pump(first, second, until=lambda: first.has_nick(b"dave"))
+    assert first.has_nick(b"dave")
+    second.close()
+    pump(first, until=lambda: not first.has_nick(b"dave"))
+    assert not first.has_nick(b"dave")
+    first.close()
+
+
+def test_messages_before_hello_are_kept():
+    first, second = link_nodes("a", "b")
+    second.claim_nick(b"bob")  # before the first node accepted the link
+    second.broadcast(b"early")
+    second.flush()
+    received = pump(first, second)
+    assert first.has_nick(b"bob")
+    assert received[first] == [(relay.BROADCAST, [b"early"])]
+    first.close()
+    second.close()
+
+
+def test_slow_peer_is_linked_again(monkeypatch):
+    monkeypatch.setattr(federation, "PEER_HIGH_WATERMARK", 1 << 16)
+    monkeypatch.setattr(federation, "PEER_LOW_WATERMARK", 1 << 14)
+    first, second = link_nodes("a", "b")
+    second.claim_nick(b"bob")
+    pump(first, second, until=lambda: first.has_nick(b"bob"))
+    message = bytes(1 << 16)
+    for _ in range(1000):  # the second node does not read
+        first.broadcast(message)
+        first.flush()
+        if not first.has_nick(b"bob"):
+            break
+    assert not first.has_nick(b"bob")  # the link was closed instead of dropping messages
+    pump(first, second, until=lambda: first.has_nick(b"bob"), seconds=10)
+    assert first.has_nick(b"bob")  # the second node linked again and claimed its users again
+    first.broadcast(b"after")
+    received = pump(first, second)
+    assert (relay.BROADCAST, [b"after"]) in received[second]
+    first.close()
+    second.close()
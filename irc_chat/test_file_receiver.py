@@ -0,0 +1,140 @@
+import json
+import os
+import random
+
+import pytest
+
+import file_receiver
+import outbound
+import utils
+
+MSS = 1000
+FILE_SIZE = 10 * MSS + 123
+
+
+@pytest.fixture
+def data() -> bytes:
+    return os.urandom(FILE_SIZE)
+
+
+@pytest.fixture
+def receiver(tmp_path) -> file_receiver.FileReceiver:
+    return file_receiver.FileReceiver(("127.0.0.1", 1), str(tmp_path / "out.bin"), MSS, None, 7,
+                                      buffer_capacity=1 << 20)
+
+
+def connect(receiver: file_receiver.FileReceiver, first_seq: int) -> int:
+    """
+    Receives the SYN and the size of the file, as the sender sends them.
+    :return: the sequence number of the first byte of the file
+    """
+    syn = json.dumps({'window_scale': 0, 'mss': MSS, 'offset': 0, 'length': FILE_SIZE,
+                      'total_size': FILE_SIZE}).encode()
+    receiver.receive_segment(utils.pack_header(sequence_number=first_seq, syn=True, data=syn, connection_id=7))
+    size = json.dumps(FILE_SIZE).encode()
+    receiver.receive_segment(utils.pack_header(sequence_number=first_seq + len(syn), data=size, connection_id=7))
+    receiver.acks.clear()
+    return first_seq + len(syn) + len(size)
+
+
+def segments(data: bytes, base_seq: int) -> list:
+    """
+    :return: the data segments of the file, then the FIN
+    """
+    result = [utils.pack_header(sequence_number=base_seq + offset, data=data[offset:offset + MSS], connection_id=7)
+              for offset in range(0, len(data), MSS)]
+    return result + [utils.pack_header(sequence_number=base_seq + len(data), fin=True, data=b'0', connection_id=7)]
+
+
+def last_ack(receiver: file_receiver.FileReceiver) -> bytes:
+    return receiver.acks[-1][0]
+
+
+def read(path: str) -> bytes:
+    with open(path, "rb") as f:
+        return f.read()
+
+
+@pytest.mark.parametrize("first_seq", [1000, utils.SEQ_SPACE - 3 * MSS])  # the sequence numbers may wrap around
+def test_reassembles_out_of_order_segments(receiver, data, first_seq):
+    base_seq = connect(receiver, first_seq)
+    sent = segments(data, base_seq)
+    order = sent[:-1] + random.Random(7).sample(sent[:-1], 4)  # with duplicates
+    random.Random(1).shuffle(order)
+    finished = [receiver.receive_segment(segment) for segment in order + [sent[-1]]]
+    assert finished[-1] and not any(finished[:-1])
+    assert receiver.finished and receiver.done.is_set()
+    assert receiver.buffered_bytes == 0 and receiver.buffer == {}
+    assert receiver.runs == {} and receiver.run_starts == {}
+    assert utils.unpack_header(last_ack(receiver))[1] == (base_seq + FILE_SIZE + 1) % utils.SEQ_SPACE
+    assert read(receiver.output_path) == data
+
+
+def test_sack_blocks_most_recent_first(receiver, data):
+    base_seq = connect(receiver, 1000)
+    sent = segments(data, base_seq)
+    for index in (2, 5, 3, 8):
+        receiver.receive_segment(sent[index])
+    runs = [(base_seq + 8 * MSS, base_seq + 9 * MSS), (base_seq + 2 * MSS, base_seq + 4 * MSS),
+            (base_seq + 5 * MSS, base_seq + 6 * MSS)]
+    assert utils.unpack_sack(last_ack(receiver)) == runs
+    assert receiver.buffered_bytes == 4 * MSS
+    receiver.receive_segment(sent[0])
+    receiver.receive_segment(sent[1])
+    assert utils.unpack_header(last_ack(receiver))[1] == base_seq + 4 * MSS
+    assert utils.unpack_sack(last_ack(receiver)) == [runs[0], runs[2]]
+    assert receiver.buffered_bytes == 2 * MSS
+
+
+def test_out_of_order_segments_beyond_the_buffer(tmp_path, data):
+    receiver = file_receiver.FileReceiver(("127.0.0.1", 1), str(tmp_path / "out.bin"), MSS, None, 7,
+                                          buffer_capacity=2 * MSS)
+    base_seq = connect(receiver, 1000)
+    sent = segments(data, base_seq)
+    for index in (1, 2, 3):
+        receiver.receive_segment(sent[index])
+    assert receiver.buffered_bytes == 2 * MSS  # the third one is dropped
+    assert utils.unpack_header(last_ack(receiver))[5] == 0  # no room left in the window
+    for segment in sent:
+        receiver.receive_segment(segment)  # the next expected segment is always accepted
+    assert receiver.finished
+    assert read(receiver.output_path) == data
+
+
+@pytest.mark.parametrize("thread", [False, True])
+def test_writer_coalesces_contiguous_writes(tmp_path, thread):
+    path = str(tmp_path / "written.bin")
+    size = 2 * file_receiver.WRITE_CHUNK + 100
+    data = os.urandom(size)
+    writer = file_receiver.FileWriter(path, size, thread)
+    writer.allocate(0, size)
+    for offset in range(0, size, 4000):
+        writer.write(offset, data[offset:offset + 4000])
+    writer.close()
+    assert read(path) == data
+    assert file_receiver.WRITE_CHUNK // 4000 < outbound.IOV_MAX
+    assert writer.writes == 3  # a write per WRITE_CHUNK, and one for the rest
+
+
+def test_writer_flushes_on_a_gap(tmp_path):
+    path = str(tmp_path / "written.bin")
+    writer = file_receiver.FileWriter(path, 100)
+    writer.write(0, b"a" * 10)
+    writer.write(10, b"b" * 10)
+    assert writer.writes == 0  # gathered until the chunk ends
+    writer.write(50, b"c" * 10)
+    assert writer.writes == 1
+    writer.write(20, b"d" * 30)
+    writer.close()
+    assert writer.writes == 3
+    assert read(path) == b"a" * 10 + b"b" * 10 + b"d" * 30 + b"c" * 10 + bytes(40)
+
+
+def test_writer_sets_the_file_size(tmp_path):
+    path = str(tmp_path / "written.bin")
+    with open(path, "wb") as f:
+        f.write(b"x" * 1000)
+    writer = file_receiver.FileWriter(path, 10)
+    writer.write(0, b"y")
+    writer.close()
+    assert read(path) == b"y" + b"x" * 9
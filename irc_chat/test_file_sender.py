@@ -0,0 +1,346 @@
+import mmap
+import os
+import threading
+import time
+
+import pytest
+
+import file_receiver
+import file_sender
+import ratelimit
+import utils
+
+LOCALHOST = "127.0.0.1"
+
+
+@pytest.fixture
+def receivers() -> file_receiver.ServerSocket:
+    """
+    Socket the downloads of a test connect from, listening on a daemon thread.
+    """
+    server = file_receiver.ServerSocket(0)
+    threading.Thread(target=server.listen, kwargs={"forever": True}, daemon=True).start()
+    return server
+
+
+@pytest.fixture
+def source(tmp_path) -> str:
+    path = str(tmp_path / "source.bin")
+    with open(path, "wb") as f:
+        f.write(os.urandom(512 * 1024 + 123))
+    return path
+
+
+def make_window(capacity: int = 8, MSS: int = 100, segments: int = 6, first_seq: int = 1000) -> file_sender.SendWindow:
+    """
+    A window holding a SYN of 10 bytes, then segments data segments of MSS bytes, with the data at offset 0 of the
+    file.
+    """
+    window = file_sender.SendWindow(capacity, MSS)
+    header = bytes(utils.HEADER_SIZE)
+    window.append(first_seq, header + bytes(10))
+    for i in range(segments):
+        window.append(first_seq + 10 + i * MSS, header, i * MSS, MSS)
+    return window
+
+
+def read(path: str) -> bytes:
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def run_engine(*senders: file_sender.FileSender) -> threading.Thread:
+    engine = file_sender.SenderEngine()
+    for sender in senders:
+        engine.add(sender)
+    thread = threading.Thread(target=engine.run, kwargs={"until_idle": True}, daemon=True)
+    thread.start()
+    return thread
+
+
+def test_engine_fails_only_the_transfer_that_raised(tmp_path, receivers, source):
+    endpoint = file_sender.SenderEndpoint()
+    broken, healthy = (file_sender.FileSender(None, source, endpoint=endpoint) for _ in range(2))
+
+    def receive_response(segment: bytes):
+        raise OSError("broken handler")
+
+    broken._FileSender__receive_response = receive_response
+    thread = run_engine(broken, healthy)
+    receivers.connect((LOCALHOST, endpoint.port), broken.connection_id, str(tmp_path / "broken.bin"))
+    out_path = str(tmp_path / "out.bin")
+    receiver = receivers.connect((LOCALHOST, endpoint.port), healthy.connection_id, out_path)
+    assert receiver.done.wait(60) and receiver.finished
+    thread.join(60)
+    assert not thread.is_alive()
+    assert broken.finished.is_set() and isinstance(broken.error, OSError)
+    assert healthy.finished.is_set() and healthy.error is None
+    assert read(out_path) == read(source)
+
+
+def test_paused_transfer_proceeds(tmp_path, receivers, source):
+    endpoint = file_sender.SenderEndpoint()
+    proceed, paused = threading.Event(), threading.Event()
+    sender = file_sender.FileSender(None, source, events=[proceed, paused], endpoint=endpoint)
+    thread = run_engine(sender)
+    out_path = str(tmp_path / "out.bin")
+    receiver = receivers.connect((LOCALHOST, endpoint.port), sender.connection_id, out_path)
+    assert paused.wait(60)
+    time.sleep(0.5)
+    assert not receiver.done.is_set()
+    proceed.set()
+    assert receiver.done.wait(60) and receiver.finished
+    thread.join(60)
+    assert read(out_path) == read(source)
+
+
+def test_window_ring_buffer():
+    window = make_window(capacity=4, segments=3)
+    assert window.is_full() and len(window) == 4
+    assert window.data_range(0) == (-1, 10)
+    assert window.data_range(2) == (100, 100)
+    for _ in range(3):
+        window.pop()
+    window.append(1310, bytes(utils.HEADER_SIZE), 300, 50)  # wraps around to the slot of the SYN
+    assert window.head == 3 and window.tail == 5
+    assert window.seq(4) == 1310 and window.end(4) == 1360
+    assert window.data_range(4) == (300, 50)
+
+
+def test_window_find():
+    window = make_window()
+    assert window.find(1000) == 0
+    assert window.find(1010) == 1
+    assert window.find(1410) == 5
+    assert window.find(1050) is None
+    assert window.find(1610) is None  # after the last segment
+    window.pop()
+    window.pop()
+    assert window.find(1010) is None  # acknowledged
+    assert window.find(1110) == 2
+
+
+def test_window_find_after_MSS_change():
+    window = make_window(segments=2)
+    window.set_MSS(50)
+    window.append(1210, bytes(utils.HEADER_SIZE), 200, 50)
+    window.append(1260, bytes(utils.HEADER_SIZE), 250, 50)
+    assert window.find(1110) == 2
+    assert window.find(1210) == 3
+    assert window.find(1260) == 4
+
+
+def test_window_send_state():
+    window = make_window()
+    assert window.has_unsent()
+    window.mark_sent(0, 1.0)
+    window.next_send = 1
+    assert window.send_time(0) == 1.0 and not window.is_retransmitted(0)
+    window.mark_sent(0, 2.0)
+    assert window.is_retransmitted(0)
+    window.pop()
+    assert window.next_send == 1
+    window.pop()
+    assert window.next_send == 2  # never behind the oldest segment
+
+
+def test_window_sack_holes_once_per_recovery():
+    window = make_window()
+    window.next_send = window.tail
+    window.mark_sacked(1210, 1410)  # segments 3 and 4
+    assert window.is_sacked(3) and window.is_sacked(4) and not window.is_sacked(5)
+    assert window.highest_sacked == 4
+    assert window.take_holes() == [0, 1, 2]
+    assert window.take_holes() == []
+    window.mark_sacked(1510, 1610)
+    assert window.take_holes() == [5]
+    window.new_recovery()
+    assert window.take_holes() == [0, 1, 2, 5]
+
+
+def test_window_sack_ignores_unknown_blocks():
+    window = make_window()
+    window.next_send = 3
+    window.mark_sacked(1050, 1310)  # does not start at a segment
+    window.mark_sacked(1310, 1510)  # not sent yet
+    assert window.highest_sacked == -1
+
+
+def test_window_rewind_after_timeout():
+    window = make_window()
+    window.next_send = window.tail
+    window.mark_sacked(1110, 1210)
+    window.take_holes()
+    window.rewind()
+    assert window.next_send == 1
+    assert window.take_holes() == [0]  # the rest is sent again in order
+
+
+def test_window_lost_retransmission():
+    window = make_window()
+    for index in range(4):
+        window.mark_sent(index, 1.0 + index)
+    window.next_send = 4
+    window.mark_sent(0, 3.5)  # retransmitted after segment 2 was sent
+    window.mark_sacked(1110, 1210)  # segment 2, sent at 3.0
+    assert not window.is_lost(0, 0.0)
+    assert window.is_lost(1, 0.0)
+    assert not window.is_lost(1, 1.5)  # may still be reordered
+    window.mark_sacked(1210, 1310)  # segment 3, sent after the retransmission
+    assert window.is_lost(0, 0.0)
+
+
+@pytest.mark.parametrize("size", [0, 1, 4 * 1024, 3 * mmap.PAGESIZE + 1])
+def test_transfer_from_memory_map(tmp_path, receivers, size):
+    source = str(tmp_path / "source.bin")
+    with open(source, "wb") as f:
+        f.write(os.urandom(size))
+    endpoint = file_sender.SenderEndpoint()
+    sender = file_sender.FileSender(None, source, endpoint=endpoint, plpmtud=False, MSS=1024)
+    thread = run_engine(sender)
+    out_path = str(tmp_path / "out.bin")
+    receiver = receivers.connect((LOCALHOST, endpoint.port), sender.connection_id, out_path)
+    assert receiver.done.wait(60) and receiver.finished
+    thread.join(60)
+    assert read(out_path) == read(source)
+    assert sender.map is None or sender.map.closed  # unmapped once finished
+
+
+def test_path_MTU_search_confirms_the_largest_size():
+    search = file_sender.PathMTUSearch(1200, 9000)
+    assert search.probe_size == 9000
+    assert search.acknowledged(9000)
+    assert search.size == 9000 and search.probe_size is None
+    assert not search.acknowledged(9000)
+
+
+def test_path_MTU_search_binary_search():
+    path_MTU = 1500
+    search = file_sender.PathMTUSearch(1200, 9000)
+    while search.probe_size is not None:
+        if search.probe_size <= path_MTU:
+            assert search.acknowledged(search.probe_size)
+        else:
+            for _ in range(file_sender.MAX_PROBES):
+                search.lost()
+    assert path_MTU - file_sender.SEARCH_GRANULARITY < search.size <= path_MTU
+
+
+def test_path_MTU_search_ignores_stale_sizes():
+    search = file_sender.PathMTUSearch(1200, 9000)
+    for _ in range(file_sender.MAX_PROBES - 1):
+        search.lost()
+    assert search.probe_size == 9000  # not lost often enough yet
+    assert not search.acknowledged(1100)
+    assert not search.acknowledged(10000)
+    assert search.size == 1200
+    assert file_sender.PathMTUSearch(1200, 1000).probe_size is None
+
+
+@pytest.mark.parametrize("file_size, streams", [(0, 1), (100, 3), (mmap.PAGESIZE * 10 + 1, 4), (mmap.PAGESIZE, 2)])
+def test_stripe_ranges(file_size, streams):
+    ranges = file_sender.stripe_ranges(file_size, streams)
+    assert len(ranges) == streams
+    assert ranges[0][0] == 0 and ranges[-1][1] == file_size
+    for (_, end), (start, _) in zip(ranges, ranges[1:]):
+        assert end == start
+        assert start % mmap.PAGESIZE == 0 or start == file_size
+
+
+def test_striped_transfer(tmp_path, receivers, source):
+    endpoint = file_sender.SenderEndpoint()
+    senders = file_sender.offer_stripes(endpoint, source, 3)
+    out_path = str(tmp_path / "out.bin")
+    downloads = [receivers.connect((LOCALHOST, endpoint.port), sender.connection_id, out_path) for sender in senders]
+    for receiver in downloads:
+        assert receiver.done.wait(60) and receiver.finished
+    assert read(out_path) == read(source)
+
+
+def test_endpoint_connection_ids(source):
+    endpoint = file_sender.SenderEndpoint()
+    with endpoint.socket:
+        sender = file_sender.FileSender(None, source, endpoint=endpoint)
+        ids = {endpoint.connection_id() for _ in range(100)}
+        assert len(ids) == 100 and sender.connection_id not in ids
+        endpoint.add(sender)
+        assert endpoint.transfers == {sender.connection_id: sender}
+        endpoint.remove(sender)
+        assert endpoint.transfers == {}
+
+
+def test_transfers_share_one_port(tmp_path, receivers, source):
+    endpoint = file_sender.SenderEndpoint()
+    senders = [file_sender.FileSender(None, source, endpoint=endpoint) for _ in range(4)]
+    thread = run_engine(*senders)
+    downloads = [receivers.connect((LOCALHOST, endpoint.port), sender.connection_id, str(tmp_path / f"out{i}.bin"))
+                 for i, sender in enumerate(senders)]
+    for receiver in downloads:
+        assert receiver.done.wait(60) and receiver.finished
+        assert read(receiver.output_path) == read(source)
+    thread.join(60)
+    assert not thread.is_alive()
+    assert endpoint.transfers == {}
+
+
+def test_rate_limited_transfer(tmp_path, receivers, source):
+    endpoint = file_sender.SenderEndpoint()
+    rate = 4 << 20
+    bucket = ratelimit.TokenBucket(rate)
+    sender = file_sender.FileSender(None, source, endpoint=endpoint, rate_limit=2 * rate, shared_bucket=bucket)
+    thread = run_engine(sender)
+    out_path = str(tmp_path / "out.bin")
+    start = time.monotonic()
+    receiver = receivers.connect((LOCALHOST, endpoint.port), sender.connection_id, out_path)
+    assert receiver.done.wait(60) and receiver.finished
+    assert time.monotonic() - start >= (os.path.getsize(source) - bucket.burst) / rate
+    thread.join(60)
+    assert read(out_path) == read(source)
+    assert bucket.senders == {}  # forgotten once finished
+
+
+@pytest.fixture
+def rto_sender(source) -> file_sender.FileSender:
+    """
+    A transfer with nothing in flight, whose RTO estimator is driven by hand.
+    """
+    sender = file_sender.FileSender(None, source, endpoint=file_sender.SenderEndpoint())
+    sender.buffer = make_window()
+    sender.MSS = 100
+    sender.seq_num = sender.next_byte_seq_num = 1000
+    return sender
+
+
+def test_RTO_first_sample(rto_sender):
+    update = rto_sender._FileSender__update_timeout_interval
+    assert rto_sender.timeout_interval == file_sender.INITIAL_RTO
+    update(0.5)
+    assert rto_sender.estimated_RTT == 0.5 and rto_sender.deviation_RTT == 0.25
+    assert rto_sender.timeout_interval == pytest.approx(1.5)
+
+
+def test_RTO_smoothing(rto_sender):
+    update = rto_sender._FileSender__update_timeout_interval
+    update(0.5)
+    update(1.0)
+    assert rto_sender.deviation_RTT == pytest.approx(0.3125)
+    assert rto_sender.estimated_RTT == pytest.approx(0.5625)
+    assert rto_sender.timeout_interval == pytest.approx(1.8125)
+
+
+def test_RTO_gains_per_segment_in_flight(rto_sender):
+    update = rto_sender._FileSender__update_timeout_interval
+    update(0.5)
+    rto_sender.buffer.next_send = rto_sender.buffer.tail
+    rto_sender.next_byte_seq_num = 1000 + 4 * rto_sender.MSS  # an ACK is expected for each of 4 segments
+    update(1.0)
+    assert rto_sender.estimated_RTT == pytest.approx(0.5 + 0.125 / 4 * 0.5)
+
+
+def test_RTO_bounds(rto_sender):
+    update = rto_sender._FileSender__update_timeout_interval
+    update(0.001)
+    assert rto_sender.timeout_interval == file_sender.MIN_RTO
+    rto_sender.estimated_RTT = None
+    update(100.0)
+    assert rto_sender.timeout_interval == file_sender.MAX_RTO
@@ -0,0 +1,71 @@
+import socket
+
+import pytest
+
+import framing
+
+
+@pytest.mark.parametrize("mode", framing.MODES)
+def test_messages_split_across_reads(mode):
+    messages = [b"<connect> alice", b"", b"hello " * 1000, b"last"]
+    data = b"".join(framing.encode(message, mode) for message in messages)
+    reader = framing.FrameReader(mode, capacity=16)
+    received = []
+    for i in range(0, len(data), 7):
+        reader.feed(data[i:i + 7])
+        received.extend(bytes(frame) for frame in reader)
+    assert received == messages
+    assert len(reader) == 0
+
+
+def test_line_accepts_bare_newline():
+    reader = framing.FrameReader()
+    reader.feed(b"first\nsecond\r\n")
+    assert [bytes(frame) for frame in reader] == [b"first", b"second"]
+
+
+def test_length_keeps_delimiters_in_messages():
+    reader = framing.FrameReader(framing.LENGTH)
+    reader.feed(framing.encode(b"two\r\nlines", framing.LENGTH))
+    assert bytes(reader.next_frame()) == b"two\r\nlines"
+
+
+def test_mode_switch_between_messages():
+    reader = framing.FrameReader()
+    reader.feed(b"<framing> length\r\n" + framing.encode(b"framed", framing.LENGTH))
+    assert bytes(reader.next_frame()) == b"<framing> length"
+    reader.mode = framing.LENGTH
+    assert bytes(reader.next_frame()) == b"framed"
+
+
+@pytest.mark.parametrize("mode", framing.MODES)
+def test_oversized_message(mode):
+    reader = framing.FrameReader(mode, max_frame_size=64)
+    reader.feed(framing.encode(b"x" * 65, mode)[:-1])
+    with pytest.raises(framing.FramingError):
+        reader.next_frame()
+
+
+def test_unknown_mode():
+    with pytest.raises(framing.FramingError):
+        framing.FrameReader("json")
+
+
+def test_frame_kept_across_growth():
+    reader = framing.FrameReader(capacity=8)
+    reader.feed(b"kept\r\n")
+    frame = reader.next_frame()
+    reader.feed(b"a longer message than the buffer\r\n")
+    assert bytes(frame) == b"kept"
+    assert bytes(reader.next_frame()) == b"a longer message than the buffer"
+
+
+def test_recv_into():
+    left, right = socket.socketpair()
+    with left, right:
+        reader = framing.FrameReader()
+        left.sendall(b"one\r\ntw")
+        assert reader.recv_into(right) == 7
+        assert [bytes(frame) for frame in reader] == [b"one"]
+        left.close()
+        assert reader.recv_into(right) == 0
@@ -0,0 +1,79 @@
+import os
+import threading
+
+import pytest
+
+import file_receiver
+import file_sender
+import manifest
+
+
+@pytest.fixture
+def source(tmp_path) -> str:
+    path = str(tmp_path / "source.bin")
+    with open(path, "wb") as f:
+        f.write(os.urandom(3 * manifest.CHUNK_SIZE + 100))
+    return path
+
+
+def write_copy(source: str, path: str, corrupt_at: int = None, size: int = None):
+    with open(source, "rb") as f:
+        data = bytearray(f.read())
+    if corrupt_at is not None:
+        data[corrupt_at] ^= 0xFF
+    with open(path, "wb") as f:
+        f.write(data[:size])
+
+
+def test_manifest_of_file(source):
+    file_manifest = manifest.file_manifest(source)
+    assert file_manifest.file_size == os.path.getsize(source)
+    assert len(file_manifest.digests) == 4
+    assert all(len(digest) == 2 * manifest.DIGEST_SIZE for digest in file_manifest.digests)
+    assert manifest.file_manifest(source) is file_manifest  # cached until the file changes
+
+
+def test_manifest_encoding(source):
+    file_manifest = manifest.file_manifest(source)
+    decoded = manifest.Manifest.decode(str(file_manifest.file_size), str(file_manifest.chunk_size),
+                                       file_manifest.encode() + "\n")
+    assert decoded.file_size == file_manifest.file_size
+    assert decoded.chunk_size == file_manifest.chunk_size
+    assert decoded.digests == file_manifest.digests
+
+
+def test_verified_end(tmp_path, source):
+    file_manifest = manifest.file_manifest(source)
+    path = str(tmp_path / "partial.bin")
+    assert file_manifest.verified_end(path, 0, file_manifest.file_size) == 0  # no file yet
+    write_copy(source, path, corrupt_at=2 * manifest.CHUNK_SIZE + 5)
+    assert file_manifest.verified_end(path, 0, file_manifest.file_size) == 2 * manifest.CHUNK_SIZE
+    assert file_manifest.verified_end(path, manifest.CHUNK_SIZE, manifest.CHUNK_SIZE + 10) == manifest.CHUNK_SIZE + 10
+    write_copy(source, path, size=manifest.CHUNK_SIZE + 10)  # the second chunk is cut short
+    assert file_manifest.verified_end(path, 0, file_manifest.file_size) == manifest.CHUNK_SIZE
+
+
+def test_first_mismatch(tmp_path, source):
+    file_manifest = manifest.file_manifest(source)
+    path = str(tmp_path / "copy.bin")
+    write_copy(source, path)
+    assert file_manifest.first_mismatch(path) is None
+    write_copy(source, path, corrupt_at=file_manifest.file_size - 1)
+    assert file_manifest.first_mismatch(path) == 3 * manifest.CHUNK_SIZE
+    write_copy(source, path, size=100)
+    assert file_manifest.first_mismatch(path) == 0
+
+
+def test_download_resumes_after_verified_chunks(tmp_path, source):
+    receivers = file_receiver.ServerSocket(0)
+    threading.Thread(target=receivers.listen, kwargs={"forever": True}, daemon=True).start()
+    endpoint = file_sender.SenderEndpoint()
+    sender = file_sender.FileSender(None, source, endpoint=endpoint)
+    file_sender.shared_engine().add(sender)
+    path = str(tmp_path / "partial.bin")
+    write_copy(source, path, corrupt_at=2 * manifest.CHUNK_SIZE + 5)
+    receiver = receivers.connect(("127.0.0.1", endpoint.port), sender.connection_id, path,
+                                 manifest.file_manifest(source))
+    assert receiver.done.wait(60) and receiver.finished
+    assert receiver.resume == 2 * manifest.CHUNK_SIZE
+    assert manifest.file_manifest(source).first_mismatch(path) is None
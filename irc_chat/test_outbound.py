@@ -0,0 +1,102 @@
+import socket
+
+import pytest
+
+import outbound
+
+
+def drain(sock: socket.socket) -> bytes:
+    data = b""
+    while True:
+        try:
+            data += sock.recv(1 << 20)
+        except BlockingIOError:
+            return data
+
+
+def test_drop_while_throttled():
+    queue = outbound.OutboundQueue(10, 4)
+    assert queue.push(b"123456")
+    assert queue.push(b"7890")
+    assert queue.throttled
+    assert not queue.push(b"dropped")
+    assert queue.dropped == 1
+    assert len(queue) == 10
+
+
+def test_disconnect_while_throttled():
+    queue = outbound.OutboundQueue(10, 4, outbound.DISCONNECT)
+    queue.push(b"x" * 10)
+    with pytest.raises(outbound.SlowConsumerError):
+        queue.push(b"y")
+
+
+def test_invalid_parameters():
+    with pytest.raises(ValueError):
+        outbound.OutboundQueue(policy="block")
+    with pytest.raises(ValueError):
+        outbound.OutboundQueue(4, 10)
+
+
+def test_throttled_until_below_low_watermark():
+    left, right = socket.socketpair()
+    with left, right:
+        left.setblocking(False)
+        right.setblocking(False)
+        queue = outbound.OutboundQueue(1 << 20, 1 << 10)
+        sent = []
+        while not queue.throttled:
+            sent.append(bytes([len(sent) % 256]) * 4096)
+            queue.push(sent[-1])
+        assert not queue.flush(left)  # more than the socket buffers
+        assert queue.throttled
+        received = drain(right)
+        while not queue.flush(left):
+            received += drain(right)
+        received += drain(right)
+        assert not queue.throttled
+        assert len(queue) == 0
+        assert received == b"".join(sent)
+        assert queue.push(b"accepted again")
+
+
+class RecordingSocket:
+    """
+    Accepts up to limit bytes per call, and records whether each call gathered several buffers.
+    """
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.calls = []
+        self.data = b""
+
+    def sendmsg(self, buffers):
+        return self.send(b"".join(bytes(buffer) for buffer in buffers), gathered=True)
+
+    def send(self, data, gathered=False):
+        data = bytes(data)[:self.limit]
+        self.calls.append(gathered)
+        self.data += data
+        return len(data)
+
+
+def test_flush_gathers_messages():
+    queue = outbound.OutboundQueue()
+    messages = [b"message %d\r\n" % i for i in range(outbound.IOV_MAX + 10)]
+    for message in messages:
+        queue.push(message)
+    sock = RecordingSocket(1 << 20)
+    assert queue.flush(sock)
+    assert sock.calls == [True, True]  # IOV_MAX messages at a time
+    assert sock.data == b"".join(messages)
+
+
+def test_flush_resumes_partial_message():
+    queue = outbound.OutboundQueue()
+    for message in (b"first", b"second", b"third"):
+        queue.push(message)
+    sock = RecordingSocket(8)
+    while not queue.flush(sock):
+        pass
+    assert sock.data == b"firstsecondthird"
+    assert len(queue) == 0
@@ -0,0 +1,58 @@
+import pytest
+
+import ratelimit
+import utils
+
+
+def test_invalid_rate():
+    with pytest.raises(ValueError):
+        ratelimit.TokenBucket(0)
+
+
+def test_burst_then_rate():
+    bucket = ratelimit.TokenBucket(1000, burst=500)
+    assert bucket.delay(500, 10.0) == 0
+    bucket.consume(500, 10.0)
+    assert bucket.delay(100, 10.0) == pytest.approx(0.1)
+    assert bucket.delay(100, 10.05) == pytest.approx(0.05)
+    assert bucket.delay(100, 11.0) == 0
+    assert bucket.tokens == 500  # no more than the burst
+
+
+def test_datagram_larger_than_the_burst():
+    bucket = ratelimit.TokenBucket(1000, burst=500)
+    assert bucket.delay(2000, 0.0) == 0  # waits for a full bucket, not forever
+
+
+def test_debt_delays_the_next_datagrams():
+    bucket = ratelimit.TokenBucket(1000, burst=500)
+    bucket.consume(800, 0.0)  # a retransmission is sent at once
+    assert bucket.tokens == -300
+    assert bucket.delay(100, 0.0) == pytest.approx(0.4)
+
+
+def test_default_burst_fits_a_datagram():
+    assert ratelimit.TokenBucket(1).burst >= utils.MAX_DATAGRAM_SIZE
+
+
+def test_share_between_recent_senders():
+    bucket = ratelimit.TokenBucket(1000, burst=500)
+    assert bucket.share(0.0) is None  # full
+    bucket.consume(300, 0.0, "first")
+    bucket.consume(100, 0.0, "second")
+    assert bucket.share(0.0) == 500
+    bucket.consume(100, 0.05, "first")
+    assert bucket.share(0.05 + ratelimit.IDLE_TIME / 2) == 500
+    bucket.consume(400, 0.12, "first")
+    assert bucket.share(0.12) == 1000  # the second one is idle
+    assert list(bucket.senders) == ["first"]
+
+
+def test_removed_sender_gives_its_share_back():
+    bucket = ratelimit.TokenBucket(1000, burst=500)
+    bucket.consume(300, 0.0, "first")
+    bucket.consume(100, 0.0, "second")
+    bucket.remove("second")
+    bucket.remove("unknown")
+    assert bucket.share(0.0) == 1000
+    assert list(bucket.senders) == ["first"]
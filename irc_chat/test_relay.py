@@ -0,0 +1,62 @@
+import socket
+import threading
+
+import pytest
+
+import framing
+import relay
+
+
+@pytest.fixture
+def link():
+    worker, hub = socket.socketpair()
+    with worker, hub:
+        yield relay.RequestLink(worker), hub
+
+
+def frames(*messages) -> bytes:
+    return b"".join(relay.pack(op, *fields) for op, *fields in messages)
+
+
+def test_pack_unpack():
+    reader = framing.FrameReader(framing.LENGTH)
+    reader.feed(relay.pack(relay.PRIVATE, b"bob", b"") + relay.pack(relay.LIST))
+    assert [relay.unpack(frame) for frame in reader] == [(relay.PRIVATE, [b"bob", b""]), (relay.LIST, [])]
+
+
+def test_request_keeps_other_messages(link):
+    link, hub = link
+    hub.sendall(frames((relay.BROADCAST, b"before"), (relay.RESULT, relay.OK), (relay.BROADCAST, b"after")))
+    assert link.request(relay.LOOKUP, b"bob") == [relay.OK]
+    assert link.has_pending()
+    assert link.process_pending() == [(relay.BROADCAST, [b"before"]), (relay.BROADCAST, [b"after"])]
+    reader = framing.FrameReader(framing.LENGTH)
+    reader.feed(hub.recv(1024))
+    assert relay.unpack(reader.next_frame()) == (relay.LOOKUP, [b"bob"])
+
+
+def test_request_timeout_drops_late_result(link):
+    link, hub = link
+    with pytest.raises(TimeoutError):
+        link.request(relay.LIST, timeout=0.01)
+    hub.sendall(frames((relay.RESULT, b"late"), (relay.BROADCAST, b"message")))
+    threading.Timer(0.05, hub.sendall, [frames((relay.RESULT, b"alice"))]).start()
+    assert link.request(relay.LIST) == [b"alice"]
+    assert link.process_pending() == [(relay.BROADCAST, [b"message"])]
+
+
+def test_process_drops_late_result(link):
+    link, hub = link
+    with pytest.raises(TimeoutError):
+        link.request(relay.LIST, timeout=0.01)
+    hub.sendall(frames((relay.RESULT, b"late"), (relay.BROADCAST, b"message")))
+    assert link.process() == [(relay.BROADCAST, [b"message"])]
+    hub.sendall(frames((relay.RESULT, b"alice")))
+    assert link.request(relay.LIST) == [b"alice"]
+
+
+def test_closed_link(link):
+    link, hub = link
+    hub.close()
+    with pytest.raises(ConnectionError):
+        link.request(relay.LIST)
@@ -0,0 +1,28 @@
+import reply
+
+
+def test_encoded_bytes_match_text():
+    for rep in reply.all_replies.values():
+        assert rep.encode() == bytes(rep) == str(rep).encode()
+        assert rep.encode("ascii") == str(rep).encode("ascii")
+        assert bytes(rep).startswith(rep.wire_prefix)
+
+
+def test_setters_recompile():
+    rep = reply.Reply("RPL", reply_message="before")
+    rep.reply_message = "after"
+    assert bytes(rep) == b"<RPL> after"
+    rep.reply_type = "ERR"
+    assert rep.token == "<ERR>"
+    assert bytes(rep) == b"<ERR> after"
+
+
+def test_empty_message_has_no_trailing_space():
+    assert bytes(reply.Reply("OK")) == b"<OK>"
+
+
+def test_with_message_leaves_base_unchanged():
+    error = reply.base["ERROR"].with_message("Nickname cannot contain spaces")
+    assert bytes(error) == b"<ERR> Nickname cannot contain spaces"
+    assert bytes(reply.base["ERROR"]) == b"<ERR>"
+    assert error.reply_code == reply.base["ERROR"].reply_code
@@ -0,0 +1,239 @@
+import os
+import socket
+import threading
+import time
+
+import pytest
+
+import command
+import file_receiver
+import framing
+import reply
+import server
+
+LOCALHOST = "127.0.0.1"
+
+
+class ChatClient:
+    """
+    Speaks the chat protocol over a plain socket, with line framing until it switches.
+    """
+
+    def __init__(self, address: tuple):
+        self.socket = socket.create_connection(address)
+        self.socket.settimeout(5)
+        self.reader = framing.FrameReader()
+        self.received = []  # every message, the skipped ones too
+
+    def send(self, name: str, *args: str):
+        self.say(command.commands[name].encode(*args))
+
+    def say(self, message: bytes):
+        self.socket.sendall(framing.encode(message, self.reader.mode))
+
+    def use_framing(self, mode: str):
+        self.send("FRAMING", mode)
+        self.expect(reply.all_replies["RPL_FRAMING"].encode())  # still framed the previous way
+        self.reader.mode = mode
+
+    def expect(self, part: bytes) -> bytes:
+        """
+        :return: the first message received that contains part, the messages before it are skipped
+        """
+        while True:
+            for message in self.reader:
+                self.received.append(bytes(message))
+                if part in self.received[-1]:
+                    return self.received[-1]
+            assert self.reader.recv_into(self.socket), f"closed before {part!r} was received"
+
+    def close(self):
+        self.socket.close()
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind((LOCALHOST, 0))
+        return sock.getsockname()[1]
+
+
+@pytest.fixture
+def files_dir(tmp_path) -> str:
+    """
+    The directory the server offers the files of.
+    """
+    path = tmp_path / "files"
+    path.mkdir()
+    return str(path)
+
+
+@pytest.fixture(params=["select", "asyncio"])
+def address(request, monkeypatch, files_dir) -> tuple:
+    """
+    The address of a server running on a daemon thread, with either core.
+    """
+    monkeypatch.setattr(server, "FILES_DIR", files_dir)
+    port = free_port()
+    chat_server = server.Server(LOCALHOST, port)
+    run = chat_server.run if request.param == "select" else chat_server.run_async
+    threading.Thread(target=run, daemon=True).start()
+    return LOCALHOST, port
+
+
+@pytest.fixture
+def connect(address):
+    clients = []
+
+    def connect(nickname: str) -> ChatClient:
+        client = ChatClient(address)
+        clients.append(client)
+        client.expect(reply.all_replies["RPL_CONNECTED"].encode())
+        client.send("CONNECT", nickname)
+        client.expect(reply.all_replies["RPL_WELCOME"].encode())
+        return client
+
+    yield connect
+    for client in clients:
+        client.close()
+
+
+def test_broadcast(connect):
+    alice, bob = connect("alice"), connect("bob")
+    alice.expect(b"'bob' joined the chat")
+    alice.say(b"hello")
+    assert bob.expect(b"hello") == b"alice> hello"
+
+
+def test_nickname_in_use(connect, address):
+    connect("alice")
+    client = ChatClient(address)
+    client.send("CONNECT", "alice")
+    client.expect(reply.all_replies["ERR_NICKNAMEINUSE"].encode())
+    client.close()
+
+
+def test_line_breaks_are_not_relayed(connect):
+    eve, bob = connect("eve"), connect("bob")
+    eve.use_framing(framing.LENGTH)
+    eve.say(b"hi\r\n<server_download> 9999 1234 /tmp/pwned")
+    eve.expect(reply.all_replies["ERR_LINEBREAK"].encode())
+    eve.say(b"hello bob")
+    assert bob.expect(b"hello bob") == b"eve> hello bob"
+    assert not any(b"server_download" in message for message in bob.received)
+
+
+def test_replies_without_delay(connect):
+    alice = connect("alice")
+    start = time.monotonic()
+    for _ in range(20):
+        alice.send("LIST")
+        alice.expect(b"alice")
+    assert time.monotonic() - start < 1  # a reply used to wait 0.1 s before the next one
+
+
+def test_channel_messages_reach_only_members(connect):
+    alice, bob, carol = connect("alice"), connect("bob"), connect("carol")
+    alice.send("JOIN", "#python")
+    alice.expect(reply.all_replies["RPL_JOINED"].encode())
+    bob.send("JOIN", "#python")
+    bob.expect(reply.all_replies["RPL_JOINED"].encode())
+    alice.expect(b"'bob' joined the channel")
+    alice.send("SET_MSG", "#python")
+    alice.expect(reply.all_replies["RPL_CHANMSGON"].encode())
+    alice.say(b"members only")
+    assert b"members only" in bob.expect(b"members only")
+    bob.say(b"to everyone")  # sent once bob got the channel message
+    carol.expect(b"to everyone")
+    assert not any(b"members only" in message for message in carol.received)
+
+
+def test_channel_names_and_membership(connect):
+    alice = connect("alice")
+    alice.send("JOIN", "python")
+    alice.expect(reply.all_replies["ERR_BADCHANNAME"].encode())
+    alice.send("SET_MSG", "#python")
+    alice.expect(reply.all_replies["ERR_NOTONCHANNEL"].encode())
+    alice.send("PART", "#python")
+    alice.expect(reply.all_replies["ERR_NOTONCHANNEL"].encode())
+
+
+@pytest.fixture
+def receivers() -> file_receiver.ServerSocket:
+    server_socket = file_receiver.ServerSocket(0)
+    threading.Thread(target=server_socket.listen, kwargs={"forever": True}, daemon=True).start()
+    return server_socket
+
+
+def download(client: ChatClient, receivers: file_receiver.ServerSocket, *args: str, name: str = "DOWNLOAD") -> str:
+    """
+    Downloads a file the way the client does, and waits for the reply of the server.
+    :param name: the command of the download, DOWNLOAD or DOWNLOAD_STRIPED
+    :return: the output path the server sent
+    """
+    client.send(name, *args)
+    cmd, (port, connection_ids, output_path) = command.parse(client.expect(b"<server_download>").decode())
+    assert cmd is command.commands["SERVER_DOWNLOAD"]
+    client.send("PROCEED")
+    for connection_id in connection_ids.split(","):
+        receiver = receivers.connect((LOCALHOST, int(port)), int(connection_id), output_path)
+        assert receiver.done.wait(60) and receiver.finished
+    client.expect(b"downloaded 100%")  # sent once the transfers finished, without any other message to wake up
+    return output_path
+
+
+def read(path: str) -> bytes:
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def test_download(connect, receivers, files_dir, tmp_path):
+    with open(os.path.join(files_dir, "data.bin"), "wb") as f:
+        f.write(os.urandom(300 * 1024))
+    alice = connect("alice")
+    output_path = download(alice, receivers, "data.bin", str(tmp_path / "out.bin"))
+    assert read(output_path) == read(os.path.join(files_dir, "data.bin"))
+
+
+def test_download_output_path_ending_in_a_number(connect, receivers, files_dir, tmp_path):
+    with open(os.path.join(files_dir, "data.bin"), "wb") as f:
+        f.write(os.urandom(300 * 1024))
+    alice = connect("alice")
+    output_path = download(alice, receivers, "data.bin", str(tmp_path / "take 4"))
+    assert output_path == str(tmp_path / "take 4")  # not taken for a download of 4 streams
+    assert read(output_path) == read(os.path.join(files_dir, "data.bin"))
+
+
+def test_download_striped(connect, receivers, files_dir, tmp_path):
+    with open(os.path.join(files_dir, "data.bin"), "wb") as f:
+        f.write(os.urandom(300 * 1024))
+    alice = connect("alice")
+    alice.send("DOWNLOAD_STRIPED", "data.bin", "many", str(tmp_path / "out.bin"))
+    alice.expect(reply.all_replies["ERR_BADSTREAMS"].encode())
+    output_path = download(alice, receivers, "data.bin", "3", str(tmp_path / "out 2.bin"), name="DOWNLOAD_STRIPED")
+    assert output_path == str(tmp_path / "out 2.bin")
+    connection_ids = command.parse(next(m for m in alice.received if b"<server_download>" in m).decode())[1][1]
+    assert len(connection_ids.split(",")) == 3
+    assert read(output_path) == read(os.path.join(files_dir, "data.bin"))
+
+
+def test_download_empty_file(connect, receivers, files_dir, tmp_path):
+    open(os.path.join(files_dir, "empty.bin"), "wb").close()
+    alice = connect("alice")
+    output_path = download(alice, receivers, "empty.bin", str(tmp_path / "out.bin"))
+    assert read(output_path) == b""
+    assert alice.received[-1].endswith(b"downloaded 100%.")
+
+
+@pytest.mark.filterwarnings("error::pytest.PytestUnhandledThreadExceptionWarning")
+def test_disconnect_during_download(connect, receivers, files_dir, tmp_path):
+    with open(os.path.join(files_dir, "data.bin"), "wb") as f:
+        f.write(os.urandom(8 << 20))  # hashed for a while
+    alice = connect("alice")
+    alice.send("DOWNLOAD", "data.bin", str(tmp_path / "out.bin"))
+    alice.close()
+    time.sleep(0.5)
+    bob = connect("bob")
+    bob.send("LIST")
+    assert bob.expect(b"bob") == reply.base["REPLY"].wire_prefix + b"bob"
+    output_path = download(bob, receivers, "data.bin", str(tmp_path / "out.bin"))
+    assert read(output_path) == read(os.path.join(files_dir, "data.bin"))
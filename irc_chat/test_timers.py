@@ -0,0 +1,80 @@
+import pytest
+
+import timers
+
+TICK = 1 / 64  # exact in binary floating point, so the clock lands on the ticks
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(timers, "time", clock)
+    return clock
+
+
+def test_timers_fire_in_order_once_due(clock):
+    wheel = timers.TimerWheel(tick=TICK, slots=8)
+    fired = []
+    wheel.schedule(5 * TICK, lambda: fired.append("late"))
+    wheel.schedule(TICK, lambda: fired.append("early"))
+    wheel.advance()
+    assert fired == []
+    clock.now += 2.5 * TICK
+    wheel.advance()
+    assert fired == ["early"]
+    clock.now += 5 * TICK
+    wheel.advance()
+    assert fired == ["early", "late"]
+    assert len(wheel) == 0
+
+
+def test_cancelled_timer_does_not_fire(clock):
+    wheel = timers.TimerWheel(tick=TICK, slots=8)
+    fired = []
+    wheel.schedule(TICK, lambda: fired.append(True)).cancel()
+    clock.now += 1
+    wheel.advance()
+    assert fired == []
+    assert len(wheel) == 0
+
+
+def test_timer_beyond_a_revolution(clock):
+    wheel = timers.TimerWheel(tick=TICK, slots=8)
+    fired = []
+    wheel.schedule(20 * TICK, lambda: fired.append(True))  # the wheel has 8 slots
+    for _ in range(19):
+        clock.now += TICK
+        wheel.advance()
+    assert fired == []
+    clock.now += 2 * TICK
+    wheel.advance()
+    assert fired == [True]
+
+
+def test_next_timeout(clock):
+    wheel = timers.TimerWheel(tick=TICK, slots=8)
+    assert wheel.next_timeout() is None
+    wheel.schedule(3 * TICK, lambda: None)
+    assert 3 * TICK <= wheel.next_timeout() <= 4 * TICK
+    wheel.schedule(50 * TICK, lambda: None)
+    assert wheel.next_timeout() <= 4 * TICK
+
+
+def test_timer_scheduled_by_a_callback(clock):
+    wheel = timers.TimerWheel(tick=TICK, slots=8)
+    fired = []
+    wheel.schedule(TICK, lambda: wheel.schedule(0, lambda: fired.append(True)))
+    clock.now += 2 * TICK
+    wheel.advance()
+    assert fired == []  # on the next tick, not in the same advance
+    clock.now += TICK
+    wheel.advance()
+    assert fired == [True]
@@ -0,0 +1,72 @@
+import socket
+import time
+
+import pytest
+
+import udpio
+
+LOCALHOST = "127.0.0.1"
+
+
+@pytest.fixture
+def sockets():
+    sender, receiver = (socket.socket(socket.AF_INET, socket.SOCK_DGRAM) for _ in range(2))
+    with sender, receiver:
+        sender.bind((LOCALHOST, 0))
+        receiver.bind((LOCALHOST, 0))
+        receiver.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 1 << 20)
+        yield sender, receiver
+
+
+def receive_all(io: udpio.DatagramIO, count: int) -> list:
+    received = []
+    deadline = time.monotonic() + 10
+    while len(received) < count and time.monotonic() < deadline:
+        received += io.receive(count - len(received), 2048, timeout=0.1)
+    return received
+
+
+@pytest.mark.parametrize("mode", udpio.MODES)
+def test_round_trip(sockets, mode):
+    sender, receiver = sockets
+    if mode not in udpio.supported_modes(sender):
+        pytest.skip(f"{mode} is not supported here")
+    sender_io, receiver_io = udpio.DatagramIO(sender, mode), udpio.DatagramIO(receiver, mode)
+    # Datagrams of the same size in parts, then a shorter one that ends the run in OFFLOAD mode, then a single part
+    datagrams = [(bytes([i]) * 24, memoryview(bytes([i]) * 1000)) for i in range(100)]
+    datagrams += [(b"short",), (b"x" * 1500,)]
+    assert sender_io.send(datagrams, receiver.getsockname()) == len(datagrams)
+    assert sender_io.sent == len(datagrams)
+    received = receive_all(receiver_io, len(datagrams))
+    assert [data for data, _ in received] == [b"".join(datagram) for datagram in datagrams]
+    assert {address for _, address in received} == {sender.getsockname()}
+    assert receiver_io.received == len(datagrams)
+    assert receiver_io.received_bytes == sum(len(data) for data, _ in received)
+
+
+def test_unsupported_mode_falls_back(sockets):
+    sender, _ = sockets
+    assert udpio.DatagramIO(sender, "unknown").mode == udpio.supported_modes(sender)[0]
+    assert udpio.supported_modes(sender)[-1] == udpio.PLAIN
+
+
+def test_receive_nothing(sockets):
+    _, receiver = sockets
+    io = udpio.DatagramIO(receiver)
+    assert io.receive(10, 2048) == []
+    assert io.receive(10, 2048, timeout=0.01) == []
+
+
+def test_source_cache_is_bounded(sockets, monkeypatch):
+    _, receiver = sockets
+    if udpio.MMSG not in udpio.supported_modes(receiver):
+        pytest.skip(f"{udpio.MMSG} is not supported here")
+    monkeypatch.setattr(udpio, "MAX_SOURCES", 4)
+    io = udpio.DatagramIO(receiver, udpio.MMSG)
+    senders = [socket.socket(socket.AF_INET, socket.SOCK_DGRAM) for _ in range(10)]
+    for i, sender in enumerate(senders):
+        with sender:
+            sender.bind((LOCALHOST, 0))
+            sender.sendto(bytes([i]), receiver.getsockname())
+            assert receive_all(io, 1) == [(bytes([i]), sender.getsockname())]
+            assert len(io._DatagramIO__sources) <= udpio.MAX_SOURCES
@@ -0,0 +1,61 @@
+import pytest
+
+import utils
+
+
+def test_sack_blocks_round_trip():
+    blocks = [(100 + 20 * i, 110 + 20 * i) for i in range(utils.MAX_SACK_BLOCKS + 2)]
+    segment = utils.pack_header(ack_number=50, ack=True, sack_blocks=blocks)
+    assert utils.unpack_sack(segment) == blocks[:utils.MAX_SACK_BLOCKS]
+    assert utils.unpack_header(segment)[1] == 50
+
+
+def test_no_sack_blocks():
+    assert utils.unpack_sack(utils.pack_header(ack=True, data=b"not blocks")) == []
+
+
+@pytest.mark.parametrize("full", [0, 5, utils.SEQ_SPACE - 1, utils.SEQ_SPACE, 3 * utils.SEQ_SPACE + 7])
+@pytest.mark.parametrize("distance", [0, 1000, -1000])
+def test_unwrap_seq(full, distance):
+    reference = max(full + distance, 0)
+    assert utils.unwrap_seq(full % utils.SEQ_SPACE, reference) == full
+
+
+def test_window_scale():
+    assert utils.window_scale(utils.MAX_WINDOW) == 0
+    assert utils.window_scale(utils.MAX_WINDOW + 1) == 1
+    assert utils.window_scale(8 << 20) == 8
+    assert (8 << 20) >> 8 <= utils.MAX_WINDOW
+    assert utils.window_scale(1 << 40) == utils.MAX_WINDOW_SCALE
+
+
+def test_connection_id():
+    segment = utils.pack_header(sequence_number=1, connection_id=0xDEADBEEF, data=b"data")
+    assert utils.connection_id(segment) == 0xDEADBEEF
+    assert utils.connection_id(segment[:utils.HEADER_SIZE - 1]) is None
+    assert utils.connection_id(bytes([utils.HEADER_VERSION - 1]) + segment[1:]) is None  # an older header
+
+
+def test_is_connect_request():
+    assert utils.is_connect_request(utils.pack_header(syn=True, connection_id=7))
+    assert not utils.is_connect_request(utils.pack_header(syn=True, ack=True, connection_id=7))
+    assert not utils.is_connect_request(utils.pack_header(ack=True, connection_id=7))
+    assert not utils.is_connect_request(b"\x03\x02")
+
+
+def test_stamp():
+    header = utils.pack_header(sequence_number=5, timestamp_echo=42, data=b"data")
+    stamped = utils.stamp(header, 1234)
+    assert utils.unpack_timestamps(stamped) == (1234, 42)
+    assert stamped[:utils.TIMESTAMP_OFFSET] == header[:utils.TIMESTAMP_OFFSET]
+    assert stamped[utils.TIMESTAMP_OFFSET + 4:] == header[utils.TIMESTAMP_OFFSET + 4:]
+
+
+def test_timestamps_wrap_around(monkeypatch):
+    now = (utils.TIMESTAMP_SPACE - 1) * utils.TIMESTAMP_UNIT  # the timestamp is about to wrap around
+    monkeypatch.setattr(utils.time, "monotonic", lambda: now)
+    sent = utils.current_timestamp()
+    assert sent != 0  # 0 means no timestamp
+    now += 0.25
+    assert utils.current_timestamp() < sent
+    assert utils.timestamp_age(sent) == pytest.approx(0.25, abs=2 * utils.TIMESTAMP_UNIT)
@@ -0,0 +1,84 @@
+import time
+import typing
+
+TICK = 0.005  # seconds
+SLOTS = 512
+
+
+class Timer:
+    __slots__ = ("deadline", "callback", "cancelled")
+
+    def __init__(self, deadline: int, callback: typing.Callable[[], None]):
+        self.deadline = deadline  # tick at which the timer fires
+        self.callback = callback
+        self.cancelled = False
+
+    def cancel(self):
+        self.cancelled = True
+
+
+class TimerWheel:
+    """
+    Hashed timing wheel. Scheduling and cancelling are O(1), and timers fire on the first advance after their
+    deadline, rounded up to the next tick. Timers further away than a revolution of the wheel stay in their slot
+    until the revolution of their deadline.
+    """
+
+    def __init__(self, tick: float = TICK, slots: int = SLOTS):
+        self.tick = tick
+        self.__slots = [[] for _ in range(slots)]
+        self.__current = self.__to_tick(time.monotonic())  # last tick whose timers were fired
+        self.__count = 0
+
+    def __len__(self):
+        return self.__count
+
+    def __to_tick(self, when: float) -> int:
+        return int(when / self.tick)
+
+    def schedule(self, delay: float, callback: typing.Callable[[], None]) -> Timer:
+        """
+        Calls callback once delay seconds have passed.
+        :return: the timer, which can be cancelled
+        """
+        deadline = max(self.__to_tick(time.monotonic() + delay) + 1, self.__current + 1)
+        timer = Timer(deadline, callback)
+        self.__slots[deadline % len(self.__slots)].append(timer)
+        self.__count += 1
+        return timer
+
+    def advance(self):
+        """
+        Fires every timer whose deadline passed.
+        """
+        target = self.__to_tick(time.monotonic())
+        if not self.__count:
+            self.__current = max(self.__current, target)
+            return
+        slots = self.__slots
+        while self.__current < target:
+            self.__current += 1
+            slot = slots[self.__current % len(slots)]
+            if not slot:
+                continue
+            due = [timer for timer in slot if timer.deadline <= self.__current]
+            if not due:
+                continue
+            slot[:] = [timer for timer in slot if timer.deadline > self.__current]
+            for timer in due:
+                self.__count -= 1
+                if not timer.cancelled:
+                    timer.callback()
+
+    def next_timeout(self) -> typing.Optional[float]:
+        """
+        :return: seconds until the next timer may be due, None if there are no timers
+        """
+        if not self.__count:
+            return None
+        slots = self.__slots
+        for offset in range(1, len(slots) + 1):
+            tick = self.__current + offset
+            if any(timer.deadline <= tick for timer in slots[tick % len(slots)]):
+                return max(0.0, tick * self.tick - time.monotonic())
+        return len(slots) * self.tick
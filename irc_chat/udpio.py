@@ -0,0 +1,296 @@
+import ctypes
+import errno
+import os
+import select
+import socket
+import struct
+import typing
+
+import outbound
+
+# Batching modes, from the fewest syscalls per datagram to the most portable
+OFFLOAD = "offload"  # segmentation offload: UDP_SEGMENT (GSO) to send, UDP_GRO to receive, Linux 5.0
+MMSG = "mmsg"  # recvmmsg through ctypes, Linux, datagrams are sent like in PLAIN mode
+PLAIN = "plain"  # a sendmsg or recvfrom per datagram
+MODES = (OFFLOAD, MMSG, PLAIN)
+
+SOL_UDP = getattr(socket, "SOL_UDP", 17)
+UDP_SEGMENT = getattr(socket, "UDP_SEGMENT", 103)
+UDP_GRO = getattr(socket, "UDP_GRO", 104)
+GSO_SIZE_FORMAT = "=H"
+GRO_SIZE_FORMAT = "=i"
+MAX_GSO_SEGMENTS = 64  # UDP_MAX_SEGMENTS of the kernel
+MAX_UDP_PAYLOAD = 65507
+BATCH_SIZE = 64  # datagrams per recvmmsg
+MAX_SOURCES = 256  # decoded source addresses kept, the cache starts over once full so spoofed sources cannot grow it
+# Errors reported by ICMP for an earlier datagram, the datagram is lost like any other
+ICMP_ERRORS = (errno.ECONNREFUSED, errno.EHOSTUNREACH, errno.ENETUNREACH, errno.EMSGSIZE)
+
+Address = typing.Tuple[str, int]
+Datagram = typing.Sequence[typing.Union[bytes, memoryview]]  # the parts of a datagram, sent one after the other
+
+
+class _IOVec(ctypes.Structure):
+    _fields_ = [("base", ctypes.c_void_p), ("len", ctypes.c_size_t)]
+
+
+class _MsgHdr(ctypes.Structure):
+    _fields_ = [("name", ctypes.c_void_p), ("namelen", ctypes.c_uint32), ("iov", ctypes.POINTER(_IOVec)),
+                ("iovlen", ctypes.c_size_t), ("control", ctypes.c_void_p), ("controllen", ctypes.c_size_t),
+                ("flags", ctypes.c_int)]
+
+
+class _MMsgHdr(ctypes.Structure):
+    _fields_ = [("hdr", _MsgHdr), ("len", ctypes.c_uint)]
+
+
+class _Batch:
+    """
+    The messages of a recvmmsg, each with a single iovec to its own slot of a preallocated arena.
+    Datagrams are copied from the arena, which costs far less than preparing the messages for every call.
+    """
+
+    def __init__(self, slot_size: int):
+        self.slot_size = slot_size
+        self.arena = bytearray(slot_size * BATCH_SIZE)
+        self.view = memoryview(self.arena)
+        arena_address = ctypes.addressof(ctypes.c_char.from_buffer(self.arena))
+        self.messages = (_MMsgHdr * BATCH_SIZE)()
+        self.vectors = (_IOVec * BATCH_SIZE)()
+        self.names = ctypes.create_string_buffer(_SOCKADDR_SIZE * BATCH_SIZE)
+        self.names_view = memoryview(self.names).cast("B")
+        for i in range(BATCH_SIZE):
+            self.vectors[i].base = arena_address + i * slot_size
+            self.vectors[i].len = slot_size
+            header = self.messages[i].hdr
+            header.name = ctypes.addressof(self.names) + i * _SOCKADDR_SIZE
+            header.namelen = _SOCKADDR_SIZE
+            header.iov = ctypes.pointer(self.vectors[i])
+            header.iovlen = 1
+        # The fields set and read on every call, as 32 bit words: msg_namelen and msg_len of the messages
+        self.message_words = memoryview(self.messages).cast("B").cast("I")
+
+
+def _load_recvmmsg():
+    try:
+        recvmmsg = ctypes.CDLL(None, use_errno=True).recvmmsg
+    except (OSError, AttributeError):
+        return None
+    recvmmsg.argtypes = [ctypes.c_int, ctypes.POINTER(_MMsgHdr), ctypes.c_uint, ctypes.c_int, ctypes.c_void_p]
+    recvmmsg.restype = ctypes.c_int
+    return recvmmsg
+
+
+_recvmmsg = _load_recvmmsg()
+_SOCKADDR_SIZE = 16  # sockaddr_in
+_MESSAGE_WORDS = ctypes.sizeof(_MMsgHdr) // 4
+_NAMELEN_WORD = _MsgHdr.namelen.offset // 4
+_MSG_LEN_WORD = _MMsgHdr.len.offset // 4
+
+
+def supported_modes(sock: socket.socket) -> typing.List[str]:
+    """
+    :return: the modes the socket can use, best first
+    """
+    modes = []
+    if sock.family == socket.AF_INET:
+        try:
+            sock.getsockopt(SOL_UDP, UDP_SEGMENT)
+            sock.getsockopt(SOL_UDP, UDP_GRO)
+            modes.append(OFFLOAD)
+        except OSError:
+            pass
+        if _recvmmsg is not None:
+            modes.append(MMSG)
+    modes.append(PLAIN)
+    return modes
+
+
+def _decode_address(name: bytes) -> Address:
+    return socket.inet_ntoa(name[4:8]), struct.unpack_from("!H", name, 2)[0]
+
+
+class DatagramIO:
+    """
+    Sends and receives the datagrams of a UDP socket in batches, with as few syscalls as the mode allows.
+    In OFFLOAD mode, runs of datagrams of the same size are sent with a single sendmsg, which the kernel splits
+    into datagrams as late as possible, and the datagrams the kernel coalesced are split again on receive.
+    In MMSG mode a single recvmmsg receives BATCH_SIZE datagrams. Datagrams are sent a sendmsg each, with an iovec
+    per part, so the data sent from a memory map is not copied: sendmmsg would need the parts copied to an arena,
+    since ctypes cannot take the address of a read-only buffer cheaply, which costs more than the syscalls it saves.
+    A mode the kernel turns out not to support falls back to the next one.
+
+    Counts the syscalls and the datagrams, to tell how well batching works.
+    """
+
+    def __init__(self, sock: socket.socket, mode: str = None):
+        """
+        :param mode: one of MODES, the best mode the socket supports if None
+        """
+        self.socket = sock
+        modes = supported_modes(sock)
+        self.mode = mode if mode in modes else modes[0]
+        self.send_calls = 0
+        self.sent = 0
+        self.sent_bytes = 0
+        self.receive_calls = 0
+        self.received = 0
+        self.received_bytes = 0
+        self.__receive_batch = None  # for recvmmsg
+        self.__sources = {}  # sockaddr: address, of the datagrams received by recvmmsg, at most MAX_SOURCES
+        if self.mode == OFFLOAD:
+            sock.setsockopt(SOL_UDP, UDP_GRO, 1)
+
+    def datagrams_per_send(self) -> float:
+        return self.sent / self.send_calls if self.send_calls else 0.0
+
+    def datagrams_per_receive(self) -> float:
+        return self.received / self.receive_calls if self.receive_calls else 0.0
+
+    def send(self, datagrams: typing.Sequence[Datagram], address: Address) -> int:
+        """
+        Sends datagrams in order, until the socket would block.
+        :return: the number of datagrams sent, the others were not
+        """
+        if not datagrams:
+            return 0
+        if self.mode == OFFLOAD:
+            return self.__send_offload(datagrams, address)
+        return self.__send_plain(datagrams, address)
+
+    def __send_plain(self, datagrams: typing.Sequence[Datagram], address: Address) -> int:
+        sent = 0
+        for datagram in datagrams:
+            try:
+                self.send_calls += 1
+                self.sent_bytes += self.socket.sendmsg(datagram, (), 0, address)
+            except (BlockingIOError, InterruptedError):
+                break
+            sent += 1
+        self.sent += sent
+        return sent
+
+    def __send_offload(self, datagrams: typing.Sequence[Datagram], address: Address) -> int:
+        sent = 0
+        while sent < len(datagrams):
+            # A run of datagrams of the same size, only the last one may be shorter
+            size = sum(map(len, datagrams[sent]))
+            end = sent + 1
+            parts = 0
+            while end < len(datagrams) and end - sent < MAX_GSO_SEGMENTS and (end - sent + 1) * size <= MAX_UDP_PAYLOAD:
+                length = sum(map(len, datagrams[end]))
+                if length > size or parts + len(datagrams[end]) > outbound.IOV_MAX:
+                    break
+                parts += len(datagrams[end])
+                end += 1
+                if length < size:
+                    break
+            ancillary = [(SOL_UDP, UDP_SEGMENT, struct.pack(GSO_SIZE_FORMAT, size))] if end - sent > 1 else []
+            buffers = [part for datagram in datagrams[sent:end] for part in datagram]
+            try:
+                self.send_calls += 1
+                self.sent_bytes += self.socket.sendmsg(buffers, ancillary, 0, address)
+            except (BlockingIOError, InterruptedError):
+                break
+            except OSError as e:
+                if not ancillary:
+                    raise
+                # e.g. EIO from a device without segmentation offload, or EINVAL for segments beyond its MTU
+                self.mode = MMSG if _recvmmsg is not None else PLAIN
+                return sent + self.send(datagrams[sent:], address)
+            self.sent += end - sent
+            sent = end
+        return sent
+
+    def receive(self, max_datagrams: int, size: int, timeout: typing.Optional[float] = 0.0) \
+            -> typing.List[typing.Tuple[bytes, Address]]:
+        """
+        Receives the datagrams that arrived, at least max_datagrams of them if that many arrived.
+        :param size: largest datagram expected
+        :param timeout: seconds to wait for the first datagram, None to wait forever
+        :return: the datagrams and their sources, empty if none arrived
+        """
+        if timeout != 0.0 and not select.select([self.socket], [], [], timeout)[0]:
+            return []
+        if self.mode == OFFLOAD:
+            return self.__receive_offload(max_datagrams)
+        if self.mode == MMSG:
+            return self.__receive_mmsg(max_datagrams, size)
+        return self.__receive_plain(max_datagrams, size)
+
+    def __receive_plain(self, max_datagrams: int, size: int) -> typing.List[typing.Tuple[bytes, Address]]:
+        datagrams = []
+        while len(datagrams) < max_datagrams:
+            try:
+                self.receive_calls += 1
+                datagrams.append(self.socket.recvfrom(size, socket.MSG_DONTWAIT))
+            except (BlockingIOError, InterruptedError):
+                break
+            except OSError as e:
+                if e.errno not in ICMP_ERRORS:
+                    raise
+        self.received += len(datagrams)
+        self.received_bytes += sum(len(datagram) for datagram, _ in datagrams)
+        return datagrams
+
+    def __receive_offload(self, max_datagrams: int) -> typing.List[typing.Tuple[bytes, Address]]:
+        datagrams = []
+        ancillary_size = socket.CMSG_SPACE(struct.calcsize(GRO_SIZE_FORMAT))
+        while len(datagrams) < max_datagrams:
+            try:
+                self.receive_calls += 1
+                data, ancillary, _, address = self.socket.recvmsg(MAX_UDP_PAYLOAD, ancillary_size,
+                                                                  socket.MSG_DONTWAIT)
+            except (BlockingIOError, InterruptedError):
+                break
+            except OSError as e:
+                if e.errno not in ICMP_ERRORS:
+                    raise
+                continue
+            self.received_bytes += len(data)
+            segment_size = len(data)
+            for level, kind, value in ancillary:
+                if level == SOL_UDP and kind == UDP_GRO:
+                    segment_size = struct.unpack(GRO_SIZE_FORMAT, value[:struct.calcsize(GRO_SIZE_FORMAT)])[0]
+            if segment_size >= len(data):
+                datagrams.append((data, address))
+            else:  # datagrams coalesced by the kernel
+                datagrams.extend((data[offset:offset + segment_size], address)
+                                 for offset in range(0, len(data), segment_size))
+        self.received += len(datagrams)
+        return datagrams
+
+    def __receive_mmsg(self, max_datagrams: int, size: int) -> typing.List[typing.Tuple[bytes, Address]]:
+        batch = self.__receive_batch
+        if batch is None or batch.slot_size < size:
+            batch = self.__receive_batch = _Batch(size)
+        arena, words, names, slot_size = batch.view, batch.message_words, batch.names_view, batch.slot_size
+        sources = self.__sources
+        datagrams = []
+        while len(datagrams) < max_datagrams:
+            count = min(BATCH_SIZE, max_datagrams - len(datagrams))
+            for i in range(count):
+                words[i * _MESSAGE_WORDS + _NAMELEN_WORD] = _SOCKADDR_SIZE
+            self.receive_calls += 1
+            result = _recvmmsg(self.socket.fileno(), batch.messages, count, socket.MSG_DONTWAIT, None)
+            if result < 0:
+                error = ctypes.get_errno()
+                if error in (errno.EAGAIN, errno.EWOULDBLOCK, errno.EINTR):
+                    break
+                if error in ICMP_ERRORS:
+                    continue
+                raise OSError(error, "recvmmsg: " + os.strerror(error))
+            for i in range(result):
+                length = words[i * _MESSAGE_WORDS + _MSG_LEN_WORD]
+                name = names[i * _SOCKADDR_SIZE:(i + 1) * _SOCKADDR_SIZE].tobytes()
+                source = sources.get(name)
+                if source is None:
+                    if len(sources) >= MAX_SOURCES:
+                        sources.clear()
+                    source = sources[name] = _decode_address(name)
+                datagrams.append((arena[i * slot_size:i * slot_size + length].tobytes(), source))
+                self.received_bytes += length
+            if result < count:
+                break
+        self.received += len(datagrams)
+        return datagrams
@@ -1,25 +1,192 @@
 import enum
 import math
+import random
+import socket
 import struct
+import time
 import typing
 
-HEADER_FORMAT = '!IIHH'
+HEADER_VERSION = 3
+# version, flags, connection ID, sequence number, ack number, receive window, timestamp, timestamp echo
+HEADER_FORMAT = '!BBIIIHII'
 HEADER_SIZE = struct.calcsize(HEADER_FORMAT)
+# https://datatracker.ietf.org/doc/html/rfc7323#section-3 - every segment carries the time it was sent, and the
+# timestamp of the segment it acknowledges, so every ACK measures the RTT, even the ACK of a retransmission.
+# Timestamps are microseconds of the clock of the endpoint that sent them, they wrap around, and 0 means none
+TIMESTAMP_FORMAT = '!II'
+TIMESTAMP_OFFSET = HEADER_SIZE - struct.calcsize(TIMESTAMP_FORMAT)
+TIMESTAMP_SPACE = 1 << 32
+TIMESTAMP_UNIT = 1e-6  # seconds
+# The transfers of an endpoint share its UDP socket, the connection ID routes a segment to its transfer
+CONNECTION_ID_FORMAT = '!I'
+CONNECTION_ID_OFFSET = 2
+# Sequence numbers wrap around on the wire, the endpoints count them without bounds, see unwrap_seq
+SEQ_SPACE = 1 << 32
+# https://datatracker.ietf.org/doc/html/rfc7323#section-2 - the receive window is shifted right by the scale
+# announced by the receiver in the SYN-ACK, if the sender offered window scaling in its SYN
+MAX_WINDOW = 0xFFFF
+MAX_WINDOW_SCALE = 14
+# https://datatracker.ietf.org/doc/html/rfc2018 - the data of an ACK with the SACK flag is a list of blocks
+SACK_FLAG = 1 << 4
+SACK_BLOCK_FORMAT = '!II'  # first sequence number of the block, sequence number following the block
+SACK_BLOCK_SIZE = struct.calcsize(SACK_BLOCK_FORMAT)
+MAX_SACK_BLOCKS = 8
+# https://datatracker.ietf.org/doc/html/rfc8899 - a probe is padded to the datagram size it probes, which its ACK
+# echoes in the sequence number
+PROBE_FLAG = 1 << 3
+UDP_IP_OVERHEAD = 28  # bytes of the IPv4 and UDP headers
+MAX_DATAGRAM_SIZE = 65535 - UDP_IP_OVERHEAD
+MAX_MSS = MAX_DATAGRAM_SIZE - HEADER_SIZE
+DEFAULT_MTU = 1500  # assumed when the MTU of the route is unknown
+IP_MTU_DISCOVER = getattr(socket, 'IP_MTU_DISCOVER', 10)
+IP_PMTUDISC_PROBE = getattr(socket, 'IP_PMTUDISC_PROBE', 3)  # set DF, ignore the path MTU cached by the kernel
+IP_MTU = getattr(socket, 'IP_MTU', 14)
 
 
 def pack_header(sequence_number: int = 0, ack_number: int = 0, ack=False, syn=False, fin=False,
-                receive_window: int = 0, data: bytes = None) -> bytes:
+                receive_window: int = 0, data: bytes = None,
+                sack_blocks: typing.List[typing.Tuple[int, int]] = None, window_scale: int = 0,
+                probe=False, connection_id: int = 0, timestamp: int = 0, timestamp_echo: int = 0) -> bytes:
+    """
+    :param receive_window: free bytes in the buffer of the receiver, before scaling
+    :param window_scale: scale announced by the receiver, 0 in SYN segments
+    :param probe: whether the segment is a path MTU probe, or its ACK
+    :param connection_id: the transfer the segment belongs to
+    :param timestamp: see current_timestamp, 0 if the segment is stamped when it is sent, see stamp
+    :param timestamp_echo: timestamp of the segment an ACK acknowledges
+    """
     flags = to_ASF(ack, syn, fin)
-    header = struct.pack(HEADER_FORMAT, sequence_number, ack_number, flags, receive_window)
+    if probe:
+        flags |= PROBE_FLAG
+    if sack_blocks:
+        flags |= SACK_FLAG
+        data = b''.join(struct.pack(SACK_BLOCK_FORMAT, start % SEQ_SPACE, end % SEQ_SPACE)
+                        for start, end in sack_blocks[:MAX_SACK_BLOCKS])
+    header = struct.pack(HEADER_FORMAT, HEADER_VERSION, flags, connection_id, sequence_number % SEQ_SPACE,
+                         ack_number % SEQ_SPACE, min(max(receive_window, 0) >> window_scale, MAX_WINDOW),
+                         timestamp, timestamp_echo)
     return header if data is None else header + data
 
 
 def unpack_header(data: bytes) -> typing.Tuple[int, int, bool, bool, bool, int, bytes]:
-    sequence_number, ack_number, flags, receive_window = struct.unpack(HEADER_FORMAT, data[:HEADER_SIZE])
+    """
+    :return: the sequence numbers as sent, see unwrap_seq, and the receive window before scaling
+    :raises ValueError: if the segment was sent with another version of the header
+    """
+    version, flags, _, sequence_number, ack_number, receive_window, _, _ = struct.unpack(HEADER_FORMAT,
+                                                                                         data[:HEADER_SIZE])
+    if version != HEADER_VERSION:
+        raise ValueError(f'Unsupported header version {version}')
     ack, syn, fin = from_ASF(flags)
     return sequence_number, ack_number, ack, syn, fin, receive_window, data[HEADER_SIZE:]
 
 
+def unwrap_seq(seq: int, reference: int) -> int:
+    """
+    Sequence numbers are sent modulo SEQ_SPACE, this restores the full sequence number closest to a sequence number
+    of the same transfer, so that files larger than the sequence space can be transferred.
+    :param seq: the sequence number as sent
+    :param reference: a full sequence number less than SEQ_SPACE / 2 away, usually the next expected one
+    """
+    return reference + (seq - reference + SEQ_SPACE // 2) % SEQ_SPACE - SEQ_SPACE // 2
+
+
+def window_scale(buffer_capacity: int) -> int:
+    """
+    :return: the smallest scale that fits a receive window of buffer_capacity bytes in the header
+    """
+    scale = 0
+    while buffer_capacity >> scale > MAX_WINDOW and scale < MAX_WINDOW_SCALE:
+        scale += 1
+    return scale
+
+
+def unpack_sack(data: bytes) -> typing.List[typing.Tuple[int, int]]:
+    """
+    :param data: a whole segment
+    :return: the SACK blocks of the segment as sent, empty if it has none
+    """
+    _, flags, _, _, _, _, _, _ = struct.unpack_from(HEADER_FORMAT, data)
+    if not flags & SACK_FLAG:
+        return []
+    return [struct.unpack_from(SACK_BLOCK_FORMAT, data, offset)
+            for offset in range(HEADER_SIZE, len(data) - SACK_BLOCK_SIZE + 1, SACK_BLOCK_SIZE)]
+
+
+def current_timestamp() -> int:
+    """
+    :return: the timestamp of a segment sent now, never 0
+    """
+    return int(time.monotonic() / TIMESTAMP_UNIT) % (TIMESTAMP_SPACE - 1) + 1
+
+
+def timestamp_age(timestamp: int) -> float:
+    """
+    :param timestamp: a timestamp of this endpoint, echoed by the other one
+    :return: seconds since the segment of the timestamp was sent
+    """
+    return (current_timestamp() - timestamp) % (TIMESTAMP_SPACE - 1) * TIMESTAMP_UNIT
+
+
+def stamp(header: bytes, timestamp: int) -> bytes:
+    """
+    :param header: a header packed in advance, possibly followed by data
+    :return: the header with the time it is sent at
+    """
+    return header[:TIMESTAMP_OFFSET] + struct.pack('!I', timestamp) + header[TIMESTAMP_OFFSET + 4:]
+
+
+def unpack_timestamps(data: bytes) -> typing.Tuple[int, int]:
+    """
+    :param data: a whole segment
+    :return: the timestamp of the segment and the timestamp it echoes, 0 for none
+    """
+    return struct.unpack_from(TIMESTAMP_FORMAT, data, TIMESTAMP_OFFSET)
+
+
+def is_probe(data: bytes) -> bool:
+    """
+    :param data: a whole segment
+    """
+    return len(data) >= HEADER_SIZE and bool(data[1] & PROBE_FLAG)
+
+
+def connection_id(data: bytes) -> typing.Optional[int]:
+    """
+    :param data: a whole segment
+    :return: the connection ID of the segment, None if it was sent with another version of the header
+    """
+    if len(data) < HEADER_SIZE or data[0] != HEADER_VERSION:
+        return None
+    return struct.unpack_from(CONNECTION_ID_FORMAT, data, CONNECTION_ID_OFFSET)[0]
+
+
+def new_connection_id() -> int:
+    return random.getrandbits(32)
+
+
+def is_connect_request(data: bytes) -> bool:
+    """
+    :param data: a whole segment
+    :return: whether the segment is a SYN without ACK, which a receiver sends to ask the sender to start the transfer
+    """
+    return len(data) >= HEADER_SIZE and data[1] & to_ASF(ack=True, syn=True) == to_ASF(syn=True)
+
+
+def path_mss(address: typing.Tuple[str, int]) -> int:
+    """
+    :return: the largest MSS the interface of the route to address sends without fragmentation, routers further on
+    may allow less
+    """
+    try:
+        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+            sock.connect(address)
+            mtu = sock.getsockopt(socket.IPPROTO_IP, IP_MTU)
+    except OSError:
+        mtu = DEFAULT_MTU
+    return min(mtu - UDP_IP_OVERHEAD, MAX_DATAGRAM_SIZE) - HEADER_SIZE
+
+
 def to_ASF(ack=False, syn=False, fin=False) -> int:
     return (bool(ack) << 7) | (bool(syn) << 6) | (bool(fin) << 5)
 
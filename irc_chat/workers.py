@@ -0,0 +1,194 @@
+import os
+import select
+import shutil
+import signal
+import socket
+import sys
+import tempfile
+import traceback
+import typing
+
+import outbound
+import relay
+
+# A stalled worker is disconnected rather than growing the hub without bounds. Its messages are not dropped instead,
+# the worker would wait for a dropped RESULT until its request times out
+HUB_HIGH_WATERMARK = 64 * 1024 * 1024
+HUB_LOW_WATERMARK = 16 * 1024 * 1024
+
+
+class WorkerBus(relay.RequestLink):
+    """
+    Connection of a worker process to the hub in the parent process.
+    Nickname registration is answered by the hub, so nick collisions are checked across all workers.
+    """
+
+    def __init__(self, path: str):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.connect(path)
+        super().__init__(sock)
+
+    def claim_nick(self, nick: bytes, old_nick: bytes = b"") -> bool:
+        return self.request(relay.CLAIM, nick, old_nick)[0] == relay.OK
+
+    def release_nick(self, nick: bytes):
+        self.send(relay.RELEASE, nick)
+
+    def has_nick(self, nick: bytes) -> bool:
+        return self.request(relay.LOOKUP, nick)[0] == relay.OK
+
+    def list_nicks(self) -> typing.List[bytes]:
+        return self.request(relay.LIST)
+
+    def broadcast(self, message: bytes):
+        self.send(relay.BROADCAST, message)
+
+    def private(self, nick: bytes, message: bytes):
+        self.send(relay.PRIVATE, nick, message)
+
+    def channel(self, channel: bytes, message: bytes):
+        self.send(relay.CHANNEL, channel, message)
+
+
+class Hub:
+    """
+    Relays messages between worker processes and owns the nickname registry.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.__listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.__listener.bind(path)
+        self.__listener.listen(socket.SOMAXCONN)
+        self.__links: dict[socket.socket, relay.RelayConnection] = {}
+        self.__queues: dict[socket.socket, outbound.OutboundQueue] = {}
+        self.__pending_writes: set[socket.socket] = set()
+        self.__nick2link: dict[bytes, socket.socket] = {}
+
+    def close(self):
+        self.__listener.close()
+
+    def run(self, children: typing.List[int]):
+        """
+        Relays messages until every child process has exited.
+        :param children: process ids of the workers
+        """
+        children = set(children)
+        while children:
+            readable, writable, _ = select.select([self.__listener, *self.__links], self.__pending_writes, [], 1)
+            for sock in writable:
+                self.__flush(sock)
+            for sock in readable:
+                if sock is self.__listener:
+                    self.__accept()
+                else:
+                    self.__handle(sock)
+            for sock, link in list(self.__links.items()):
+                data = link.take_batch()
+                if data:
+                    try:
+                        self.__queues[sock].push(data)
+                    except outbound.SlowConsumerError:
+                        self.__remove(sock)
+                        continue
+                    self.__flush(sock)
+            for pid in list(children):
+                if os.waitpid(pid, os.WNOHANG)[0]:
+                    children.discard(pid)
+
+    def __accept(self):
+        sock, _ = self.__listener.accept()
+        sock.setblocking(False)
+        self.__links[sock] = relay.RelayConnection(sock)
+        self.__queues[sock] = outbound.OutboundQueue(HUB_HIGH_WATERMARK, HUB_LOW_WATERMARK, outbound.DISCONNECT)
+
+    def __flush(self, sock: socket.socket):
+        queue = self.__queues.get(sock)
+        try:
+            if queue is None or queue.flush(sock):
+                self.__pending_writes.discard(sock)
+            else:
+                self.__pending_writes.add(sock)
+        except OSError:
+            self.__remove(sock)
+
+    def __remove(self, sock: socket.socket):
+        link = self.__links.pop(sock, None)
+        if link is None:
+            return
+        link.close()
+        self.__queues.pop(sock, None)
+        self.__pending_writes.discard(sock)
+        for nick in [nick for nick, owner in self.__nick2link.items() if owner is sock]:
+            del self.__nick2link[nick]
+
+    def __handle(self, sock: socket.socket):
+        link = self.__links[sock]
+        try:
+            messages = link.receive()
+        except (ConnectionError, OSError):
+            self.__remove(sock)
+            return
+        for op, fields in messages:
+            if op == relay.CLAIM:
+                nick, old_nick = fields
+                if self.__nick2link.setdefault(nick, sock) is not sock:
+                    link.send(relay.RESULT, b"0")
+                    continue
+                if old_nick and self.__nick2link.get(old_nick) is sock:
+                    del self.__nick2link[old_nick]
+                link.send(relay.RESULT, relay.OK)
+            elif op == relay.RELEASE:
+                if self.__nick2link.get(fields[0]) is sock:
+                    del self.__nick2link[fields[0]]
+            elif op == relay.LOOKUP:
+                link.send(relay.RESULT, relay.OK if fields[0] in self.__nick2link else b"0")
+            elif op == relay.LIST:
+                link.send(relay.RESULT, *self.__nick2link)
+            elif op == relay.BROADCAST or op == relay.CHANNEL:
+                frame = relay.pack(op, *fields)
+                for other, other_link in self.__links.items():
+                    if other is not sock:
+                        other_link.send_frame(frame)
+            elif op == relay.PRIVATE:
+                target = self.__nick2link.get(fields[0])
+                if target is not None and target is not sock:
+                    self.__links[target].send(op, *fields)
+
+
+def serve(workers: int, make_server: typing.Callable[[WorkerBus], typing.Any],
+          run_server: typing.Callable[[typing.Any], None]):
+    """
+    Forks worker processes sharing the listening port and relays between them until they exit.
+    :param workers: number of worker processes
+    :param make_server: creates the server of a worker, given its bus to the hub
+    :param run_server: runs the server of a worker
+    """
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))  # still terminates the workers below
+    directory = tempfile.mkdtemp(prefix="proto-chat-")
+    hub = Hub(os.path.join(directory, "bus.sock"))
+    children = []
+    try:
+        for _ in range(workers):
+            pid = os.fork()
+            if pid == 0:
+                signal.signal(signal.SIGTERM, signal.SIG_DFL)
+                hub.close()
+                try:
+                    run_server(make_server(WorkerBus(hub.path)))
+                except (KeyboardInterrupt, SystemExit):
+                    pass
+                except Exception:
+                    traceback.print_exc()
+                sys.stdout.flush()
+                os._exit(0)
+            children.append(pid)
+        hub.run(children)
+    finally:
+        for pid in children:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+        hub.close()
+        shutil.rmtree(directory, ignore_errors=True)